@@ -1,28 +1,289 @@
-import os
+import asyncio
+import functools
 import chainlit as cl
-from langchain_community.llms import Ollama 
-from gradio_client import Client, file
-from prompts.prompt_generator import generate_prompt
-from memory import ShortTermMemory, ChatMemory
-from config import *  # 导入所有配置项
-from prompts.prompts_template import prompt_template_str
+from contextlib import aclosing
+from typing import Optional
+from memory import ShortTermMemory, ResponseCache, create_embedding_provider
+from memory import FactStore, FactExtractor, format_facts, MemoryServiceClient
+from memory import EmbeddingModelMismatch, MemoryServiceError
+from persona import PersonaRegistry
+from llm import OllamaRouter, LLMScheduler, SchedulerTimeout
+from llm import ReasoningMetrics, ReasoningPolicy, TokenCoalescer, TurnStats, stream_with_reasoning
+from speech import atext_to_speech, WhisperTranscriber
+from config import (
+    ASR_DEVICE, ASR_LANGUAGE, ASR_MODEL_NAME, ASR_THREADS_PER_WORKER, ASR_WORKERS, AUDIO_SAMPLE_RATE,
+    CHAT_MEMORY_CACHE_LIMIT_MB, CHAT_MEMORY_DIR, CHAT_MEMORY_HNSW, DEFAULT_PERSONA,
+    EMBEDDING_BACKEND, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WAIT_MS, EMBEDDING_DOCUMENT_PREFIX,
+    EMBEDDING_MAX_LENGTH, EMBEDDING_MODEL_DIR, EMBEDDING_POOLING, EMBEDDING_QUANTIZE,
+    EMBEDDING_QUERY_PREFIX, EMBEDDING_THREADS, EMBEDDING_VERSION,
+    FACTS_DB_PATH, FACTS_ENABLED, FACTS_EXTRACT_SUFFIX, FACTS_EXTRACT_TRIGGERS, FACTS_MAX_PER_USER,
+    FACTS_PROMPT_LIMIT, HISTORY_PAGE_SIZE,
+    LLM_GENERATION_TIMEOUT, LLM_INPUT_COST_CHARS, LLM_MAX_CONCURRENCY, LLM_QUEUE_TIMEOUT,
+    MEMORY_ANONYMOUS_MODE, MEMORY_DEDUP_SIMILARITY, MEMORY_K, MEMORY_MAX_CHARS, MEMORY_RESUME,
+    MEMORY_SERVICE_BATCH_WAIT_MS, MEMORY_SERVICE_TIMEOUT, MEMORY_SERVICE_URL, MEMORY_USER_QUOTA,
+    OLLAMA_AFFINITY_SLACK, OLLAMA_BASE_URLS, OLLAMA_HEALTH_INTERVAL, OLLAMA_MODEL_NAME,
+    PERSONAS, PERSONA_MAX_LOADED,
+    RESPONSE_CACHE_AUDIO_DIR, RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_SEMANTIC,
+    RESPONSE_CACHE_SIMILARITY, RESPONSE_CACHE_TTL,
+    RETRIEVAL_MIN_SIMILARITY, RETRIEVAL_N_RESULTS, RETRIEVAL_TIMEOUT,
+    STREAM_COALESCE_MAX_CHARS, STREAM_COALESCE_WINDOW_MS, STREAM_SENTENCE_ENDS,
+    THINK_FORCE_ANSWER_NOTE, THINK_FORCE_ANSWER_TEMPLATE, THINK_KEYWORDS, THINK_MODE,
+    THINK_NO_THINK_MAX_CHARS, THINK_TOKEN_BUDGET,
+    TTS_BASE_URL,
+    VAD_ENERGY_THRESHOLD, VAD_MAX_UTTERANCE_S, VAD_MIN_SPEECH_MS, VAD_SILENCE_MS,
+)
+from prompts.prompts_template import prompt_template_str, fact_extraction_template_str
 import time
 
+# 进程内共享的组件都在首次使用时创建，导入 app 模块本身不加载模型、不打开数据库、不连接 Ollama。
+# functools.cache 保证每个组件只创建一次；这些函数只在事件循环线程中调用，不存在并发创建。
+
+
+@functools.cache
+def get_embedding_provider():
+    """进程内共享的向量模型，模型在首次向量化时加载，多个会话的请求合并为批处理"""
+    return create_embedding_provider(
+        backend=EMBEDDING_BACKEND,
+        model_dir=EMBEDDING_MODEL_DIR,
+        quantize=EMBEDDING_QUANTIZE,
+        threads=EMBEDDING_THREADS,
+        max_length=EMBEDDING_MAX_LENGTH,
+        pooling=EMBEDDING_POOLING,
+        query_prefix=EMBEDDING_QUERY_PREFIX,
+        document_prefix=EMBEDDING_DOCUMENT_PREFIX,
+        version=EMBEDDING_VERSION,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        batch_wait_ms=EMBEDDING_BATCH_WAIT_MS,
+    )
+
+
+@functools.cache
+def get_memory_client() -> Optional[MemoryServiceClient]:
+    """配置了记忆服务时，长期记忆通过记忆服务读写，可以同时运行多个应用进程"""
+    if not MEMORY_SERVICE_URL:
+        return None
+    return MemoryServiceClient(
+        MEMORY_SERVICE_URL,
+        timeout=MEMORY_SERVICE_TIMEOUT,
+        batch_wait_ms=MEMORY_SERVICE_BATCH_WAIT_MS,
+    )
+
+
+@functools.cache
+def get_persona_registry() -> PersonaRegistry:
+    """进程内共享的角色注册表，角色按需加载并按 LRU 淘汰"""
+    return PersonaRegistry(
+        personas=PERSONAS,
+        default_persona=DEFAULT_PERSONA,
+        max_loaded=PERSONA_MAX_LOADED,
+        chat_memory_dir=CHAT_MEMORY_DIR,
+        hnsw=CHAT_MEMORY_HNSW,
+        embedding_provider=get_embedding_provider(),
+        dedup_similarity=MEMORY_DEDUP_SIMILARITY,
+        cache_limit_mb=CHAT_MEMORY_CACHE_LIMIT_MB,
+        memory_client=get_memory_client(),
+    )
+
+
+@functools.cache
+def get_ollama_router() -> OllamaRouter:
+    """多个 Ollama 节点之间的负载均衡，同一会话尽量固定在同一节点"""
+    return OllamaRouter(
+        base_urls=OLLAMA_BASE_URLS,
+        model=OLLAMA_MODEL_NAME,
+        health_interval=OLLAMA_HEALTH_INTERVAL,
+        affinity_slack=OLLAMA_AFFINITY_SLACK,
+    )
+
+
+@functools.cache
+def get_reasoning_policy() -> ReasoningPolicy:
+    """每轮对话的推理策略：闲聊不思考，其他问题限制思考长度"""
+    return ReasoningPolicy(
+        mode=THINK_MODE,
+        no_think_max_chars=THINK_NO_THINK_MAX_CHARS,
+        think_keywords=THINK_KEYWORDS,
+        think_token_budget=THINK_TOKEN_BUDGET,
+        force_answer_template=THINK_FORCE_ANSWER_TEMPLATE,
+        force_answer_note=THINK_FORCE_ANSWER_NOTE,
+    )
+
+
+@functools.cache
+def get_reasoning_metrics() -> ReasoningMetrics:
+    """进程内累计的推理统计"""
+    return ReasoningMetrics()
+
+
+@functools.cache
+def get_llm_scheduler() -> LLMScheduler:
+    """进程内共享的 LLM 调度器，限制同时访问模型的生成请求数并公平排队"""
+    return LLMScheduler(
+        max_concurrency=LLM_MAX_CONCURRENCY,
+        queue_timeout=LLM_QUEUE_TIMEOUT,
+        generation_timeout=LLM_GENERATION_TIMEOUT,
+        input_cost_chars=LLM_INPUT_COST_CHARS,
+    )
+
+
+@functools.cache
+def get_fact_store() -> Optional[FactStore]:
+    """用户事实库，生成时按实体直接查表；未启用时返回 None"""
+    if not FACTS_ENABLED:
+        return None
+    return FactStore(FACTS_DB_PATH, max_facts_per_scope=FACTS_MAX_PER_USER)
+
+
+@functools.cache
+def get_fact_extractor() -> Optional[FactExtractor]:
+    """对话结束后在后台提取事实；未启用时返回 None"""
+    if not FACTS_ENABLED:
+        return None
+    return FactExtractor(
+        get_fact_store(),
+        get_ollama_router(),
+        fact_extraction_template_str,
+        scheduler=get_llm_scheduler(),  # 提取请求作为一个独立的用户参与公平排队
+        triggers=FACTS_EXTRACT_TRIGGERS,
+        prompt_suffix=FACTS_EXTRACT_SUFFIX,
+    )
+
+
+@functools.cache
+def get_response_cache() -> ResponseCache:
+    """进程内共享的回复缓存，按角色版本区分；启用语义匹配时与长期记忆共用同一个向量模型"""
+    embedding_function = get_embedding_provider().embed_query if RESPONSE_CACHE_SEMANTIC else None
+    return ResponseCache(
+        max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds=RESPONSE_CACHE_TTL,
+        audio_dir=RESPONSE_CACHE_AUDIO_DIR,
+        similarity_threshold=RESPONSE_CACHE_SIMILARITY,
+        embedding_function=embedding_function,
+    )
+
+
+@functools.cache
+def get_speech_transcriber() -> WhisperTranscriber:
+    """进程内共享的语音识别，模型在工作进程中只加载一次"""
+    return WhisperTranscriber(
+        model_name=ASR_MODEL_NAME,
+        language=ASR_LANGUAGE,
+        workers=ASR_WORKERS,
+        device=ASR_DEVICE,
+        threads_per_worker=ASR_THREADS_PER_WORKER,
+    )
+
+
+# 长期记忆无法打开时提示管理员如何处理
+MEMORY_UNAVAILABLE_NOTICE = (
+    "长期记忆暂时不可用：向量集合与当前配置的向量模型不一致，或记忆服务无法访问。"
+    "请联系管理员停止应用后运行 `python memory_index.py rebuild --all --reembed` 重新向量化，"
+    "或检查记忆服务是否正常运行。"
+)
+
+
+def is_authenticated() -> bool:
+    """当前会话是否为登录用户（启用了 Chainlit 认证）"""
+    user = cl.user_session.get("user")
+    return bool(user and getattr(user, "identifier", None))
+
+
+def get_user_id() -> str:
+    """获取当前会话的用户标识
+
+    启用 Chainlit 认证时使用登录用户的 identifier；匿名会话在 session 模式下按会话ID独立分区，
+    在 shared 模式下返回空字符串，共用角色的基础集合。
+    """
+    if is_authenticated():
+        return cl.user_session.get("user").identifier
+    if MEMORY_ANONYMOUS_MODE == "shared":
+        return ""
+    return f"anonymous:{cl.user_session.get('id')}"
+
+
+def is_temporary_partition() -> bool:
+    """匿名会话的独立分区只在会话期间使用，会话结束后删除"""
+    return not is_authenticated() and MEMORY_ANONYMOUS_MODE != "shared"
+
+
+@cl.set_chat_profiles
+async def chat_profiles():
+    return [
+        cl.ChatProfile(
+            name=p["name"],
+            markdown_description=p["description"],
+            default=(p["id"] == DEFAULT_PERSONA),
+        )
+        for p in get_persona_registry().list_personas()
+    ]
+
+
+class QueueNotice:
+    """在用户排队等待 LLM 时显示并更新排队位置"""
+
+    def __init__(self):
+        self.message = None
+
+    async def update(self, position: int) -> None:
+        content = f"当前使用人数较多，正在排队，前面还有 {position} 个请求..."
+        if self.message is None:
+            self.message = cl.Message(content=content, author="系统")
+            await self.message.send()
+        else:
+            self.message.content = content
+            await self.message.update()
+
+    async def clear(self) -> None:
+        if self.message is not None:
+            await self.message.remove()
+            self.message = None
+
 
 @cl.on_chat_start
 async def start_chat():
-    # 初始化 Ollama LLM
-    llm = Ollama(model=OLLAMA_MODEL_NAME, base_url=OLLAMA_BASE_URL)
+    # 初始化 Ollama LLM（经路由分发到多个节点）
+    llm = get_ollama_router().for_session(cl.user_session.get("id"))
     cl.user_session.set("llm", llm)
-    
-    # 初始化短期记忆和向量存储记忆
-    memory = ShortTermMemory(k=MEMORY_K)
-    chat_memory = ChatMemory(persist_directory=CHAT_MEMORY_DIR)
+
+    # 根据 chat profile 选择角色，角色的提示词和向量集合在进程内共享
+    persona_id = get_persona_registry().resolve(cl.user_session.get("chat_profile"))
+    # 首次使用的角色需要读取配置并生成提示词，放到线程中避免阻塞其他会话
+    persona = await asyncio.to_thread(get_persona_registry().acquire, persona_id)
+    cl.user_session.set("persona", persona)
+
+    # 初始化短期记忆和向量存储记忆，长期记忆按登录用户分区
+    memory = ShortTermMemory(k=MEMORY_K, max_chars=MEMORY_MAX_CHARS)
+    # 打开集合需要创建 Chroma 客户端并读取元数据（或访问记忆服务），放到线程中避免阻塞其他会话
+    try:
+        chat_memory = await asyncio.to_thread(
+            persona.open_memory, get_user_id(), max_interactions=MEMORY_USER_QUOTA
+        )
+    except (EmbeddingModelMismatch, MemoryServiceError) as e:
+        # 集合由其他向量模型写入（或记忆服务不可用）：不能检索也不能写入，本会话不开始对话
+        print(f"ERROR: 打开长期记忆失败 - {e}")
+        get_persona_registry().release(persona.persona_id)
+        cl.user_session.set("persona", None)
+        cl.user_session.set("memory_error", MEMORY_UNAVAILABLE_NOTICE)
+        await cl.Message(content=MEMORY_UNAVAILABLE_NOTICE, author="系统").send()
+        return
     cl.user_session.set("memory", memory)
     cl.user_session.set("chat_memory", chat_memory)
+    # 事实库分区与长期记忆一致；匿名访客共用分区（shared 模式）时没有可区分的身份，不提取也不查询事实
+    user_id = get_user_id()
+    cl.user_session.set("fact_scope", persona.memory_scope(user_id) if user_id else None)
     
-    # 获取所有按时间倒序的历史记录 (最新的在前)
-    all_interactions_sorted_desc = chat_memory.get_all_interactions_sorted()
+    # 一次读取最新的若干条历史记录 (最新的在前)，同时用于界面展示和恢复短期记忆。
+    # 只有登录用户的分区属于同一个人；匿名会话的分区是新建的（session）或由所有访客共用（shared），
+    # 不展示也不恢复，短期记忆从空窗口开始
+    recent_interactions = []
+    if is_authenticated():
+        recent_interactions = await asyncio.to_thread(
+            chat_memory.get_interactions_page,
+            page=0, page_size=max(HISTORY_PAGE_SIZE, MEMORY_K if MEMORY_RESUME else 0)
+        )
+    if MEMORY_RESUME and recent_interactions:
+        memory.load_interactions(recent_interactions[:MEMORY_K])
+    all_interactions_sorted_desc = recent_interactions[:HISTORY_PAGE_SIZE]
     
     if all_interactions_sorted_desc:
         # 为了在聊天界面中按正常顺序显示 (最老的在前，最新的在后，新消息追加在底部),
@@ -41,39 +302,256 @@ async def start_chat():
 
     # 发送欢迎消息 - 这将是用户看到的第一条 "实时" 消息，显示在所有历史之后
     elements = []
-    if os.path.exists(AVATAR_IMAGE_PATH):
-        try:
-            with open(AVATAR_IMAGE_PATH, "rb") as f:
-                avatar_bytes = f.read()
-            elements.append(
-                cl.Image(
-                    content=avatar_bytes,
-                    name="avatar_pic_start",
-                    display="inline",
-                    size="medium",
-                )
+    if persona.avatar_bytes:
+        elements.append(
+            cl.Image(
+                content=persona.avatar_bytes,
+                name="avatar_pic_start",
+                display="inline",
+                size="medium",
             )
-        except Exception as e:
-            print(f"错误：加载欢迎消息头像图片失败 - {e}")
+        )
     await cl.Message(
         content=f"你好！请问有什么可以帮您的吗？",
         elements=elements,
         author="AI助手",
     ).send()
 
+
+@cl.on_chat_end
+async def end_chat():
+    # 会话断开时取消仍在进行的识别、生成和语音合成，避免继续占用 GPU
+    await cancel_pending_utterances()
+    await cancel_current_turn()
+    chat_memory = cl.user_session.get("chat_memory")
+    if chat_memory is not None and is_temporary_partition():
+        try:
+            await asyncio.to_thread(chat_memory.drop)
+        except Exception as e:
+            print(f"ERROR: 删除匿名会话的记忆分区失败 - {e}")
+    fact_scope = cl.user_session.get("fact_scope")
+    if fact_scope is not None and is_temporary_partition() and get_fact_store() is not None:
+        # 匿名会话的事实只在会话期间使用，与记忆分区一起删除；先丢弃尚未完成的提取，避免删除后又写入
+        get_fact_extractor().discard(fact_scope)
+        try:
+            await asyncio.to_thread(get_fact_store().delete, fact_scope)
+        except Exception as e:
+            print(f"ERROR: 删除匿名会话的用户事实失败 - {e}")
+    persona = cl.user_session.get("persona")
+    if persona:
+        get_persona_registry().release(persona.persona_id)
+
+
+@cl.on_stop
+async def on_stop():
+    await cancel_pending_utterances()
+    await cancel_current_turn()
+
+
+async def cancel_current_turn() -> None:
+    """取消当前会话中尚未完成的对话轮次，并等待其清理完毕"""
+    turn = cl.user_session.get("turn_task")
+    if turn is not None and not turn.done():
+        turn.cancel()
+        await asyncio.wait({turn})
+
+
+async def run_turn(message: cl.Message) -> None:
+    """以可取消的任务执行一轮对话，新消息会取消上一轮尚未完成的生成"""
+    if cl.user_session.get("memory_error"):
+        await cl.Message(content=cl.user_session.get("memory_error"), author="系统").send()
+        return
+    await cancel_current_turn()
+    turn = asyncio.create_task(main(message))
+    cl.user_session.set("turn_task", turn)
+    try:
+        await asyncio.wait({turn})
+    except asyncio.CancelledError:
+        # 处理器本身被取消（用户点击停止）时，同时取消本轮对话
+        turn.cancel()
+        raise
+    finally:
+        if cl.user_session.get("turn_task") is turn:
+            cl.user_session.set("turn_task", None)
+    if not turn.cancelled() and turn.exception() is not None:
+        raise turn.exception()
+
+
 @cl.on_audio_start
 async def on_audio_start():
-    cl.user_session.set("silent_duration_ms", 0)
-    cl.user_session.set("is_speaking", False)
-    cl.user_session.set("audio_chunks", [])
+    from speech import EnergyVAD
+
+    cl.user_session.set("vad", EnergyVAD(
+        sample_rate=AUDIO_SAMPLE_RATE,
+        energy_threshold=VAD_ENERGY_THRESHOLD,
+        silence_ms=VAD_SILENCE_MS,
+        min_speech_ms=VAD_MIN_SPEECH_MS,
+        max_utterance_s=VAD_MAX_UTTERANCE_S,
+    ))
+    # 用户开始说话时就启动识别进程，模型加载与说话并行
+    get_speech_transcriber().warmup()
     return True
 
 
+@cl.on_audio_chunk
+async def on_audio_chunk(chunk: cl.InputAudioChunk):
+    vad = cl.user_session.get("vad")
+    if vad is None:
+        return
+    utterance = vad.feed(chunk.data)
+    if utterance:
+        start_utterance(utterance)
+
+
+@cl.on_audio_end
+async def on_audio_end():
+    vad = cl.user_session.get("vad")
+    if vad is None:
+        return
+    utterance = vad.flush()
+    if utterance:
+        start_utterance(utterance)
+
+
+def start_utterance(pcm: bytes) -> None:
+    """在后台识别一句语音并开始一轮对话，音频处理器立即返回，继续接收后续音频
+
+    识别立即开始，但各句语音按说话顺序进入对话：后一句要等前一句的消息发送后才发送。
+    """
+    previous_sent = cl.user_session.get("utterance_sent")
+    sent = asyncio.get_running_loop().create_future()
+    cl.user_session.set("utterance_sent", sent)
+    transcription = asyncio.create_task(transcribe_utterance(pcm))
+    task = asyncio.create_task(handle_utterance(transcription, previous_sent, sent))
+    pending = cl.user_session.get("utterance_tasks")
+    if pending is None:
+        pending = set()
+        cl.user_session.set("utterance_tasks", pending)
+    pending.add(task)
+    task.add_done_callback(pending.discard)
+    task.add_done_callback(_log_utterance_failure)
+
+
+async def transcribe_utterance(pcm: bytes) -> str:
+    """识别一句语音，失败时提示用户并返回空字符串"""
+    start_time = time.perf_counter()
+    try:
+        text = await get_speech_transcriber().transcribe(pcm, AUDIO_SAMPLE_RATE)
+    except Exception as e:
+        print(f"ERROR: 语音识别失败 - {e}")
+        await cl.Message(content="语音识别失败，请重试或改用文字输入。", author="系统").send()
+        return ""
+    print(f"DEBUG: 语音识别完成，耗时 {(time.perf_counter() - start_time) * 1000:.0f} ms: {text}")
+    return text
+
+
+async def handle_utterance(transcription: asyncio.Task,
+                           previous_sent: Optional[asyncio.Future],
+                           sent: asyncio.Future) -> None:
+    """等待识别结果，并作为用户消息进入正常的对话流程"""
+    try:
+        if previous_sent is not None:
+            await asyncio.wait({previous_sent})
+        text = await transcription
+        if text:
+            message = cl.Message(content=text, author="用户", type="user_message")
+            await message.send()
+    finally:
+        # 本句已发送或被放弃，后一句可以发送；被取消时同时停止识别
+        transcription.cancel()
+        if not sent.done():
+            sent.set_result(None)
+    if text:
+        await run_turn(message)
+
+
+async def cancel_pending_utterances() -> None:
+    """取消尚未结束的语音对话，避免会话结束或停止后又开始新的一轮"""
+    pending = cl.user_session.get("utterance_tasks")
+    if not pending:
+        return
+    tasks = set(pending)
+    for task in tasks:
+        task.cancel()
+    await asyncio.wait(tasks)
+
+
+def _log_utterance_failure(task: asyncio.Task) -> None:
+    # 后台任务的异常没有处理器接收，在这里记录
+    if not task.cancelled() and task.exception() is not None:
+        print(f"ERROR: 语音对话失败 - {task.exception()}")
+
+
 @cl.on_message
+async def on_message(message: cl.Message):
+    await run_turn(message)
+
+
+def retrieve_relevant_history(chat_memory, query: str) -> str:
+    """检索与本轮输入相关的长期历史，返回拼接好的文本（在线程中执行）"""
+    results = chat_memory.search_similar_interactions(
+        query, n_results=RETRIEVAL_N_RESULTS, min_similarity=RETRIEVAL_MIN_SIMILARITY
+    )
+    # query 的结果按查询分组，这里只有一个查询，取第一组中的全部结果
+    metadatas = (results.get("metadatas") or [[]])[0] or []
+    relevant_history_list = [
+        f"用户: {metadata['user_input']}\n AI助手: {metadata['assistant_response']}\n"
+        for metadata in metadatas
+        if metadata
+    ]
+    return "\n".join(relevant_history_list)
+
+
+def lookup_facts(fact_store: Optional[FactStore], scope: str, query: str) -> str:
+    """查找与本轮对话相关的用户事实，格式化为提示词中的一段文本"""
+    if fact_store is None or scope is None:
+        return ""
+    return format_facts(fact_store.lookup(scope, query, limit=FACTS_PROMPT_LIMIT))
+
+
+def submit_for_fact_extraction(user_message: str, reply: str) -> None:
+    """把完成的对话轮次交给后台提取事实，不等待结果"""
+    scope = cl.user_session.get("fact_scope")
+    fact_extractor = get_fact_extractor()
+    if fact_extractor is not None and scope is not None:
+        fact_extractor.submit(scope, user_message, reply)
+
+
+async def wait_within_budget(task: asyncio.Task, deadline: float, default=None):
+    """在截止时间前等待后台任务的结果，超时或出错时返回默认值（任务继续在后台完成）"""
+    remaining = max(0.0, deadline - asyncio.get_running_loop().time())
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout=remaining)
+    except asyncio.TimeoutError:
+        print("DEBUG: 后台任务超出时间预算，本轮跳过")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"ERROR: 后台任务失败 - {e}")
+    return default
+
+
+def stream_coalescer(sink) -> TokenCoalescer:
+    """按配置创建流式内容合并器"""
+    return TokenCoalescer(
+        sink,
+        window_ms=STREAM_COALESCE_WINDOW_MS,
+        max_chars=STREAM_COALESCE_MAX_CHARS,
+        sentence_ends=STREAM_SENTENCE_ENDS,
+    )
+
+
+def _consume_result(task: asyncio.Task) -> None:
+    # 超出预算后被放弃的任务，其异常不再有人读取，在这里取出避免告警
+    if not task.cancelled():
+        task.exception()
+
+
 async def main(message: cl.Message):
     llm = cl.user_session.get("llm")
     memory = cl.user_session.get("memory")
     chat_memory = cl.user_session.get("chat_memory")  # 获取向量存储记忆
+    persona = cl.user_session.get("persona")
     user_message = message.content
 
     if not user_message:
@@ -82,20 +560,43 @@ async def main(message: cl.Message):
 
     # 准备AI回复的头像
     ai_reply_elements = []
-    if os.path.exists(AVATAR_IMAGE_PATH):
-        try:
-            with open(AVATAR_IMAGE_PATH, "rb") as f:
-                avatar_bytes_reply = f.read()
-            ai_reply_elements.append(
-                cl.Image(
-                    content=avatar_bytes_reply,
-                    name="avatar_reply",
-                    display="inline",
-                    size="small",
-                )
+    if persona.avatar_bytes:
+        ai_reply_elements.append(
+            cl.Image(
+                content=persona.avatar_bytes,
+                name="avatar_reply",
+                display="inline",
+                size="small",
             )
-        except Exception as e:
-            print(f"错误：加载AI回复头像图片失败 - {e}")
+        )
+
+    # 命中回复缓存时直接返回缓存的回复和语音，跳过检索、生成和语音合成
+    # 缓存在用户之间共享，其中只有不含个人信息的回复
+    use_cache = RESPONSE_CACHE_ENABLED and persona.response_cache
+    if use_cache:
+        cached = await asyncio.to_thread(
+            get_response_cache().get, persona.persona_id, persona.version, user_message
+        )
+        if cached is not None:
+            await send_cached_reply(
+                cached, user_message, ai_reply_elements, persona, memory, chat_memory
+            )
+            return
+
+    # ---- 并行启动互不依赖的准备步骤 ----
+    # 长期记忆检索（向量化 + 查询）在线程中进行，有时间预算；LLM 客户端同时在后台创建。
+    # 二者与下面的界面初始化重叠，首个 token 的延迟取决于最慢的必要步骤而不是各步骤之和。
+    retrieval_deadline = asyncio.get_running_loop().time() + RETRIEVAL_TIMEOUT
+    retrieval_task = asyncio.create_task(
+        asyncio.to_thread(retrieve_relevant_history, chat_memory, user_message)
+    )
+    retrieval_task.add_done_callback(_consume_result)
+    facts_task = asyncio.create_task(
+        asyncio.to_thread(lookup_facts, get_fact_store(), cl.user_session.get("fact_scope"), user_message)
+    )
+    facts_task.add_done_callback(_consume_result)
+    prepare_task = asyncio.create_task(llm.prepare())
+    prepare_task.add_done_callback(_consume_result)
 
     # ---- 初始化 Chainlit UI 元素 ----
     # 1. 创建 "AI 思考过程" 的步骤 UI，初始内容为空
@@ -114,133 +615,97 @@ async def main(message: cl.Message):
         final_reply_msg = cl.Message(content="")
         await final_reply_msg.send()  # 必须先发送空壳
 
-        # ---- 变量用于流式解析 ----
-        accumulated_think_content = ""  # 用于累积 <think> 标签内的内容
-        current_processing_buffer = ""  # 用于处理跨 token 的标签
-        is_inside_think_block = False  # 当前是否正在解析 <think> 标签内的内容
         reply_content = ""  #  记录 LLM 最终回复的结果，转成 LLM 用
+        queue_notice = QueueNotice()  # 排队时显示排队位置
+        reasoning_policy = get_reasoning_policy()
+        reasoning_plan = reasoning_policy.plan(user_message)  # 本轮是否思考以及思考预算
+        print(f"DEBUG: Reasoning plan: {reasoning_plan}")
 
         try:
-            # 获取短期记忆历史对话
+            # 获取短期记忆历史对话（增量维护，无需等待）
             history = memory.get_formatted_history()
-            # 搜索长期历史对话
-            similar_interactions = chat_memory.search_similar_interactions(user_message, n_results=3)
-            if similar_interactions and similar_interactions.get('documents'):
-                # 从元数据中获取完整的对话内容
-                relevant_history_list = []
-                for metadata in similar_interactions['metadatas']:
-                    if len(metadata) == 0:
-                        continue
-                    relevant_history_list.append(f"用户: {metadata[0]['user_input']}\n AI助手: {metadata[0]['assistant_response']}\n")
-                if len(relevant_history_list) > 0:
-                    history += "\n相关历史对话：\n" + "\n".join(relevant_history_list)
+            # 等待长期历史检索，超出时间预算时本轮不使用相关历史
+            relevant_history = await wait_within_budget(retrieval_task, retrieval_deadline, default="")
+            if relevant_history:
+                history += "\n相关历史对话：\n" + relevant_history
+            # 已知的用户事实按实体直接查表，与检索共用时间预算
+            facts = await wait_within_budget(facts_task, retrieval_deadline, default="")
+            # 用到了该用户的长期记忆（相似度达到阈值的检索结果）或事实时，回复是个性化的，不写入共享的回复缓存；
+            # 短期对话窗口只是上下文，不单独算作个性化
+            personalized = bool(relevant_history or facts)
             # 构建提示
             prompt = prompt_template_str.format(
-                personality_config=generate_prompt('./prompts/user_config.json'),
+                personality_config=persona.prompt,
+                facts=facts or "（暂无）",
                 history=history,
                 input=user_message
             )
             
-            # 添加用户消息到记忆
-            memory.add_user_message(user_message)
-            
             print(f"DEBUG: Sending prompt to LLM: '{prompt[:300]}...'")
 
-            async for token in llm.astream(prompt):
-                if not token:
-                    continue
-
-                current_processing_buffer += token
-                # print(f"DEBUG: Buffer: '{current_processing_buffer}' | InThink: {is_inside_think_block}")
-
-                while True:  # 循环处理 buffer 中的内容，直到无法进一步解析
-                    processed_in_loop = False
-                    if is_inside_think_block:
-                        end_tag_index = current_processing_buffer.find("</think>")
-                        if end_tag_index != -1:
-                            # 找到了 </think> 标签
-                            think_chunk = current_processing_buffer[:end_tag_index]
-                            accumulated_think_content += think_chunk
-                            think_step.output = (
-                                accumulated_think_content  # 更新思考步骤的全部内容
-                            )
-
-                            current_processing_buffer = current_processing_buffer[
-                                end_tag_index + len("</think>") :
-                            ]
-                            is_inside_think_block = False
-                            processed_in_loop = True
-                            # print(f"DEBUG: Exited think block. Remaining buffer: '{current_processing_buffer}'")
-                        else:
-                            # 还在 think 标签内，但没找到结束标签，当前 buffer 不足以构成完整结束
-                            # 将当前 buffer 的大部分（除了可能的标签开头）累加到思考内容中
-                            # 为了避免过早更新UI，我们将累积，直到找到结束标签
-                            # 或者，如果希望思考过程也流式展示在step中，这里的逻辑需要更复杂
-                            # 目前的逻辑是找到完整的 <think>...</think> 后再更新 step.output
-                            break  # 等待更多 token 来形成完整的 </think>
-                    else:  # 不在 think 标签内，当前内容是回复
-                        start_tag_index = current_processing_buffer.find("<think>")
-                        if start_tag_index != -1:
-                            # 找到了 <think> 标签
-                            reply_chunk = current_processing_buffer[:start_tag_index]
-                            if reply_chunk:
-                                await final_reply_msg.stream_token(reply_chunk)
-
-                            is_inside_think_block = True
-                            current_processing_buffer = current_processing_buffer[
-                                start_tag_index + len("<think>") :
-                            ]
-                            processed_in_loop = True
-                            # print(f"DEBUG: Entered think block. Remaining buffer: '{current_processing_buffer}'")
+            # 进入调度队列，排队期间向用户反馈当前位置
+            async with get_llm_scheduler().slot(
+                get_user_id() or cl.user_session.get("id"),  # 匿名用户按会话公平排队
+                len(user_message),  # 按用户输入计算成本，角色设定和记忆是所有请求共有的部分
+                on_position=queue_notice.update,
+            ):
+                await queue_notice.clear()
+                await prepare_task
+                turn_stats = TurnStats(reasoning_plan)
+                # 思考内容实时显示在步骤中，回复内容流式写入回复消息；
+                # 本轮被取消时 aclosing 会立即关闭生成流，断开与 Ollama 的连接以停止生成
+                # token 合并后再推送到界面，减少 websocket 消息数；流结束时发送剩余内容
+                async with aclosing(stream_with_reasoning(
+                    llm, prompt, reasoning_policy, reasoning_plan, turn_stats
+                )) as events, \
+                        stream_coalescer(think_step.stream_token) as think_stream, \
+                        stream_coalescer(final_reply_msg.stream_token) as reply_stream:
+                    async for kind, text in events:
+                        if kind == "think":
+                            await think_stream.push(text)
                         else:
-                            # 当前 buffer 中没有 <think> 标签，全部是回复内容
-                            # 为了避免流式输出不完整的标签，我们可以做一个简单检查
-                            # 如果 buffer 中没有 '<'，则可以安全地流式输出整个 buffer
-                            if "<" not in current_processing_buffer:
-                                if current_processing_buffer:
-                                    reply_content += current_processing_buffer
-                                    await final_reply_msg.stream_token(
-                                        current_processing_buffer
-                                    )
-                                    current_processing_buffer = ""
-                                processed_in_loop = (
-                                    True  # 即使为空，也标记为处理过以退出循环
-                                )
-                            # 如果有 '<'，可能是标签的开头，暂时不处理，等待更多 token
-                            break  # 等待更多 token
-
-                    if not processed_in_loop:  # 如果内层循环没有处理任何东西，跳出
-                        break
-
-            # 流结束后，处理 current_processing_buffer 中剩余的内容
-            if current_processing_buffer:
-                if not is_inside_think_block:  # 如果最后是在回复状态
-                    # print(f"DEBUG: Streaming remaining buffer as reply: '{current_processing_buffer}'")
-                    reply_content += current_processing_buffer
-                    await final_reply_msg.stream_token(current_processing_buffer)
-                else:  # 如果流结束时仍在 think 块内（标签不完整）
-                    # print(f"DEBUG: Appending remaining buffer to think content: '{current_processing_buffer}'")
-                    accumulated_think_content += current_processing_buffer
-                    think_step.output = accumulated_think_content  # 更新最后的思考内容
+                            # 思考结束后的空行不显示
+                            if not reply_content:
+                                text = text.lstrip()
+                                if not text:
+                                    continue
+                                await think_stream.flush()  # 回复开始前把思考内容显示完整
+                            reply_content += text
+                            await reply_stream.push(text)
+                get_reasoning_metrics().record(turn_stats)
+                print(f"DEBUG: Streamed {reply_stream.stats['tokens'] + think_stream.stats['tokens']} tokens "
+                      f"in {reply_stream.stats['flushes'] + think_stream.stats['flushes']} UI updates")
 
             # 最终检查和设置默认值
-            if not think_step.output or think_step.output == "正在生成思考计划...":
-                think_step.output = "(模型未提供明确的思考过程标签内容)"
+            if not think_step.output.strip():
+                think_step.output = (
+                    "(本轮为简短对话，未进行思考)" if reasoning_plan.mode == "no_think"
+                    else "(模型未提供明确的思考过程标签内容)"
+                )
             print("DEBUG: Stream processing complete.")
-            if len(reply_content) <= 2:
-                return
 
-            # 添加AI回复到记忆
+            # 生成完成后才写入记忆，被取消的对话轮次不会留下记录；
+            # "嗯"、"好" 这类简短回复同样记录，短期历史中不会丢失用户的这一轮输入
             if reply_content:
+                memory.add_user_message(user_message)
                 memory.add_ai_message(reply_content)
-                # 同时保存到向量数据库
-                chat_memory.add_interaction(
+                # 同时保存到向量数据库（向量化在线程中进行，与其他会话的请求合并批处理）
+                await asyncio.to_thread(
+                    chat_memory.add_interaction,
                     user_input=user_message,
                     assistant_response=reply_content,
                     metadata={"model": OLLAMA_MODEL_NAME}
                 )
+                submit_for_fact_extraction(user_message, reply_content)
+            if len(reply_content) <= 2:
+                return  # 过短的回复不合成语音，也不写入回复缓存
 
-            audio_path = text_to_speech(reply_content)
+            audio_path = await atext_to_speech(
+                reply_content,
+                ref_wav_path=persona.tts_ref_wav_path,
+                ref_text=persona.tts_ref_text,
+                base_url=TTS_BASE_URL,
+            )
             output_audio_el = cl.Audio(
                 name="语音",
                 path=audio_path,
@@ -249,6 +714,31 @@ async def main(message: cl.Message):
 
             await cl.Message(content="", elements=[output_audio_el]).send()
 
+            if use_cache and not personalized:
+                await asyncio.to_thread(
+                    get_response_cache().put,
+                    persona.persona_id,
+                    persona.version,
+                    user_message,
+                    reply_content,
+                    audio_path,
+                )
+
+        except asyncio.CancelledError:
+            print("DEBUG: 本轮对话已取消")
+            retrieval_task.cancel()
+            facts_task.cancel()
+            prepare_task.cancel()
+            await queue_notice.clear()
+            think_step.output = "已取消"
+            raise
+        except SchedulerTimeout:
+            await queue_notice.clear()
+            await cl.Message(content="当前排队的人太多了，请稍后再试。", author="系统").send()
+            think_step.output = "排队超时，未开始生成"
+        except asyncio.TimeoutError:
+            await cl.Message(content="回答生成超时，请换个问法再试一次。", author="系统").send()
+            think_step.output = "生成超时"
         except Exception as e:
             error_msg = f"处理流时出错: {str(e)}"
             print(e)
@@ -261,49 +751,42 @@ async def main(message: cl.Message):
                 think_step.output = error_msg
 
 
-def text_to_speech(text: str) -> str:
-    """将文本转换为语音
+async def send_cached_reply(cached, user_message, ai_reply_elements, persona, memory, chat_memory):
+    """发送缓存的回复和语音，并照常写入短期和长期记忆"""
+    await cl.Message(
+        content=cached.reply,
+        author="AI助手",
+        elements=ai_reply_elements
+    ).send()
 
-    Args:
-        text: 要转换的文本
+    audio_path = cached.audio_path
+    if audio_path is None:
+        # 缓存的语音文件已丢失，重新合成一次并补回缓存
+        try:
+            audio_path = await atext_to_speech(
+                cached.reply,
+                ref_wav_path=persona.tts_ref_wav_path,
+                ref_text=persona.tts_ref_text,
+                base_url=TTS_BASE_URL,
+            )
+            get_response_cache().update_audio(
+                persona.persona_id, persona.version, user_message, audio_path
+            )
+        except Exception as e:
+            print(f"ERROR: 缓存回复的语音合成失败 - {e}")
+    if audio_path:
+        await cl.Message(
+            content="",
+            elements=[cl.Audio(name="语音", path=audio_path, display="inline")]
+        ).send()
+
+    memory.add_user_message(user_message)
+    memory.add_ai_message(cached.reply)
+    await asyncio.to_thread(
+        chat_memory.add_interaction,
+        user_input=user_message,
+        assistant_response=cached.reply,
+        metadata={"model": OLLAMA_MODEL_NAME, "cached": True}
+    )
+    submit_for_fact_extraction(user_message, cached.reply)
 
-    Returns:
-        str: 生成的音频文件路径
-    """
-    try:
-        os.environ["HF_HUB_DISABLE_TELEMETRY"] = "1"
-        client = Client(TTS_BASE_URL)
-        
-        # 确保参考音频文件存在
-        if not os.path.exists(TTS_REF_WAV_PATH):
-            raise FileNotFoundError(f"参考音频文件不存在: {TTS_REF_WAV_PATH}")
-            
-        print(f"DEBUG: 开始TTS转换，文本长度: {len(text)}")
-        print(f"DEBUG: 参考音频文件: {TTS_REF_WAV_PATH}")
-        
-        result = client.predict(
-            ref_wav_path=file(TTS_REF_WAV_PATH),
-            prompt_text=TTS_REF_TEXT,
-            prompt_language="中文",
-            text=text,
-            text_language="中文",
-            how_to_cut="凑四句一切",
-            top_k=15,
-            top_p=1,
-            temperature=1,
-            ref_free=False,
-            speed=1,
-            if_freeze=False,
-            inp_refs=None,
-            sample_steps=8,
-            if_sr=False,
-            pause_second=0.3,
-            api_name="/get_tts_wav"
-        )
-        
-        print(f"DEBUG: TTS转换完成，结果: {result}")
-        return result
-        
-    except Exception as e:
-        print(f"ERROR: TTS转换失败 - {str(e)}")
-        raise
@@ -0,0 +1,74 @@
+"""从微信聊天记录导出构建微调数据集
+
+流式读取 train_data/wechat 下的导出文件（多进程并行），把同一人连续发送的消息合并为一轮，
+以对方的发言为 user、本人 (is_sender == 1) 的回复为 assistant 生成对话格式的样本，
+脱敏、去重后按对话划分训练/验证集，写入分片的 gzip 压缩 JSONL：
+
+    output/train-00000.jsonl.gz  每行 {"messages": [{"role": "user", ...}, {"role": "assistant", ...}]}
+    output/val-00000.jsonl.gz
+    output/manifest.json         构建参数、统计信息和分片列表
+
+用法:
+    python build_finetune_dataset.py --input train_data/wechat --output train_data/finetune
+    python build_finetune_dataset.py --system-prompt "你是孙悟空" --val-ratio 0.1 --workers 8
+"""
+import argparse
+import logging
+
+from finetune.dataset_builder import BuildOptions, build_dataset
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从微信聊天记录导出构建微调数据集")
+    parser.add_argument("--input", default="train_data/wechat", help="聊天记录导出目录")
+    parser.add_argument("--output", default="train_data/finetune", help="输出目录")
+    parser.add_argument("--turn-gap", type=float, default=120, help="同一人连续消息合并为一轮的最大间隔（秒）")
+    parser.add_argument("--session-gap", type=float, default=3600, help="超过该间隔视为新的对话（秒）")
+    parser.add_argument("--max-context-turns", type=int, default=6, help="每条样本最多携带的上文轮数")
+    parser.add_argument("--min-reply-chars", type=int, default=2, help="回复的最少字数")
+    parser.add_argument("--max-reply-chars", type=int, default=500, help="回复的最多字数")
+    parser.add_argument("--system-prompt", default="", help="每条样本的 system 消息")
+    parser.add_argument("--no-redact", action="store_true", help="不做敏感信息脱敏")
+    parser.add_argument("--include-groups", action="store_true", help="同时处理群聊记录")
+    parser.add_argument("--no-dedup", action="store_true", help="不去重")
+    parser.add_argument("--val-ratio", type=float, default=0.05, help="验证集比例（按对话划分）")
+    parser.add_argument("--shard-size", type=int, default=50000, help="每个分片的样本数")
+    parser.add_argument("--workers", type=int, default=0, help="并行进程数，0 表示使用 CPU 核数")
+    parser.add_argument("--seed", default="0", help="划分训练/验证集的随机种子")
+    args = parser.parse_args()
+
+    options = BuildOptions(
+        turn_gap=args.turn_gap,
+        session_gap=args.session_gap,
+        max_context_turns=args.max_context_turns,
+        min_reply_chars=args.min_reply_chars,
+        max_reply_chars=args.max_reply_chars,
+        system_prompt=args.system_prompt,
+        redact=not args.no_redact,
+        include_groups=args.include_groups,
+    )
+    manifest = build_dataset(
+        args.input,
+        args.output,
+        options=options,
+        val_ratio=args.val_ratio,
+        shard_size=args.shard_size,
+        workers=args.workers,
+        seed=args.seed,
+        dedup=not args.no_dedup,
+    )
+
+    stats = manifest["stats"]
+    logger.info("处理完成: %d 个文件 (%d 个失败), %d 条消息, %d 条样本, 去除重复 %d 条, 耗时 %.1f 秒",
+                stats["files"], stats["failed_files"], stats["messages"], stats["samples"],
+                stats["duplicates"], manifest["elapsed_s"])
+    for name, split in manifest["splits"].items():
+        logger.info("%s: %d 条样本, %d 个分片", name, split["samples"], len(split["shards"]))
+    logger.info("数据集已保存到: %s", args.output)
+
+
+if __name__ == "__main__":
+    main()
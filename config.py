@@ -1,10 +1,156 @@
 # --- 配置 ---
+import os
+
+# 以下部分配置可以用同名环境变量覆盖（例如压测时指向本地的模拟服务）
 OLLAMA_MODEL_NAME = "qwen3:14b"  # 您在 Ollama 中部署的模型名
-OLLAMA_BASE_URL = "http://localhost:11434"  # 您的 Ollama 服务地址
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")  # 您的 Ollama 服务地址
+# 多个 Ollama 节点时在此列出（环境变量用逗号分隔），请求按负载分发并自动故障切换
+OLLAMA_BASE_URLS = [u for u in os.getenv("OLLAMA_BASE_URLS", OLLAMA_BASE_URL).split(",") if u]
+OLLAMA_HEALTH_INTERVAL = 10  # Ollama 节点健康检查间隔（秒）
+OLLAMA_AFFINITY_SLACK = 2  # 会话绑定节点的负载比最空闲节点多出不超过该值时继续使用绑定节点
 AVATAR_IMAGE_PATH = "./img/avatar.png"  # 【新增/修改】确保您的头像图片在此路径
 MEMORY_K = 10  # 保留最近10轮对话
-CHAT_MEMORY_DIR = "./memory/chat_memory"  # 向量数据库存储目录
+MEMORY_MAX_CHARS = 4000  # 短期记忆格式化后的最大字符数，超出后淘汰最旧的消息
+MEMORY_RESUME = True  # 登录用户的新会话开始时从其长期记忆恢复最近 MEMORY_K 轮对话（匿名会话不恢复）
+CHAT_MEMORY_DIR = os.getenv("CHAT_MEMORY_DIR", "./memory/chat_memory")  # 向量数据库存储目录
 HISTORY_PAGE_SIZE = 5  # 每页显示的历史记录数
-TTS_BASE_URL = "http://localhost:9872/"  # TTS服务地址
+RETRIEVAL_N_RESULTS = 3  # 每轮对话从长期记忆中检索的相关历史条数
+RETRIEVAL_TIMEOUT = 1.0  # 长期记忆检索的时间预算（秒），超时后本轮不使用相关历史，直接开始生成
+RETRIEVAL_MIN_SIMILARITY = 0.5  # 检索结果的相似度下限，低于该值的历史不注入提示词；注入了历史的回复不写入共享的回复缓存
+# 长期记忆向量索引 (HNSW) 参数。ef_search 修改后下次打开集合时生效；
+# space / max_neighbors (M) / ef_construction 只在创建集合时生效，修改后需运行 memory_index.py rebuild 重建已有集合
+CHAT_MEMORY_HNSW = {
+    "space": "cosine",  # 距离度量：cosine / l2 / ip
+    "max_neighbors": 16,  # 每个节点的邻居数 M，越大召回率越高，索引越大
+    "ef_construction": 100,  # 建索引时的候选列表大小，越大索引质量越高，写入越慢
+    "ef_search": 100,  # 检索时的候选列表大小，越大召回率越高，检索越慢
+}
+# 每个用户一个向量集合，打开过的索引会常驻内存；该值限制所有集合索引的总内存（MB），
+# 超出后按 LRU 卸载最久未用的索引（下次访问时从磁盘重新加载），None 表示不限制
+CHAT_MEMORY_CACHE_LIMIT_MB = 2048
+
+# --- 向量模型 ---
+# chroma-default: Chroma 自带的 all-MiniLM-L6-v2（英文为主，中文检索效果一般）
+# onnx: 本地 ONNX 句向量模型，推荐中文模型 bge-small-zh-v1.5（目录中放 model.onnx 和 tokenizer.json）
+# 更换模型后需要停止应用，运行 memory_index.py rebuild --all --reembed 重新向量化（Chroma 默认模型写入的旧集合在此之前继续使用默认模型）
+EMBEDDING_BACKEND = "chroma-default"
+EMBEDDING_MODEL_DIR = "./models/bge-small-zh-v1.5"  # onnx 模型目录
+EMBEDDING_POOLING = "cls"  # 句向量池化方式：bge 系列用 cls，e5 / MiniLM 系列用 mean
+EMBEDDING_QUERY_PREFIX = ""  # 查询前缀，e5 系列为 "query: "
+EMBEDDING_DOCUMENT_PREFIX = ""  # 文档前缀，e5 系列为 "passage: "
+EMBEDDING_QUANTIZE = True  # 使用 int8 动态量化的模型（首次使用时生成 model_int8.onnx）
+EMBEDDING_THREADS = 2  # 向量模型的推理线程数，0 表示使用 onnxruntime 的默认值
+EMBEDDING_MAX_LENGTH = 256  # 最大 token 数
+EMBEDDING_BATCH_SIZE = 32  # 单次推理的最大文本数
+EMBEDDING_BATCH_WAIT_MS = 5  # 跨会话动态批处理的等待时间（毫秒），0 表示不合并请求
+EMBEDDING_VERSION = ""  # 替换同名模型文件时修改此值，触发重新向量化
+TTS_BASE_URL = os.getenv("TTS_BASE_URL", "http://localhost:9872/")  # TTS服务地址，"stub://" 开头时使用本地模拟（压测用）
 TTS_REF_WAV_PATH = "./TTS/train/参考.wav"  # TTS参考音频路径
-TTS_REF_TEXT = "模型切换，请上传并填写参考信息，请填写需要合成的目标文本和语种模式"  # TTS参考文本
\ No newline at end of file
+TTS_REF_TEXT = "模型切换，请上传并填写参考信息，请填写需要合成的目标文本和语种模式"  # TTS参考文本
+
+# --- 多角色配置 ---
+# 每个角色拥有独立的人设配置、向量集合和 TTS 参考音频，可在 Chainlit 的 chat profile 中切换。
+# collection_name 只能包含字母、数字、点、下划线和短横线。
+PERSONAS = {
+    "default": {
+        "name": "默认角色",  # Chainlit 中显示的 chat profile 名称
+        "description": "使用 prompts/user_config.json 定义的个性化角色",
+        "config_path": "./prompts/user_config.json",
+        "collection_name": "chat_history",
+        "tts_ref_wav_path": TTS_REF_WAV_PATH,
+        "tts_ref_text": TTS_REF_TEXT,
+        "avatar_path": AVATAR_IMAGE_PATH,
+    },
+    "wukong": {
+        "name": "孙悟空",
+        "description": "示例角色：花果山美猴王",
+        "config_path": "./prompts/wukong_config.json",
+        "collection_name": "chat_history_wukong",
+        "tts_ref_wav_path": TTS_REF_WAV_PATH,
+        "tts_ref_text": TTS_REF_TEXT,
+        "avatar_path": AVATAR_IMAGE_PATH,
+        "response_cache": True,  # 设为 False 可让该角色跳过回复缓存
+    },
+}
+DEFAULT_PERSONA = "default"  # 未选择 chat profile 时使用的角色
+PERSONA_MAX_LOADED = 8  # 同时常驻内存的角色数上限，超出后按 LRU 淘汰空闲角色
+
+# --- 长期记忆分区 ---
+MEMORY_USER_QUOTA = 5000  # 每个登录用户在每个角色下最多保留的对话条数，超出后删除最旧的记录；角色的基础集合不受限制
+# 未启用 Chainlit 认证时匿名会话的长期记忆：
+# session: 每个会话使用独立的临时分区，会话结束后删除，访客之间互不可见（默认）
+# shared: 所有匿名会话共用角色的基础集合（旧行为），任何访客都能检索到其他访客的对话，只适合单人使用
+MEMORY_ANONYMOUS_MODE = "session"
+# 写入长期记忆时的去重阈值：与已有记录内容相同或向量相似度不低于该值的对话替换已有记录（累加出现次数），
+# 1.0 表示只合并内容完全相同的对话，None 表示不去重。向量按"输入+回复"计算，阈值低于 1 时
+# 相似但回复不同的旧记录会被本轮替换，建议先用 dedup_memory.py --dry-run 评估。已有集合可以用 dedup_memory.py 离线去重
+MEMORY_DEDUP_SIMILARITY = 1.0
+
+# --- 记忆服务 ---
+# 设置后长期记忆通过记忆服务 (memory_service.py) 读写，多个应用进程可以共享同一个向量数据库；
+# 为空时应用进程直接打开向量数据库（只能运行一个应用进程）
+MEMORY_SERVICE_URL = os.getenv("MEMORY_SERVICE_URL", "")
+MEMORY_SERVICE_HOST = "127.0.0.1"  # 记忆服务监听地址
+MEMORY_SERVICE_PORT = 8765  # 记忆服务监听端口
+MEMORY_SERVICE_TIMEOUT = 30  # 访问记忆服务的超时时间（秒）
+MEMORY_SERVICE_BATCH_WAIT_MS = 2  # 合并多个会话请求的等待时间（毫秒），0 表示每个请求单独发送
+
+# --- 用户事实库 ---
+# 后台从对话中提取用户的姓名、职业、宠物等事实，按实体存入 SQLite，生成回复时直接查表注入提示词
+FACTS_ENABLED = True
+FACTS_DB_PATH = os.getenv("FACTS_DB_PATH", "./memory/facts.db")  # 事实库文件路径
+FACTS_MAX_PER_USER = 200  # 每个用户在每个角色下最多保留的事实数，超出后删除最久未更新的
+FACTS_PROMPT_LIMIT = 20  # 每轮注入提示词的事实数上限
+# 用户输入包含这些短语时才调用模型提取事实，避免闲聊产生额外的生成请求；为空表示每轮都提取。
+# 只加入明确的自我介绍短语；"我"、"我是"、"我的" 这类泛用词几乎每句话都会命中，每轮都会多一次生成
+FACTS_EXTRACT_TRIGGERS = [
+    "我叫", "叫我", "我的名字", "我是一名", "我的职业", "我家", "我们家", "我住", "住在", "我今年",
+    "生日", "我养", "养了", "我喜欢", "我不喜欢", "我讨厌", "我爱吃", "过敏", "上班", "工作是",
+    "我老婆", "我老公", "我对象", "女朋友", "男朋友", "我儿子", "我女儿", "我孩子",
+]
+FACTS_EXTRACT_SUFFIX = "/no_think"  # 追加在提取提示词末尾，Qwen3 提取时不思考
+
+# --- LLM 调度 ---
+LLM_MAX_CONCURRENCY = 2 * len(OLLAMA_BASE_URLS)  # 同时进行的生成请求数上限（所有节点合计），超出的请求按用户公平排队
+LLM_QUEUE_TIMEOUT = 120  # 排队等待的最长时间（秒）
+LLM_GENERATION_TIMEOUT = 300  # 单次生成的最长时间（秒）
+LLM_INPUT_COST_CHARS = 200  # 每多少字符的用户输入计为一个调度成本单位，短输入优先（角色设定和记忆不计入）
+
+# --- 推理（思考）策略 ---
+# auto: 简短的闲聊追加 Qwen3 的 /no_think 开关直接回答，其他问题正常思考；think: 总是思考；no_think: 从不思考
+THINK_MODE = "auto"
+THINK_NO_THINK_MAX_CHARS = 20  # auto 模式下不超过该字数且不含下列关键词的输入不思考
+THINK_KEYWORDS = ["为什么", "怎么", "如何", "怎样", "分析", "解释", "计算", "比较", "建议", "规划", "推荐", "总结", "区别"]
+THINK_TOKEN_BUDGET = 512  # 思考内容的 token 上限，超出后截断思考并要求模型直接回答，0 表示不限制
+# 超出思考预算后重新请求使用的原始提示词（按 Qwen3 的对话模板拼接，不再经过 Ollama 的模板），
+# 为空时不重新请求，只是不再显示超出预算的思考内容
+THINK_FORCE_ANSWER_TEMPLATE = (
+    "<|im_start|>user\n{prompt}<|im_end|>\n<|im_start|>assistant\n<think>\n{think}\n</think>\n\n"
+)
+THINK_FORCE_ANSWER_NOTE = "思考得差不多了，现在直接回答。"  # 追加在截断的思考内容之后，引导模型收尾
+
+# --- 流式显示 ---
+# 回复和思考内容合并后再推送到界面，减少逐 token 发送的 websocket 消息数
+STREAM_COALESCE_WINDOW_MS = 40  # 合并的时间窗口（毫秒），0 表示逐 token 发送
+STREAM_COALESCE_MAX_CHARS = 64  # 缓冲内容达到该字数时立即发送
+STREAM_SENTENCE_ENDS = "。！？!?；;…\n"  # 以这些字符结尾时立即发送，让整句尽快显示
+
+# --- 回复缓存 ---
+RESPONSE_CACHE_ENABLED = True  # 相同问题直接复用之前的回复和语音，跳过检索、生成和语音合成
+RESPONSE_CACHE_MAX_ENTRIES = 1000  # 最多缓存的回复条数，超出后按 LRU 淘汰
+RESPONSE_CACHE_TTL = 24 * 3600  # 缓存有效期（秒）
+RESPONSE_CACHE_AUDIO_DIR = "./TTS/res/cache"  # 缓存语音文件的目录
+RESPONSE_CACHE_SEMANTIC = False  # 是否启用向量相似度匹配（会为每个问题计算一次向量）
+RESPONSE_CACHE_SIMILARITY = 0.95  # 向量相似度匹配的阈值，越高越严格
+
+# --- 语音输入 ---
+AUDIO_SAMPLE_RATE = 24000  # 前端录音采样率，需与 .chainlit/config.toml 中 [features.audio] 的 sample_rate 一致
+VAD_ENERGY_THRESHOLD = 3500  # 判定为说话的最低 RMS 能量
+VAD_SILENCE_MS = 600  # 说话后静音持续多久（毫秒）判定为一句话结束
+VAD_MIN_SPEECH_MS = 200  # 有效语音的最短时长（毫秒），更短的视为噪声
+VAD_MAX_UTTERANCE_S = 30  # 单句最长时长（秒），超过后强制切分
+ASR_MODEL_NAME = "base"  # Whisper 模型，CPU 上推荐 base 或 small
+ASR_LANGUAGE = "zh"  # 识别语言
+ASR_WORKERS = 1  # 语音识别工作进程数，每个进程加载一份模型
+ASR_DEVICE = "cpu"  # 推理设备，有空闲显存时可设为 "cuda"
+ASR_THREADS_PER_WORKER = 0  # 每个识别进程的 torch 线程数，0 表示默认
@@ -0,0 +1,68 @@
+"""长期记忆离线去重
+
+把集合中内容相同或向量相似度不低于阈值的对话记录合并到最新的一条（累加出现次数、更新最近出现时间），
+删除其余记录，并为旧记录补上内容指纹。去重前请先停止应用，或先用 --dry-run 查看效果。
+
+用法:
+    python dedup_memory.py --all --dry-run
+    python dedup_memory.py --all
+    python dedup_memory.py --collection chat_history --similarity 0.9
+"""
+import argparse
+import logging
+import sys
+
+from config import CHAT_MEMORY_DIR, MEMORY_DEDUP_SIMILARITY
+from memory.chat_memory import BACKUP_MARKER, REBUILD_SUFFIX, collection_names, dedup_collection
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="长期记忆离线去重")
+    parser.add_argument("--persist-directory", default=CHAT_MEMORY_DIR, help="向量数据库存储目录")
+    parser.add_argument("--collection", action="append", help="要去重的集合，可重复指定")
+    parser.add_argument("--all", action="store_true", help="处理全部集合（包括各用户分区）")
+    parser.add_argument("--similarity", type=float, default=MEMORY_DEDUP_SIMILARITY or 1.0,
+                        help="相似度阈值，1.0 表示只合并内容完全相同的记录")
+    parser.add_argument("--neighbors", type=int, default=10, help="每条记录检查的近邻数")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不修改数据")
+    args = parser.parse_args()
+
+    import chromadb
+
+    client = chromadb.PersistentClient(path=args.persist_directory)
+    if args.all:
+        names = [n for n in collection_names(client)
+                 if BACKUP_MARKER not in n and not n.endswith(REBUILD_SUFFIX)]
+    else:
+        names = args.collection or []
+    if not names:
+        logger.error("请用 --collection 指定集合，或用 --all 处理全部集合")
+        sys.exit(1)
+
+    total = removed = 0
+    for name in names:
+        collection = client.get_collection(name, embedding_function=None)
+        stats = dedup_collection(
+            collection,
+            similarity=args.similarity,
+            batch_size=args.batch_size,
+            neighbors=args.neighbors,
+            dry_run=args.dry_run,
+        )
+        total += stats["total"]
+        removed += stats["removed"]
+        logger.info("%s: %d 条记录，%s %d 条重复，保留 %d 条", name, stats["total"],
+                    "可合并" if args.dry_run else "已合并", stats["removed"], stats["kept"])
+
+    ratio = removed / total * 100 if total else 0
+    logger.info("完成: 共 %d 条记录，%s %d 条 (%.1f%%)%s", total,
+                "可合并" if args.dry_run else "已合并", removed, ratio,
+                "，未修改数据 (--dry-run)" if args.dry_run else "")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""微调数据集构建：从微信聊天记录导出生成对话格式的训练/验证数据，用法见 build_finetune_dataset.py"""
+import importlib
+
+_EXPORTS = {
+    'BuildOptions': '.dataset_builder',
+    'build_dataset': '.dataset_builder',
+    'iter_json_records': '.wechat_reader',
+    'iter_text_messages': '.wechat_reader',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,324 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from prompts.data_cleaner import DataCleaner
+from .wechat_reader import iter_text_messages
+
+logger = logging.getLogger(__name__)
+
+_cleaner: Optional[DataCleaner] = None
+
+
+def _get_cleaner() -> DataCleaner:
+    # 每个工作进程创建一次
+    global _cleaner
+    if _cleaner is None:
+        _cleaner = DataCleaner()
+    return _cleaner
+
+
+class BuildOptions:
+    """数据集构建参数"""
+
+    def __init__(self,
+                 turn_gap: float = 120,
+                 session_gap: float = 3600,
+                 max_context_turns: int = 6,
+                 min_reply_chars: int = 2,
+                 max_reply_chars: int = 500,
+                 system_prompt: str = "",
+                 redact: bool = True,
+                 include_groups: bool = False):
+        """初始化构建参数
+
+        Args:
+            turn_gap: 同一人连续发送的消息间隔不超过该值（秒）时合并为一轮
+            session_gap: 两条消息间隔超过该值（秒）时视为新的对话，上下文不跨对话
+            max_context_turns: 每条样本最多携带的上文轮数（含本轮的对方发言）
+            min_reply_chars: 回复少于该字数的样本丢弃（例如 "嗯"）
+            max_reply_chars: 回复多于该字数的样本丢弃
+            system_prompt: 每条样本的 system 消息，为空时不添加
+            redact: 是否对所有内容做敏感信息脱敏
+            include_groups: 是否处理群聊（路径中包含 @chatroom）
+        """
+        self.turn_gap = turn_gap
+        self.session_gap = session_gap
+        self.max_context_turns = max_context_turns
+        self.min_reply_chars = min_reply_chars
+        self.max_reply_chars = max_reply_chars
+        self.system_prompt = system_prompt
+        self.redact = redact
+        self.include_groups = include_groups
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+
+def group_turns(messages: Iterable[Dict[str, Any]], turn_gap: float, session_gap: float
+                ) -> Iterator[Tuple[int, int, str]]:
+    """把连续的同一人消息合并为对话轮次
+
+    Args:
+        messages: 按时间顺序的文本消息
+        turn_gap: 合并为同一轮的最大间隔（秒）
+        session_gap: 超过该间隔视为新的对话（秒）
+
+    Yields:
+        Tuple[int, int, str]: (对话序号, is_sender, 本轮内容)
+    """
+    session = 0
+    speaker: Optional[int] = None
+    parts: List[str] = []
+    last_time: Optional[float] = None
+    for msg in messages:
+        ts = msg['timestamp']
+        gap = ts - last_time if ts is not None and last_time is not None else 0
+        if parts and (msg['is_sender'] != speaker or gap > turn_gap or gap > session_gap):
+            yield session, speaker, "\n".join(parts)
+            parts = []
+        if gap > session_gap:
+            session += 1
+        speaker = msg['is_sender']
+        parts.append(msg['content'])
+        if ts is not None:
+            last_time = ts
+    if parts:
+        yield session, speaker, "\n".join(parts)
+
+
+def build_samples(turns: Iterable[Tuple[int, int, str]], options: BuildOptions
+                  ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """由对话轮次生成对话格式的样本：对方的发言作为 user，本人 (is_sender == 1) 的回复作为 assistant
+
+    只保留最近 max_context_turns 轮上文，内存占用与对话长度无关。
+
+    Yields:
+        Tuple[int, Dict[str, Any]]: (对话序号, {"messages": [...]})
+    """
+    context: Deque[Tuple[int, str]] = deque(maxlen=max(options.max_context_turns, 1))
+    current_session = None
+    for session, is_sender, content in turns:
+        if session != current_session:
+            context.clear()
+            current_session = session
+        if options.redact:
+            content = _get_cleaner().redact(content)
+
+        # 本人的回复，且上一轮是对方的发言时生成一条样本
+        if is_sender == 1 and context and context[-1][0] == 0 \
+                and options.min_reply_chars <= len(content) <= options.max_reply_chars:
+            history = list(context)
+            while history and history[0][0] == 1:  # 上文必须以对方的发言开始
+                history.pop(0)
+            messages = []
+            if options.system_prompt:
+                messages.append({"role": "system", "content": options.system_prompt})
+            # 同一人间隔较久的发言是不同的轮次，写入样本时合并，保证 user / assistant 交替出现
+            for sender, text in history:
+                role = "assistant" if sender == 1 else "user"
+                if messages and messages[-1]["role"] == role:
+                    messages[-1]["content"] += "\n" + text
+                else:
+                    messages.append({"role": role, "content": text})
+            messages.append({"role": "assistant", "content": content})
+            yield session, {"messages": messages}
+        context.append((is_sender, content))
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", "", text).lower()
+
+
+def sample_hash(sample: Dict[str, Any]) -> str:
+    """去重用的样本指纹：最后一轮对方发言与回复相同的样本视为重复（例如反复出现的寒暄）"""
+    messages = sample["messages"]
+    key = _normalize(messages[-2]["content"]) + "\0" + _normalize(messages[-1]["content"])
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def process_file(path: str, root: str, tmp_dir: str, options: BuildOptions) -> Dict[str, Any]:
+    """处理单个导出文件（在工作进程中运行），样本写入临时文件
+
+    Returns:
+        Dict[str, Any]: 临时文件路径和统计信息
+    """
+    relative = os.path.relpath(path, root)
+    out_path = os.path.join(tmp_dir, hashlib.sha1(relative.encode("utf-8")).hexdigest() + ".jsonl")
+    stats = {"file": relative, "path": out_path, "messages": 0, "samples": 0, "error": None}
+
+    def counted():
+        for msg in iter_text_messages(path):
+            stats["messages"] += 1
+            yield msg
+
+    try:
+        with open(out_path, 'w', encoding='utf-8') as out:
+            turns = group_turns(counted(), options.turn_gap, options.session_gap)
+            for session, sample in build_samples(turns, options):
+                record = {
+                    "conversation": f"{relative}#{session}",  # 划分训练/验证集的单位
+                    "hash": sample_hash(sample),
+                    "sample": sample,
+                }
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                stats["samples"] += 1
+    except Exception as e:
+        stats["error"] = str(e)
+    return stats
+
+
+class ShardWriter:
+    """按条数切分、gzip 压缩的 JSONL 写入器"""
+
+    def __init__(self, output_dir: str, split: str, shard_size: int, compress_level: int = 6):
+        self.output_dir = output_dir
+        self.split = split
+        self.shard_size = shard_size
+        self.compress_level = compress_level
+        self.shards: List[Dict[str, Any]] = []
+        self.count = 0
+        self._file = None
+        self._in_shard = 0
+
+    def write(self, sample: Dict[str, Any]) -> None:
+        if self._file is None or self._in_shard >= self.shard_size:
+            self._open_next()
+        self._file.write(json.dumps(sample, ensure_ascii=False) + "\n")
+        self._in_shard += 1
+        self.shards[-1]["samples"] += 1
+        self.count += 1
+
+    def _open_next(self) -> None:
+        self.close()
+        name = f"{self.split}-{len(self.shards):05d}.jsonl.gz"
+        self._file = gzip.open(os.path.join(self.output_dir, name), 'wt',
+                               encoding='utf-8', compresslevel=self.compress_level)
+        self._in_shard = 0
+        self.shards.append({"file": name, "samples": 0})
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def is_val_conversation(conversation: str, val_ratio: float, seed: str) -> bool:
+    """按对话的哈希划分验证集，结果与处理顺序无关，同一对话的样本不会同时出现在两个集合中"""
+    digest = hashlib.sha1(f"{seed}:{conversation}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64 < val_ratio
+
+
+def find_export_files(input_dir: str, include_groups: bool = False) -> List[str]:
+    """查找导出的 JSON 文件，按大小从大到小排序，让大文件先开始处理"""
+    root = Path(input_dir)
+    if not root.exists():
+        raise FileNotFoundError(f"聊天记录目录不存在: {input_dir}")
+    files = [
+        p for p in root.glob("**/*")
+        if p.is_file() and p.suffix.lower() in (".json", ".jsonl")
+        and (include_groups or "@chatroom" not in str(p.relative_to(root)))
+    ]
+    return [str(p) for p in sorted(files, key=lambda p: p.stat().st_size, reverse=True)]
+
+
+def build_dataset(input_dir: str,
+                  output_dir: str,
+                  options: Optional[BuildOptions] = None,
+                  val_ratio: float = 0.05,
+                  shard_size: int = 50000,
+                  workers: int = 0,
+                  seed: str = "0",
+                  dedup: bool = True) -> Dict[str, Any]:
+    """从微信聊天记录导出构建微调数据集
+
+    各文件在多个进程中并行解析和生成样本，结果先写入临时文件；主进程再逐条读取、
+    按指纹去重、按对话划分训练/验证集，写入分片压缩的 JSONL。
+    内存占用与导出总大小无关，只有去重指纹（每条样本 16 个字符）会随样本数增长。
+
+    Args:
+        input_dir: 导出目录（例如 train_data/wechat）
+        output_dir: 输出目录
+        options: 构建参数
+        val_ratio: 验证集比例（按对话划分）
+        shard_size: 每个分片的样本数
+        workers: 进程数，0 表示使用 CPU 核数
+        seed: 划分训练/验证集的随机种子
+        dedup: 是否去重
+
+    Returns:
+        Dict[str, Any]: 数据集清单（同时写入 output_dir/manifest.json）
+    """
+    options = options or BuildOptions()
+    start = time.perf_counter()
+    files = find_export_files(input_dir, options.include_groups)
+    if not files:
+        raise ValueError(f"没有找到任何聊天记录文件: {input_dir}")
+    os.makedirs(output_dir, exist_ok=True)
+    # 删除上次构建留下的分片，避免分片数变少时残留旧数据
+    for old in Path(output_dir).glob("*.jsonl.gz"):
+        if old.name.startswith(("train-", "val-")):
+            old.unlink()
+    workers = workers or os.cpu_count() or 1
+
+    writers = {
+        "train": ShardWriter(output_dir, "train", shard_size),
+        "val": ShardWriter(output_dir, "val", shard_size),
+    }
+    seen = set()
+    totals = {"files": len(files), "failed_files": 0, "messages": 0, "samples": 0, "duplicates": 0}
+    tmp_dir = tempfile.mkdtemp(prefix="finetune_", dir=output_dir)
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(files))) as executor:
+            futures = [executor.submit(process_file, path, input_dir, tmp_dir, options) for path in files]
+            # 按提交顺序合并，保证同样的输入得到同样的输出
+            for done, future in enumerate(futures, 1):
+                stats = future.result()
+                if stats["error"]:
+                    totals["failed_files"] += 1
+                    logger.error("处理文件 %s 时出错: %s", stats["file"], stats["error"])
+                totals["messages"] += stats["messages"]
+                with open(stats["path"], 'r', encoding='utf-8') as f:
+                    for line in f:
+                        record = json.loads(line)
+                        totals["samples"] += 1
+                        if dedup:
+                            if record["hash"] in seen:
+                                totals["duplicates"] += 1
+                                continue
+                            seen.add(record["hash"])
+                        split = "val" if is_val_conversation(record["conversation"], val_ratio, seed) else "train"
+                        writers[split].write(record["sample"])
+                os.remove(stats["path"])
+                logger.info("[%d/%d] %s: %d 条消息, %d 条样本",
+                            done, len(files), stats["file"], stats["messages"], stats["samples"])
+    finally:
+        for writer in writers.values():
+            writer.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    manifest = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "input_dir": input_dir,
+        "format": "chat-jsonl-gzip",
+        "options": options.as_dict(),
+        "val_ratio": val_ratio,
+        "seed": seed,
+        "dedup": dedup,
+        "stats": totals,
+        "splits": {name: {"samples": w.count, "shards": w.shards} for name, w in writers.items()},
+        "elapsed_s": round(time.perf_counter() - start, 2),
+    }
+    with open(os.path.join(output_dir, "manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    return manifest
@@ -0,0 +1,100 @@
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\r\n,"
+
+
+def iter_json_records(path: str, chunk_size: int = 1 << 20) -> Iterator[Dict[str, Any]]:
+    """流式读取 JSON 数组（或 JSONL）文件中的记录，内存占用与单条记录大小相关，与文件大小无关
+
+    Args:
+        path: 文件路径
+        chunk_size: 每次读取的字符数
+
+    Yields:
+        Dict[str, Any]: 数组中的每个对象
+    """
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        buffer = ""
+        pos = 0
+        eof = False
+        started = False
+
+        def read_more() -> None:
+            # 丢弃已解析的部分后追加新内容，避免每解析一条记录都复制整个缓冲区
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+
+        while True:
+            # 跳过分隔符和空白
+            while True:
+                while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                read_more()
+            if pos >= len(buffer):
+                return
+            if not started:
+                started = True
+                if buffer[pos] == "[":  # JSON 数组，逐个解析其中的元素
+                    pos += 1
+                    continue
+            if buffer[pos] == "]":
+                return
+
+            try:
+                record, end = _DECODER.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                read_more()
+                continue
+            pos = end
+            if isinstance(record, dict):
+                yield record
+
+
+def _parse_time(msg: Dict[str, Any]) -> Optional[float]:
+    """消息时间（秒），兼容 timestamp（秒或毫秒）和 CreateTime（时间戳或 "%Y-%m-%d %H:%M:%S"）"""
+    for key in ("timestamp", "CreateTime", "create_time"):
+        value = msg.get(key)
+        if value in (None, ""):
+            continue
+        if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+            value = float(value)
+            return value / 1000 if value > 1e11 else value
+        if isinstance(value, str):
+            try:
+                return time.mktime(datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timetuple())
+            except ValueError:
+                continue
+    return None
+
+
+def iter_text_messages(path: str) -> Iterator[Dict[str, Any]]:
+    """读取导出文件中的文本消息
+
+    Yields:
+        Dict[str, Any]: {'content', 'is_sender', 'timestamp', 'talker'}，按文件中的顺序
+    """
+    for msg in iter_json_records(path):
+        if msg.get('type_name') != '文本':  # 只处理文本类型的消息
+            continue
+        content = (msg.get('msg') or '').strip()
+        if not content:
+            continue
+        yield {
+            'content': content,
+            'is_sender': 1 if msg.get('is_sender') in (1, '1', True) else 0,
+            'timestamp': _parse_time(msg),
+            'talker': msg.get('talker', ''),
+        }
@@ -0,0 +1,121 @@
+"""导入耗时报告
+
+在独立的子进程中用 `python -X importtime` 导入指定模块，统计总耗时和耗时最多的顶层包，
+并可设置预算，超出预算时以非零状态码退出（可用于 CI 检查冷启动回归）。
+
+用法:
+    python import_time_report.py                      # 分析 app.py
+    python import_time_report.py -m process_chat_data --top 15
+    python import_time_report.py --budget-ms 1500 --repeat 3 --json report.json
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_LINE_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def run_import(module: str) -> Tuple[float, List[Tuple[int, int, int, str]]]:
+    """在子进程中导入模块并收集 importtime 输出
+
+    Returns:
+        Tuple[float, List]: (子进程总耗时毫秒, [(self_us, cumulative_us, 缩进层级, 模块名), ...])
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="0")
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        errors = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(f"导入 {module} 失败:\n" + "\n".join(errors[-20:]))
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        match = _LINE_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((int(self_us), int(cumulative_us), len(indent) // 2, name))
+    return wall_ms, entries
+
+
+def summarize(entries: List[Tuple[int, int, int, str]]) -> Dict[str, float]:
+    """按顶层包汇总各模块自身的导入耗时（毫秒），自身耗时相加不会重复计算"""
+    per_package: Dict[str, float] = defaultdict(float)
+    for self_us, _, _, name in entries:
+        per_package[name.split('.')[0]] += self_us / 1000
+    return dict(per_package)
+
+
+def module_import_ms(entries: List[Tuple[int, int, int, str]], module: str) -> float:
+    """目标模块的累计导入耗时（毫秒），不含解释器启动时导入的模块"""
+    for _, cumulative_us, level, name in reversed(entries):
+        if level == 0 and name == module:
+            return cumulative_us / 1000
+    return sum(cumulative_us for _, cumulative_us, level, _ in entries if level == 0) / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="统计模块导入耗时")
+    parser.add_argument("-m", "--module", default="app", help="要分析的模块，默认 app")
+    parser.add_argument("--top", type=int, default=10, help="显示耗时最多的前 N 个顶层包")
+    parser.add_argument("--repeat", type=int, default=1, help="重复次数，取中位数")
+    parser.add_argument("--budget-ms", type=float, default=None, help="导入耗时预算（毫秒）")
+    parser.add_argument("--json", dest="json_path", default=None, help="把报告写入 JSON 文件")
+    args = parser.parse_args()
+
+    runs = []
+    for i in range(max(1, args.repeat)):
+        wall_ms, entries = run_import(args.module)
+        import_ms = module_import_ms(entries, args.module)
+        runs.append((wall_ms, import_ms, entries))
+        logger.info("第 %d 次: 导入 %.1f ms, 进程总耗时 %.1f ms", i + 1, import_ms, wall_ms)
+
+    median_import = statistics.median(r[1] for r in runs)
+    median_wall = statistics.median(r[0] for r in runs)
+    # 用导入耗时处于中位数的那次运行来展示明细
+    _, _, entries = min(runs, key=lambda r: abs(r[1] - median_import))
+    packages = sorted(summarize(entries).items(), key=lambda kv: kv[1], reverse=True)
+
+    print(f"\n模块: {args.module}")
+    print(f"导入耗时 (中位数): {median_import:.1f} ms")
+    print(f"进程总耗时 (中位数，含解释器启动): {median_wall:.1f} ms")
+    print(f"\n耗时最多的 {args.top} 个顶层包:")
+    for name, ms in packages[:args.top]:
+        print(f"  {ms:10.1f} ms  {name}")
+
+    report = {
+        "module": args.module,
+        "python": sys.version.split()[0],
+        "import_ms": round(median_import, 1),
+        "wall_ms": round(median_wall, 1),
+        "packages": {name: round(ms, 1) for name, ms in packages},
+        "budget_ms": args.budget_ms,
+    }
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        logger.info("报告已保存到: %s", args.json_path)
+
+    if args.budget_ms is not None and median_import > args.budget_ms:
+        logger.error("导入耗时 %.1f ms 超出预算 %.1f ms", median_import, args.budget_ms)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
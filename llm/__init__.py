@@ -0,0 +1,8 @@
+from .client import LazyOllama
+from .coalescer import TokenCoalescer
+from .router import OllamaRouter, RoutedLLM
+from .scheduler import LLMScheduler, SchedulerTimeout
+from .thinking import ReasoningMetrics, ReasoningPolicy, ThinkStreamParser, TurnStats, stream_with_reasoning
+
+__all__ = ['LazyOllama', 'OllamaRouter', 'RoutedLLM', 'LLMScheduler', 'SchedulerTimeout', 'TokenCoalescer',
+           'ReasoningMetrics', 'ReasoningPolicy', 'ThinkStreamParser', 'TurnStats', 'stream_with_reasoning']
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+from typing import Any, AsyncIterator
+
+
+class LazyOllama:
+    """Ollama LLM 的轻量封装：首次调用时才导入 langchain 并创建客户端
+
+    langchain_community 的导入耗时较长，放到首次生成时进行，可以缩短应用冷启动和热重载时间。
+    """
+
+    def __init__(self, model: str, base_url: str, **kwargs: Any):
+        self.model = model
+        self.base_url = base_url
+        self.kwargs = kwargs
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """底层的 langchain Ollama 客户端"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from langchain_community.llms import Ollama
+
+                    self._client = Ollama(model=self.model, base_url=self.base_url, **self.kwargs)
+        return self._client
+
+    async def prepare(self) -> None:
+        """在线程中提前创建客户端，可与检索等步骤并行，首次生成时不再阻塞事件循环"""
+        if self._client is None:
+            await asyncio.to_thread(lambda: self.client)
+
+    def astream(self, prompt: str, **kwargs: Any) -> AsyncIterator[str]:
+        """流式生成"""
+        return self.client.astream(prompt, **kwargs)
+
+    def invoke(self, prompt: str, **kwargs: Any) -> str:
+        """同步生成完整回复"""
+        return self.client.invoke(prompt, **kwargs)
+
+    async def ainvoke(self, prompt: str, **kwargs: Any) -> str:
+        """异步生成完整回复"""
+        return await self.client.ainvoke(prompt, **kwargs)
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 遇到这些字符结尾的片段立即发送，让整句尽快显示
+SENTENCE_ENDS = "。！？!?；;…\n"
+
+
+class TokenCoalescer:
+    """把流式输出的 token 合并后再发送到界面
+
+    逐 token 调用 stream_token 时每个 token 都是一帧 websocket 消息，会话多时服务端主要在做消息封装。
+    合并后在以下时机发送一次：缓冲区中最早的 token 等待超过时间窗口、缓冲内容达到字数上限、
+    片段以句末标点或换行结尾，以及流结束时。第一个 token 立即发送，不增加首字延迟。
+    """
+
+    def __init__(self,
+                 sink: Callable[[str], Awaitable[Any]],
+                 window_ms: float = 40,
+                 max_chars: int = 64,
+                 sentence_ends: str = SENTENCE_ENDS):
+        """初始化合并器
+
+        Args:
+            sink: 发送一段文本的协程函数，例如 message.stream_token
+            window_ms: 合并的时间窗口（毫秒），0 表示不合并、逐个发送
+            max_chars: 缓冲内容达到该字数时立即发送
+            sentence_ends: 片段以其中任一字符结尾时立即发送，为空时不按句子发送
+        """
+        self.sink = sink
+        self.window = window_ms / 1000
+        self.max_chars = max_chars
+        self.sentence_ends = sentence_ends
+        self._buffer: List[str] = []
+        self._size = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.stats: Dict[str, int] = {"tokens": 0, "flushes": 0}
+
+    async def push(self, text: str) -> None:
+        """写入一个 token，按需发送"""
+        if not text:
+            return
+        self.stats["tokens"] += 1
+        self._buffer.append(text)
+        self._size += len(text)
+        if (self.window <= 0
+                or self.stats["flushes"] == 0
+                or self._size >= self.max_chars
+                or self._ends_sentence(text)):
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._on_timer)
+
+    def _ends_sentence(self, text: str) -> bool:
+        tail = text.rstrip(" \t")[-1:]
+        return bool(tail) and tail in self.sentence_ends
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._timer_task = asyncio.get_running_loop().create_task(self.flush())
+        self._timer_task.add_done_callback(_log_failure)
+
+    async def flush(self) -> None:
+        """立即发送缓冲区中的内容"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        text = "".join(self._buffer)
+        self._buffer.clear()
+        self._size = 0
+        self.stats["flushes"] += 1
+        # 取出缓冲区后立即排队加锁（asyncio.Lock 按先来后到），保证各段按顺序发送
+        async with self._lock:
+            await self.sink(text)
+
+    async def aclose(self) -> None:
+        """发送剩余内容，并等待定时发送完成"""
+        await self.flush()
+        if self._timer_task is not None and not self._timer_task.done():
+            await self._timer_task
+
+    def cancel(self) -> None:
+        """丢弃未发送的内容（本轮被取消时使用）"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._buffer.clear()
+        self._size = 0
+
+    async def __aenter__(self) -> "TokenCoalescer":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None and issubclass(exc_type, asyncio.CancelledError):
+            self.cancel()
+        else:
+            await self.aclose()
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("发送合并的流式内容失败: %s", str(task.exception()))
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .client import LazyOllama
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaEndpoint:
+    """单个 Ollama 节点的状态"""
+
+    __slots__ = ("base_url", "llm", "healthy", "model_available", "model_loaded",
+                 "outstanding", "failures", "last_check", "latency_ms")
+
+    def __init__(self, base_url: str, llm: LazyOllama):
+        self.base_url = base_url.rstrip("/")
+        self.llm = llm
+        self.healthy = True  # 首次探测前视为可用
+        self.model_available = True
+        self.model_loaded = False
+        self.outstanding = 0
+        self.failures = 0
+        self.last_check = 0.0
+        self.latency_ms = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "model_available": self.model_available,
+            "model_loaded": self.model_loaded,
+            "outstanding": self.outstanding,
+            "failures": self.failures,
+            "latency_ms": round(self.latency_ms, 1),
+        }
+
+
+class OllamaRouter:
+    """多个 Ollama 节点之间的负载均衡
+
+    - 定期探测每个节点是否在线、模型是否存在以及是否已加载到显存
+    - 按未完成请求数最少的原则选择节点，同一会话尽量固定在同一节点，以复用节点上的 KV/前缀缓存
+    - 请求在收到第一个 token 之前失败时，自动切换到其他节点重试
+    """
+
+    def __init__(self,
+                 base_urls: List[str],
+                 model: str,
+                 health_interval: float = 10.0,
+                 probe_timeout: float = 3.0,
+                 affinity_slack: int = 2,
+                 max_affinity_entries: int = 10000,
+                 **llm_kwargs: Any):
+        """初始化路由
+
+        Args:
+            base_urls: Ollama 节点地址列表
+            model: 模型名称
+            health_interval: 健康检查间隔（秒）
+            probe_timeout: 单次探测的超时时间（秒）
+            affinity_slack: 会话绑定的节点比最空闲节点多出的请求数不超过该值时，继续使用绑定节点
+            max_affinity_entries: 最多记录的会话绑定数
+            llm_kwargs: 传给 Ollama 客户端的其他参数
+        """
+        if not base_urls:
+            raise ValueError("至少需要配置一个 Ollama 节点")
+        self.model = model
+        self.health_interval = health_interval
+        self.probe_timeout = probe_timeout
+        self.affinity_slack = affinity_slack
+        self.max_affinity_entries = max_affinity_entries
+        self.endpoints = [
+            OllamaEndpoint(url, LazyOllama(model=model, base_url=url, **llm_kwargs))
+            for url in base_urls
+        ]
+        self._affinity: "OrderedDict[str, OllamaEndpoint]" = OrderedDict()
+        self._health_task: Optional[asyncio.Task] = None
+
+    def _ensure_health_task(self) -> None:
+        if self._health_task is None or self._health_task.done():
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            self._health_task = loop.create_task(self._health_loop())
+
+    async def _health_loop(self) -> None:
+        while True:
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.error("Ollama 健康检查出错: %s", str(e))
+            await asyncio.sleep(self.health_interval)
+
+    async def check_health(self) -> List[Dict[str, Any]]:
+        """并发探测所有节点
+
+        Returns:
+            List[Dict[str, Any]]: 各节点的状态
+        """
+        import httpx
+
+        async with httpx.AsyncClient(timeout=self.probe_timeout) as client:
+            await asyncio.gather(*(self._probe(client, ep) for ep in self.endpoints))
+        return [ep.snapshot() for ep in self.endpoints]
+
+    async def _probe(self, client, endpoint: OllamaEndpoint) -> None:
+        start = time.perf_counter()
+        try:
+            tags = (await client.get(f"{endpoint.base_url}/api/tags")).raise_for_status().json()
+            running = (await client.get(f"{endpoint.base_url}/api/ps")).raise_for_status().json()
+        except Exception as e:
+            if endpoint.healthy:
+                logger.warning("Ollama 节点不可用 %s: %s", endpoint.base_url, str(e))
+            endpoint.healthy = False
+            endpoint.failures += 1
+            endpoint.last_check = time.time()
+            return
+
+        available = {m.get("name") for m in tags.get("models", [])}
+        loaded = {m.get("name") for m in running.get("models", [])}
+        endpoint.model_available = self._has_model(available)
+        endpoint.model_loaded = self._has_model(loaded)
+        if not endpoint.healthy and endpoint.model_available:
+            logger.info("Ollama 节点恢复 %s", endpoint.base_url)
+        endpoint.healthy = endpoint.model_available
+        endpoint.latency_ms = (time.perf_counter() - start) * 1000
+        endpoint.last_check = time.time()
+
+    def _has_model(self, names: set) -> bool:
+        # Ollama 会把未指定标签的模型名补全为 ":latest"
+        return self.model in names or f"{self.model}:latest" in names
+
+    def pick(self, session_id: Optional[str] = None) -> OllamaEndpoint:
+        """为请求选择节点
+
+        Args:
+            session_id: 会话标识，用于会话亲和
+
+        Returns:
+            OllamaEndpoint: 选中的节点
+        """
+        self._ensure_health_task()
+        candidates = [ep for ep in self.endpoints if ep.healthy] or self.endpoints
+        # 优先选择未完成请求最少的节点；请求数相同时优先选择模型已加载的节点
+        best = min(candidates, key=lambda ep: (ep.outstanding, not ep.model_loaded))
+
+        if session_id is None:
+            return best
+        bound = self._affinity.get(session_id)
+        if bound is not None and bound in candidates \
+                and bound.outstanding <= best.outstanding + self.affinity_slack:
+            self._affinity.move_to_end(session_id)
+            return bound
+
+        self._affinity[session_id] = best
+        self._affinity.move_to_end(session_id)
+        while len(self._affinity) > self.max_affinity_entries:
+            self._affinity.popitem(last=False)
+        return best
+
+    async def prepare(self, session_id: Optional[str] = None) -> None:
+        """提前创建该会话将要使用的节点的客户端"""
+        await self.pick(session_id).llm.prepare()
+
+    def _failover_order(self, first: OllamaEndpoint) -> List[OllamaEndpoint]:
+        others = sorted(
+            (ep for ep in self.endpoints if ep is not first),
+            key=lambda ep: (not ep.healthy, ep.outstanding),
+        )
+        return [first] + others
+
+    async def astream(self, prompt: str, session_id: Optional[str] = None, **kwargs: Any) -> AsyncIterator[str]:
+        """流式生成，收到第一个 token 前失败会切换节点重试
+
+        Args:
+            prompt: 提示词
+            session_id: 会话标识
+        """
+        last_error: Optional[Exception] = None
+        for endpoint in self._failover_order(self.pick(session_id)):
+            started = False
+            endpoint.outstanding += 1
+            try:
+                # 调用方关闭生成器（例如本轮对话被取消）时同时关闭到节点的连接
+                async with aclosing(endpoint.llm.astream(prompt, **kwargs)) as token_stream:
+                    async for token in token_stream:
+                        started = True
+                        yield token
+                endpoint.failures = 0
+                return
+            except Exception as e:
+                if started:
+                    raise
+                last_error = e
+                endpoint.healthy = False
+                endpoint.failures += 1
+                logger.warning("Ollama 节点 %s 请求失败，切换节点重试: %s", endpoint.base_url, str(e))
+                if session_id is not None:
+                    self._affinity.pop(session_id, None)
+            finally:
+                endpoint.outstanding -= 1
+        raise RuntimeError(f"所有 Ollama 节点均不可用: {last_error}")
+
+    async def ainvoke(self, prompt: str, session_id: Optional[str] = None, **kwargs: Any) -> str:
+        """生成完整回复"""
+        return "".join([token async for token in self.astream(prompt, session_id=session_id, **kwargs)])
+
+    def for_session(self, session_id: str) -> "RoutedLLM":
+        """返回绑定了会话的 LLM，接口与 LazyOllama 一致"""
+        return RoutedLLM(self, session_id)
+
+    def status(self) -> List[Dict[str, Any]]:
+        """各节点的当前状态"""
+        return [ep.snapshot() for ep in self.endpoints]
+
+
+class RoutedLLM:
+    """绑定会话的路由 LLM，可以直接替换单节点的 LazyOllama 使用"""
+
+    def __init__(self, router: OllamaRouter, session_id: str):
+        self.router = router
+        self.session_id = session_id
+
+    async def prepare(self) -> None:
+        await self.router.prepare(self.session_id)
+
+    def astream(self, prompt: str, **kwargs: Any) -> AsyncIterator[str]:
+        return self.router.astream(prompt, session_id=self.session_id, **kwargs)
+
+    async def ainvoke(self, prompt: str, **kwargs: Any) -> str:
+        return await self.router.ainvoke(prompt, session_id=self.session_id, **kwargs)
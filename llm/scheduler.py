@@ -0,0 +1,202 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+
+class SchedulerTimeout(Exception):
+    """排队等待超时"""
+
+
+class _Ticket:
+    __slots__ = ("user_id", "cost", "finish_tag", "previous_finish", "seq", "wakeup", "granted", "cancelled")
+
+    def __init__(self, user_id: str, cost: float, finish_tag: float, previous_finish: Optional[float], seq: int):
+        self.user_id = user_id
+        self.cost = cost
+        self.finish_tag = finish_tag
+        self.previous_finish = previous_finish  # 入队前该用户的虚拟完成时间，未被放行就取消时恢复
+        self.seq = seq
+        self.wakeup = asyncio.Event()
+        self.granted = False
+        self.cancelled = False
+
+
+class LLMScheduler:
+    """LLM 生成请求的准入控制与公平调度
+
+    同一时间最多 max_concurrency 个生成请求访问模型，其余请求排队。
+    排队采用加权公平队列：每个用户拥有独立的虚拟时钟，请求的虚拟完成时间
+    = max(全局虚拟时间, 该用户上一个请求的完成时间) + 成本，按完成时间从小到大调度。
+    因此频繁发送请求的用户不会挤占其他用户，成本低（用户输入短）的请求优先执行。
+    成本按用户输入计算而不是完整提示词：角色设定和记忆是所有请求共有的部分，计入后各请求的成本几乎相同。
+    排队中被取消或超时的请求不占用该用户的虚拟时间，不影响其下一轮的排队。
+    """
+
+    def __init__(self,
+                 max_concurrency: int = 2,
+                 queue_timeout: float = 120.0,
+                 generation_timeout: float = 300.0,
+                 input_cost_chars: int = 200):
+        """初始化调度器
+
+        Args:
+            max_concurrency: 同时进行的生成请求数上限
+            queue_timeout: 排队等待的最长时间（秒）
+            generation_timeout: 单次生成的最长时间（秒），超时后取消生成
+            input_cost_chars: 每多少字符的用户输入计为一个成本单位
+        """
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.generation_timeout = generation_timeout
+        self.input_cost_chars = max(1, input_cost_chars)
+
+        self._running = 0
+        self._virtual_time = 0.0
+        self._user_finish: Dict[str, float] = {}
+        self._waiting: List[tuple] = []  # (finish_tag, seq, ticket) 小顶堆
+        self._seq = itertools.count()
+
+    @property
+    def running(self) -> int:
+        """正在生成的请求数"""
+        return self._running
+
+    @property
+    def waiting(self) -> int:
+        """排队中的请求数"""
+        return sum(1 for _, _, t in self._waiting if not t.cancelled)
+
+    def _cost(self, input_chars: int) -> float:
+        return 1.0 + input_chars / self.input_cost_chars
+
+    def _position(self, ticket: _Ticket) -> int:
+        """排在该请求之前的请求数"""
+        return sum(
+            1 for finish_tag, seq, t in self._waiting
+            if not t.cancelled and (finish_tag, seq) < (ticket.finish_tag, ticket.seq)
+        )
+
+    def _notify_waiters(self) -> None:
+        for _, _, t in self._waiting:
+            if not t.cancelled:
+                t.wakeup.set()
+
+    def _dispatch(self) -> None:
+        """在有空闲名额时按虚拟完成时间依次放行排队的请求"""
+        while self._running < self.max_concurrency and self._waiting:
+            _, _, ticket = heapq.heappop(self._waiting)
+            if ticket.cancelled:
+                continue
+            ticket.granted = True
+            self._running += 1
+            self._virtual_time = max(self._virtual_time, ticket.finish_tag - ticket.cost)
+            ticket.wakeup.set()
+        self._notify_waiters()
+        if len(self._user_finish) > 1024:
+            # 清理已经没有排队请求的用户，避免虚拟时钟表无限增长
+            self._user_finish = {
+                user_id: finish for user_id, finish in self._user_finish.items()
+                if finish > self._virtual_time
+            }
+
+    def _enqueue(self, user_id: str, input_chars: int) -> _Ticket:
+        cost = self._cost(input_chars)
+        previous_finish = self._user_finish.get(user_id)
+        start_tag = max(self._virtual_time, previous_finish or 0.0)
+        ticket = _Ticket(user_id, cost, start_tag + cost, previous_finish, next(self._seq))
+        self._user_finish[user_id] = ticket.finish_tag
+        heapq.heappush(self._waiting, (ticket.finish_tag, ticket.seq, ticket))
+        return ticket
+
+    def _withdraw(self, ticket: _Ticket) -> None:
+        """撤回未被放行的请求，恢复该用户的虚拟完成时间（其后没有再入队的请求时）"""
+        ticket.cancelled = True
+        if self._user_finish.get(ticket.user_id) == ticket.finish_tag:
+            if ticket.previous_finish is None:
+                del self._user_finish[ticket.user_id]
+            else:
+                self._user_finish[ticket.user_id] = ticket.previous_finish
+        self._notify_waiters()
+
+    def _release(self) -> None:
+        self._running -= 1
+        self._dispatch()
+
+    async def _wait_for_turn(self, ticket: _Ticket, on_position: Optional[PositionCallback]) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        last_position = None
+        while not ticket.granted:
+            ticket.wakeup.clear()
+            position = self._position(ticket)
+            if on_position is not None and position != last_position:
+                last_position = position
+                await on_position(position)
+                if ticket.granted:
+                    break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise SchedulerTimeout(f"排队超过 {self.queue_timeout} 秒")
+            try:
+                await asyncio.wait_for(ticket.wakeup.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                if not ticket.granted:
+                    raise SchedulerTimeout(f"排队超过 {self.queue_timeout} 秒")
+
+    @asynccontextmanager
+    async def slot(self,
+                   user_id: str,
+                   input_chars: int = 0,
+                   on_position: Optional[PositionCallback] = None):
+        """获取一个生成名额，退出上下文时释放
+
+        Args:
+            user_id: 用户标识，用于公平调度
+            input_chars: 用户输入的长度（不含角色设定、记忆等所有请求共有的部分），决定调度成本
+            on_position: 排队位置变化时的回调，参数为前面的请求数
+
+        Raises:
+            SchedulerTimeout: 排队超时
+            asyncio.TimeoutError: 生成超过 generation_timeout
+        """
+        ticket = self._enqueue(user_id, input_chars)
+        self._dispatch()
+        try:
+            await self._wait_for_turn(ticket, on_position)
+        except BaseException:
+            # 排队超时或被取消：如果恰好已被放行则归还名额，否则撤回排队
+            if ticket.granted:
+                ticket.cancelled = True
+                self._release()
+            else:
+                self._withdraw(ticket)
+            raise
+
+        task = asyncio.current_task()
+        timed_out = False
+
+        def _on_timeout() -> None:
+            nonlocal timed_out
+            timed_out = True
+            task.cancel()
+
+        timer = asyncio.get_running_loop().call_later(self.generation_timeout, _on_timeout)
+        try:
+            yield
+        except asyncio.CancelledError:
+            if timed_out:
+                logger.warning("用户 %s 的生成超过 %s 秒，已取消", user_id, self.generation_timeout)
+                if hasattr(task, "uncancel"):
+                    task.uncancel()
+                raise asyncio.TimeoutError(f"生成超过 {self.generation_timeout} 秒")
+            raise
+        finally:
+            timer.cancel()
+            self._release()
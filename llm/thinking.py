@@ -0,0 +1,324 @@
+import logging
+import re
+import threading
+import time
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+THINK_START = "<think>"
+THINK_END = "</think>"
+
+# 流式解析产生的事件类型
+THINK = "think"
+REPLY = "reply"
+
+# 推理模式
+MODE_THINK = "think"
+MODE_NO_THINK = "no_think"
+
+
+class ThinkStreamParser:
+    """把模型的流式输出拆分为思考内容和回复内容
+
+    标签可能被拆到多个 token 中，只有缓冲区末尾可能是标签开头的部分会暂时保留，
+    其余内容立即产出，因此思考内容可以和回复一样实时显示。
+    """
+
+    def __init__(self):
+        self.in_think = False
+        self._buffer = ""
+
+    def feed(self, token: str) -> List[Tuple[str, str]]:
+        """处理一个 token
+
+        Args:
+            token: 模型输出的文本片段
+
+        Returns:
+            List[Tuple[str, str]]: (事件类型, 文本) 列表，事件类型为 THINK 或 REPLY
+        """
+        self._buffer += token
+        events: List[Tuple[str, str]] = []
+        while self._buffer:
+            tag = THINK_END if self.in_think else THINK_START
+            kind = THINK if self.in_think else REPLY
+            index = self._buffer.find(tag)
+            if index != -1:
+                if index:
+                    events.append((kind, self._buffer[:index]))
+                self._buffer = self._buffer[index + len(tag):]
+                self.in_think = not self.in_think
+                continue
+            # 保留末尾可能是标签开头的部分，等待后续 token
+            keep = _partial_tag_length(self._buffer, tag)
+            text = self._buffer[:len(self._buffer) - keep]
+            if text:
+                events.append((kind, text))
+            self._buffer = self._buffer[len(self._buffer) - keep:]
+            break
+        return events
+
+    def flush(self) -> List[Tuple[str, str]]:
+        """流结束时产出缓冲区中剩余的内容"""
+        if not self._buffer:
+            return []
+        events = [(THINK if self.in_think else REPLY, self._buffer)]
+        self._buffer = ""
+        return events
+
+    def force_reply(self) -> None:
+        """强制结束思考，之后的内容都视为回复（思考预算用完后重新发起请求时使用）"""
+        self.in_think = False
+        self._buffer = ""
+
+
+def _partial_tag_length(text: str, tag: str) -> int:
+    """text 末尾与 tag 开头重合的最大长度"""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+class ReasoningPlan:
+    """单轮对话的推理方式"""
+
+    __slots__ = ("mode", "think_budget", "reason")
+
+    def __init__(self, mode: str, think_budget: int = 0, reason: str = ""):
+        self.mode = mode
+        self.think_budget = think_budget  # 思考内容的 token 上限，0 表示不限制
+        self.reason = reason
+
+    def __repr__(self) -> str:
+        return f"ReasoningPlan(mode={self.mode!r}, think_budget={self.think_budget}, reason={self.reason!r})"
+
+
+class ReasoningPolicy:
+    """按轮次决定是否让模型思考以及思考的预算
+
+    - 简短的闲聊使用 Qwen3 的 /no_think 开关跳过思考，直接回答
+    - 需要思考时限制思考内容的 token 数，超出后截断思考，带着已有的思考内容重新请求，
+      让模型直接给出回答
+    """
+
+    def __init__(self,
+                 mode: str = "auto",
+                 no_think_max_chars: int = 20,
+                 think_keywords: Sequence[str] = (),
+                 think_token_budget: int = 0,
+                 no_think_switch: str = "/no_think",
+                 force_answer_template: str = "",
+                 force_answer_note: str = ""):
+        """初始化推理策略
+
+        Args:
+            mode: auto（按输入自动选择）、think（总是思考）或 no_think（从不思考）
+            no_think_max_chars: auto 模式下不超过该长度且不含思考关键词的输入走不思考的快速路径
+            think_keywords: 出现这些词时认为问题需要思考（例如 "为什么"、"怎么"）
+            think_token_budget: 思考内容的 token 上限，0 表示不限制
+            no_think_switch: 追加在提示词末尾的不思考开关
+            force_answer_template: 思考超出预算后重新请求使用的原始提示词模板（不经过 Ollama 的对话模板），
+                包含 {prompt} 和 {think} 两个占位符，为空时超出预算只截断显示，不重新请求
+            force_answer_note: 追加在截断的思考内容之后、</think> 之前的一句话，引导模型收尾
+        """
+        if mode not in ("auto", MODE_THINK, MODE_NO_THINK):
+            raise ValueError(f"未知的推理模式: {mode}")
+        self.mode = mode
+        self.no_think_max_chars = no_think_max_chars
+        self.think_keywords = tuple(think_keywords)
+        self.think_token_budget = think_token_budget
+        self.no_think_switch = no_think_switch
+        self.force_answer_template = force_answer_template
+        self.force_answer_note = force_answer_note
+
+    def plan(self, user_message: str) -> ReasoningPlan:
+        """为本轮对话选择推理方式
+
+        Args:
+            user_message: 用户输入
+
+        Returns:
+            ReasoningPlan: 推理方式
+        """
+        if self.mode == MODE_NO_THINK:
+            return ReasoningPlan(MODE_NO_THINK, reason="config")
+        if self.mode == MODE_THINK:
+            return ReasoningPlan(MODE_THINK, self.think_token_budget, reason="config")
+
+        text = re.sub(r"\s+", "", user_message)
+        if any(keyword in text for keyword in self.think_keywords):
+            return ReasoningPlan(MODE_THINK, self.think_token_budget, reason="keyword")
+        if len(text) > self.no_think_max_chars:
+            return ReasoningPlan(MODE_THINK, self.think_token_budget, reason="long")
+        return ReasoningPlan(MODE_NO_THINK, reason="short")
+
+    def apply(self, prompt: str, plan: ReasoningPlan) -> str:
+        """按推理方式修改提示词"""
+        if plan.mode == MODE_NO_THINK and self.no_think_switch:
+            return f"{prompt} {self.no_think_switch}"
+        return prompt
+
+    def force_answer_prompt(self, prompt: str, think: str) -> Optional[str]:
+        """思考超出预算后重新请求的原始提示词，未配置模板时返回 None"""
+        if not self.force_answer_template:
+            return None
+        think = think.strip()
+        if self.force_answer_note:
+            think = f"{think}\n\n{self.force_answer_note}" if think else self.force_answer_note
+        return self.force_answer_template.format(prompt=prompt, think=think)
+
+
+class TurnStats:
+    """单轮生成的统计"""
+
+    __slots__ = ("mode", "reason", "think_tokens", "reply_tokens", "budget_exceeded",
+                 "start", "first_think_at", "first_reply_at", "end")
+
+    def __init__(self, plan: ReasoningPlan):
+        self.mode = plan.mode
+        self.reason = plan.reason
+        self.think_tokens = 0
+        self.reply_tokens = 0
+        self.budget_exceeded = False
+        self.start = time.perf_counter()
+        self.first_think_at: Optional[float] = None
+        self.first_reply_at: Optional[float] = None
+        self.end: Optional[float] = None
+
+    def count(self, kind: str) -> None:
+        now = time.perf_counter()
+        if kind == THINK:
+            self.think_tokens += 1
+            if self.first_think_at is None:
+                self.first_think_at = now
+        else:
+            self.reply_tokens += 1
+            if self.first_reply_at is None:
+                self.first_reply_at = now
+
+    @property
+    def think_ms(self) -> float:
+        """从开始生成到第一个回复 token 的时间，主要是思考耗时"""
+        end = self.first_reply_at or self.end or time.perf_counter()
+        return (end - self.start) * 1000
+
+    @property
+    def total_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "reason": self.reason,
+            "think_tokens": self.think_tokens,
+            "reply_tokens": self.reply_tokens,
+            "budget_exceeded": self.budget_exceeded,
+            "think_ms": round(self.think_ms, 1),
+            "total_ms": round(self.total_ms, 1),
+        }
+
+
+class ReasoningMetrics:
+    """按推理模式累计思考与回复的 token 数和耗时，用于评估推理策略的效果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def record(self, stats: TurnStats) -> None:
+        with self._lock:
+            totals = self._totals.setdefault(stats.mode, {
+                "turns": 0, "think_tokens": 0, "reply_tokens": 0,
+                "budget_exceeded": 0, "think_ms": 0.0, "total_ms": 0.0,
+            })
+            totals["turns"] += 1
+            totals["think_tokens"] += stats.think_tokens
+            totals["reply_tokens"] += stats.reply_tokens
+            totals["budget_exceeded"] += int(stats.budget_exceeded)
+            totals["think_ms"] += stats.think_ms
+            totals["total_ms"] += stats.total_ms
+        logger.info("生成统计: %s", stats.as_dict())
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """各推理模式的累计值和平均值"""
+        with self._lock:
+            result = {}
+            for mode, totals in self._totals.items():
+                turns = max(totals["turns"], 1)
+                result[mode] = dict(totals)
+                result[mode].update({
+                    "avg_think_tokens": round(totals["think_tokens"] / turns, 1),
+                    "avg_reply_tokens": round(totals["reply_tokens"] / turns, 1),
+                    "avg_think_ms": round(totals["think_ms"] / turns, 1),
+                    "avg_total_ms": round(totals["total_ms"] / turns, 1),
+                })
+            return result
+
+
+async def stream_with_reasoning(llm: Any,
+                                prompt: str,
+                                policy: ReasoningPolicy,
+                                plan: ReasoningPlan,
+                                stats: Optional[TurnStats] = None) -> AsyncIterator[Tuple[str, str]]:
+    """按推理方式流式生成，产出 (事件类型, 文本)
+
+    思考内容超出预算时关闭当前生成流（停止模型继续思考），带着已有的思考内容以原始提示词
+    重新请求，模型会直接输出回答。未配置重新请求的模板时继续生成，但超出预算的思考内容不再产出。
+
+    Args:
+        llm: 提供 astream(prompt, **kwargs) 的 LLM（LazyOllama / RoutedLLM）
+        prompt: 提示词（未应用推理开关）
+        policy: 推理策略
+        plan: 本轮的推理方式
+        stats: 统计对象，为空时不统计
+    """
+    stats = stats or TurnStats(plan)
+    parser = ThinkStreamParser()
+    think_parts: List[str] = []
+    budget = plan.think_budget if plan.mode == MODE_THINK else 0
+    hide_think = False
+    forced_prompt: Optional[str] = None
+
+    async with aclosing(llm.astream(policy.apply(prompt, plan))) as token_stream:
+        async for token in token_stream:
+            if not token:
+                continue
+            events = parser.feed(token)
+            # 每个 token 按其主要内容计入思考或回复，只含标签片段的 token 不计入
+            if any(kind == REPLY for kind, _ in events):
+                stats.count(REPLY)
+            elif events or parser.in_think:
+                stats.count(THINK)
+            for kind, text in events:
+                if kind == THINK:
+                    if hide_think:
+                        continue
+                    think_parts.append(text)
+                yield kind, text
+
+            if budget and parser.in_think and not hide_think and stats.think_tokens >= budget:
+                stats.budget_exceeded = True
+                forced_prompt = policy.force_answer_prompt(prompt, "".join(think_parts))
+                if forced_prompt is not None:
+                    break
+                hide_think = True
+                yield THINK, "\n\n……（思考内容过长，已省略）"
+
+    if forced_prompt is not None:
+        logger.info("思考内容超出预算 (%d tokens)，截断并要求模型直接回答", budget)
+        parser.force_reply()
+        async with aclosing(llm.astream(forced_prompt, raw=True)) as token_stream:
+            async for token in token_stream:
+                if not token:
+                    continue
+                stats.count(REPLY)
+                for event in parser.feed(token):
+                    yield event
+
+    for kind, text in parser.flush():
+        if not (kind == THINK and hide_think):
+            yield kind, text
+    stats.end = time.perf_counter()
@@ -0,0 +1,184 @@
+"""压测工具
+
+模拟多个浏览器会话，通过 Chainlit 的 websocket 接口按脚本与应用对话，统计吞吐量、
+首个 token 延迟和完成耗时的百分位数、错误率以及每个会话带来的服务端内存增长。
+报告为 JSON，可与之前的报告对比，用于跟踪各版本的承载能力。
+
+用法:
+    # 1. 启动模拟 Ollama（不需要 GPU）
+    python load_test.py fake-ollama --port 11500 --ttft-ms 300 --tokens-per-s 30 --max-concurrency 4
+
+    # 2. 启动应用，指向模拟 Ollama 和模拟 TTS，并使用独立的向量数据库目录
+    OLLAMA_BASE_URLS=http://127.0.0.1:11500 TTS_BASE_URL="stub://?latency_ms=800" \\
+    CHAT_MEMORY_DIR=/tmp/loadtest_memory chainlit run app.py --headless --port 8000
+
+    # 3. 运行压测并保存报告
+    python load_test.py run --url http://127.0.0.1:8000 --sessions 50 --ramp-up 10 \\
+        --script loadtest/scripts/sample.jsonl --server-pid <应用进程 PID> --out reports/current.json
+
+    # 4. 与基准报告对比，存在回退时以非零状态码退出
+    python load_test.py compare reports/baseline.json reports/current.json --tolerance 0.1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from config import OLLAMA_MODEL_NAME
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def cmd_fake_ollama(args) -> None:
+    from loadtest.fake_ollama import serve
+
+    logger.info("模拟 Ollama 已启动: http://%s:%d (模型 %s)", args.host, args.port, args.model)
+    serve(
+        host=args.host,
+        port=args.port,
+        model=args.model,
+        ttft_ms=args.ttft_ms,
+        tokens_per_s=args.tokens_per_s,
+        reply_chars=args.reply_chars,
+        think_chars=args.think_chars,
+        max_concurrency=args.max_concurrency,
+    )
+
+
+def cmd_run(args) -> None:
+    from loadtest.report import format_comparison, compare
+    from loadtest.runner import file_sha1, git_commit, load_scripts, run_load
+
+    scripts = load_scripts(args.script)
+    logger.info("开始压测: %s, %d 个会话, %d 个脚本", args.url, args.sessions, len(scripts))
+    result = asyncio.run(run_load(
+        url=args.url,
+        scripts=scripts,
+        sessions=args.sessions,
+        ramp_up=args.ramp_up,
+        think_time=args.think_time,
+        think_jitter=args.think_jitter,
+        loops=args.loops,
+        duration=args.duration,
+        turn_timeout=args.turn_timeout,
+        cache_busting=not args.allow_cache,
+        ready_text=args.ready_text,
+        server_pid=args.server_pid,
+    ))
+
+    report = {
+        "meta": {
+            "label": args.label,
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "git_commit": git_commit(),
+            "url": args.url,
+            "sessions": args.sessions,
+            "ramp_up": args.ramp_up,
+            "think_time": args.think_time,
+            "loops": args.loops,
+            "duration": args.duration,
+            "cache_busting": not args.allow_cache,
+            "script": args.script,
+            "script_sha1": file_sha1(args.script),
+        },
+        "summary": result["summary"],
+        "server_memory": result["server_memory"],
+    }
+    if args.include_turns:
+        report["turns"] = result["turns"]
+
+    summary = report["summary"]
+    print(f"\n完成 {summary['completed']}/{summary['turns']} 轮, 错误率 {summary['error_rate'] * 100:.1f}% "
+          f"{summary['error_kinds'] or ''}")
+    print(f"吞吐量: {summary['throughput_turns_per_s']} 轮/秒, {summary['throughput_chars_per_s']} 字/秒")
+    for name in ("ttft_ms", "completion_ms", "connect_ms"):
+        dist = summary[name]
+        print(f"{name:<15} p50={dist['p50']} p90={dist['p90']} p95={dist['p95']} p99={dist['p99']} max={dist['max']}")
+    if report["server_memory"]:
+        mem = report["server_memory"]
+        print(f"服务端内存: {mem['rss_start_mb']} -> {mem['rss_end_mb']} MB (峰值 {mem['rss_peak_mb']} MB, "
+              f"每会话 {mem['growth_per_session_kb']} KB)")
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        logger.info("报告已保存到: %s", args.out)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows, regressed = compare(baseline, report, tolerance=args.tolerance)
+        print("\n" + format_comparison(rows))
+        if regressed:
+            sys.exit(1)
+
+
+def cmd_compare(args) -> None:
+    from loadtest.report import format_comparison, compare
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = json.load(f)
+    for key in ("sessions", "think_time", "script_sha1", "cache_busting"):
+        old, new = baseline.get("meta", {}).get(key), current.get("meta", {}).get(key)
+        if old != new:
+            logger.warning("两次压测的参数 %s 不同 (%s -> %s)，结果可能不可比", key, old, new)
+    rows, regressed = compare(baseline, current, tolerance=args.tolerance)
+    print(format_comparison(rows))
+    if regressed:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟多个并发会话压测 Chainlit 应用")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fake = subparsers.add_parser("fake-ollama", help="启动模拟 Ollama 服务")
+    fake.add_argument("--host", default="127.0.0.1")
+    fake.add_argument("--port", type=int, default=11500)
+    fake.add_argument("--model", default=OLLAMA_MODEL_NAME, help="模拟的模型名称")
+    fake.add_argument("--ttft-ms", type=float, default=300, help="首个 token 的延迟（毫秒）")
+    fake.add_argument("--tokens-per-s", type=float, default=30, help="每秒输出的 token 数")
+    fake.add_argument("--reply-chars", type=int, default=120, help="回复的字符数")
+    fake.add_argument("--think-chars", type=int, default=0, help="<think> 块的字符数")
+    fake.add_argument("--max-concurrency", type=int, default=0, help="同时生成的请求数上限，0 表示不限制")
+    fake.set_defaults(func=cmd_fake_ollama)
+
+    run = subparsers.add_parser("run", help="运行压测")
+    run.add_argument("--url", default="http://127.0.0.1:8000", help="Chainlit 应用地址")
+    run.add_argument("--script", default="loadtest/scripts/sample.jsonl", help="对话脚本 (JSONL)")
+    run.add_argument("--sessions", type=int, default=10, help="并发会话数")
+    run.add_argument("--ramp-up", type=float, default=0, help="在多长时间内（秒）逐步建立全部会话")
+    run.add_argument("--think-time", type=float, default=2.0, help="两轮之间的平均思考时间（秒）")
+    run.add_argument("--think-jitter", type=float, default=0.5, help="思考时间的随机波动比例")
+    run.add_argument("--loops", type=int, default=1, help="每个会话重复脚本的次数")
+    run.add_argument("--duration", type=float, default=None, help="压测最长时间（秒）")
+    run.add_argument("--turn-timeout", type=float, default=300, help="单轮对话的超时时间（秒）")
+    run.add_argument("--allow-cache", action="store_true", help="不加唯一标记，允许命中回复缓存")
+    run.add_argument("--ready-text", default="你好！", help="欢迎消息的开头，收到后才开始发送消息")
+    run.add_argument("--server-pid", type=int, default=None, help="应用进程 PID，用于统计内存增长")
+    run.add_argument("--label", default="", help="报告标签（例如版本号）")
+    run.add_argument("--out", default=None, help="把报告写入 JSON 文件")
+    run.add_argument("--include-turns", action="store_true", help="报告中包含每一轮的明细")
+    run.add_argument("--baseline", default=None, help="与该基准报告对比")
+    run.add_argument("--tolerance", type=float, default=0.1, help="允许的变差比例")
+    run.set_defaults(func=cmd_run)
+
+    cmp_parser = subparsers.add_parser("compare", help="对比两次压测报告")
+    cmp_parser.add_argument("baseline", help="基准报告")
+    cmp_parser.add_argument("current", help="本次报告")
+    cmp_parser.add_argument("--tolerance", type=float, default=0.1, help="允许的变差比例")
+    cmp_parser.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""压测工具：模拟多个 Chainlit 会话，并提供本地的模拟 Ollama 与 TTS，用法见 load_test.py"""
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import random
+import time
+from typing import Optional
+
+# 模拟回复使用的文本，按需重复到指定长度
+_REPLY_TEXT = "俺老孙今日心情甚好，你有什么想问的尽管说来，俺定当知无不言。"
+_THINK_TEXT = "用户在打招呼，我应该用角色的语气简短回应。"
+
+
+def _repeat_to(text: str, length: int) -> str:
+    if length <= 0:
+        return ""
+    return (text * (length // len(text) + 1))[:length]
+
+
+def _chunks(text: str, size: int):
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+def create_app(model: str,
+               ttft_ms: float = 300,
+               tokens_per_s: float = 30,
+               reply_chars: int = 120,
+               think_chars: int = 0,
+               chars_per_token: int = 2,
+               max_concurrency: int = 0,
+               jitter: float = 0.1):
+    """创建模拟 Ollama 的 FastAPI 应用
+
+    实现 /api/generate（流式与非流式）、/api/tags 和 /api/ps，返回固定内容，
+    首个 token 延迟、输出速度和并发数可配置，用于在没有 GPU 的环境下压测应用本身。
+
+    Args:
+        model: 模拟的模型名称（健康检查时返回）
+        ttft_ms: 首个 token 的延迟（毫秒，模拟预填充）
+        tokens_per_s: 每秒输出的 token 数
+        reply_chars: 回复的字符数
+        think_chars: <think> 块的字符数，0 表示不输出思考过程；提示词以 /no_think 结尾时输出空的思考块，
+            raw 请求（思考超出预算后的重新请求）只输出回复
+        chars_per_token: 每个 token 的字符数
+        max_concurrency: 同时生成的请求数上限（模拟 GPU 的并行能力），0 表示不限制
+        jitter: 延迟的随机波动比例
+    """
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    app = FastAPI(title="fake-ollama")
+    semaphore: Optional[asyncio.Semaphore] = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+    stats = {"requests": 0, "active": 0}
+
+    def _vary(seconds: float) -> float:
+        return max(0.0, seconds * (1 + random.uniform(-jitter, jitter)))
+
+    def _output_text(body: dict) -> str:
+        text = _repeat_to(_REPLY_TEXT, reply_chars)
+        if body.get("raw"):
+            return text
+        if body.get("prompt", "").rstrip().endswith("/no_think"):
+            return f"<think>\n\n</think>\n\n{text}"
+        if think_chars > 0:
+            text = f"<think>{_repeat_to(_THINK_TEXT, think_chars)}</think>\n\n{text}"
+        return text
+
+    def _chunk(response: str, done: bool, **extra) -> bytes:
+        payload = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                   "response": response, "done": done}
+        payload.update(extra)
+        return (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+
+    async def _generate(body: dict):
+        stats["requests"] += 1
+        if semaphore is not None:
+            await semaphore.acquire()
+        stats["active"] += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.sleep(_vary(ttft_ms / 1000))
+            tokens = list(_chunks(_output_text(body), max(1, chars_per_token)))
+            interval = 1 / tokens_per_s if tokens_per_s > 0 else 0
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(_vary(interval))
+                yield _chunk(token, False)
+            yield _chunk("", True, done_reason="stop", eval_count=len(tokens),
+                         total_duration=int((time.perf_counter() - start) * 1e9))
+        finally:
+            stats["active"] -= 1
+            if semaphore is not None:
+                semaphore.release()
+
+    async def generate(request: Request):
+        body = await request.json()
+        if body.get("stream", True):
+            return StreamingResponse(_generate(body), media_type="application/x-ndjson")
+        response = "".join([json.loads(line)["response"] async for line in _generate(body)])
+        return JSONResponse({"model": model, "response": response, "done": True})
+
+    # langchain 的 Ollama 客户端在不同版本中会请求带或不带结尾斜杠的地址
+    app.add_api_route("/api/generate", generate, methods=["POST"])
+    app.add_api_route("/api/generate/", generate, methods=["POST"])
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": model, "model": model}]}
+
+    @app.get("/api/ps")
+    async def ps():
+        return {"models": [{"name": model, "model": model}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def serve(host: str = "127.0.0.1", port: int = 11500, **kwargs) -> None:
+    """启动模拟 Ollama 服务（阻塞）"""
+    import uvicorn
+
+    uvicorn.run(create_app(**kwargs), host=host, port=port, log_level="warning")
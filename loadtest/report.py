@@ -0,0 +1,140 @@
+import math
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+PERCENTILES = (50, 90, 95, 99)
+
+# 用于跨版本对比的指标：(路径, 越大越好)
+COMPARED_METRICS: Tuple[Tuple[str, bool], ...] = (
+    ("throughput_turns_per_s", True),
+    ("throughput_chars_per_s", True),
+    ("error_rate", False),
+    ("ttft_ms.p50", False),
+    ("ttft_ms.p95", False),
+    ("ttft_ms.p99", False),
+    ("completion_ms.p50", False),
+    ("completion_ms.p95", False),
+    ("completion_ms.p99", False),
+    ("server_memory.growth_per_session_kb", False),
+)
+
+
+def percentile(values: Sequence[float], p: float) -> Optional[float]:
+    """线性插值的百分位数，没有数据时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def distribution(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    """汇总一组耗时（毫秒）的分布"""
+    result: Dict[str, Optional[float]] = {f"p{p}": _round(percentile(values, p)) for p in PERCENTILES}
+    result["mean"] = _round(sum(values) / len(values)) if values else None
+    result["max"] = _round(max(values)) if values else None
+    result["count"] = len(values)
+    return result
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 1)
+
+
+def summarize(turns: List[Dict[str, Any]],
+              connect_ms: List[float],
+              session_errors: List[str],
+              duration_s: float) -> Dict[str, Any]:
+    """根据每轮的测量结果计算吞吐量、延迟分布和错误率
+
+    Args:
+        turns: TurnResult.to_dict() 的列表
+        connect_ms: 各会话的连接耗时（到收到欢迎消息为止）
+        session_errors: 连接失败等会话级别的错误
+        duration_s: 压测总时长（秒）
+    """
+    completed = [t for t in turns if t["error"] is None]
+    error_kinds = Counter(_error_kind(t["error"]) for t in turns if t["error"] is not None)
+    error_kinds.update(_error_kind(e) for e in session_errors)
+    attempts = len(turns) + len(session_errors)
+    reply_chars = sum(t["reply_chars"] for t in completed)
+    return {
+        "turns": len(turns),
+        "completed": len(completed),
+        "errors": attempts - len(completed),
+        "error_rate": round((attempts - len(completed)) / attempts, 4) if attempts else 0.0,
+        "error_kinds": dict(error_kinds),
+        "audio_rate": round(sum(1 for t in completed if t["audio"]) / len(completed), 4) if completed else 0.0,
+        "duration_s": round(duration_s, 2),
+        "throughput_turns_per_s": round(len(completed) / duration_s, 3) if duration_s > 0 else 0.0,
+        "throughput_chars_per_s": round(reply_chars / duration_s, 1) if duration_s > 0 else 0.0,
+        "ttft_ms": distribution([t["ttft_ms"] for t in completed if t["ttft_ms"] is not None]),
+        "completion_ms": distribution([t["total_ms"] for t in completed if t["total_ms"] is not None]),
+        "connect_ms": distribution(connect_ms),
+    }
+
+
+def _error_kind(error: str) -> str:
+    if error.startswith("connect:"):
+        return "connect"
+    if error in ("timeout", "disconnected", "empty reply"):
+        return error
+    return "app_error"
+
+
+def _lookup(report: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = report.get("summary", {})
+    if path.startswith("server_memory."):
+        value = report.get("server_memory") or {}
+        path = path[len("server_memory."):]
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value if isinstance(value, (int, float)) else None
+
+
+def compare(baseline: Dict[str, Any],
+            current: Dict[str, Any],
+            tolerance: float = 0.1) -> Tuple[List[Dict[str, Any]], bool]:
+    """对比两次压测报告
+
+    Args:
+        baseline: 基准报告
+        current: 本次报告
+        tolerance: 允许的变差比例，超过视为回退
+
+    Returns:
+        Tuple[List[Dict], bool]: (每个指标的对比结果, 是否存在回退)
+    """
+    rows = []
+    regressed = False
+    for path, higher_is_better in COMPARED_METRICS:
+        old, new = _lookup(baseline, path), _lookup(current, path)
+        change = None
+        worse = False
+        if old is not None and new is not None:
+            if old:
+                change = (new - old) / abs(old)
+                worse = (-change if higher_is_better else change) > tolerance
+            else:
+                # 基准为 0（例如没有错误）时，只要变差就视为回退
+                worse = new < old if higher_is_better else new > old
+        regressed = regressed or worse
+        rows.append({"metric": path, "baseline": old, "current": new,
+                     "change": None if change is None else round(change, 4), "regressed": worse})
+    return rows, regressed
+
+
+def format_comparison(rows: List[Dict[str, Any]]) -> str:
+    lines = [f"{'指标':<40}{'基准':>12}{'本次':>12}{'变化':>10}"]
+    for row in rows:
+        change = "-" if row["change"] is None else f"{row['change'] * 100:+.1f}%"
+        mark = "  <-- 回退" if row["regressed"] else ""
+        lines.append(f"{row['metric']:<40}{_fmt(row['baseline']):>12}{_fmt(row['current']):>12}{change:>10}{mark}")
+    return "\n".join(lines)
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.4g}"
@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import json
+import logging
+import subprocess
+import time
+from typing import Any, Dict, List, Optional
+
+from .report import summarize
+from .session import SimulatedSession
+
+logger = logging.getLogger(__name__)
+
+
+def load_scripts(path: str) -> List[Dict[str, Any]]:
+    """读取对话脚本（JSONL），每行形如 {"messages": ["你好", ...], "chat_profile": "孙悟空"}"""
+    scripts = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            script = json.loads(line)
+            if not script.get("messages"):
+                raise ValueError(f"{path}:{line_no} 缺少 messages")
+            scripts.append(script)
+    if not scripts:
+        raise ValueError(f"脚本文件为空: {path}")
+    return scripts
+
+
+def file_sha1(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_rss_kb(pid: int) -> Optional[int]:
+    """读取进程（Linux）的常驻内存（KB）"""
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+class RSSSampler:
+    """定期采样服务进程的内存，记录开始、峰值和结束时的 RSS"""
+
+    def __init__(self, pid: int, interval: float = 1.0):
+        self.pid = pid
+        self.interval = interval
+        self.start_kb: Optional[int] = None
+        self.peak_kb: Optional[int] = None
+        self.end_kb: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _sample(self) -> Optional[int]:
+        rss = read_rss_kb(self.pid)
+        if rss is not None:
+            self.peak_kb = max(self.peak_kb or 0, rss)
+        return rss
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self._sample()
+
+    def start(self) -> None:
+        self.start_kb = self._sample()
+        if self.start_kb is None:
+            logger.warning("无法读取进程 %s 的内存，跳过内存统计", self.pid)
+            return
+        self._task = asyncio.create_task(self._loop())
+
+    def stop(self, sessions: int) -> Optional[Dict[str, Any]]:
+        if self._task is None:
+            return None
+        self._task.cancel()
+        self.end_kb = self._sample()
+        if self.end_kb is None:
+            return None
+        return {
+            "pid": self.pid,
+            "rss_start_mb": round(self.start_kb / 1024, 1),
+            "rss_peak_mb": round(self.peak_kb / 1024, 1),
+            "rss_end_mb": round(self.end_kb / 1024, 1),
+            "growth_per_session_kb": round((self.end_kb - self.start_kb) / max(1, sessions), 1),
+        }
+
+
+async def run_load(url: str,
+                   scripts: List[Dict[str, Any]],
+                   sessions: int,
+                   ramp_up: float = 0.0,
+                   think_time: float = 2.0,
+                   think_jitter: float = 0.5,
+                   loops: int = 1,
+                   duration: Optional[float] = None,
+                   turn_timeout: float = 300,
+                   cache_busting: bool = True,
+                   ready_text: str = "你好！",
+                   server_pid: Optional[int] = None) -> Dict[str, Any]:
+    """并发运行若干模拟会话并汇总结果
+
+    Args:
+        url: Chainlit 应用地址
+        scripts: 对话脚本，会话按顺序轮流使用
+        sessions: 并发会话数
+        ramp_up: 在多长时间内（秒）逐步建立全部会话
+        think_time: 两轮之间的平均思考时间（秒）
+        think_jitter: 思考时间的随机波动比例
+        loops: 每个会话重复脚本的次数
+        duration: 压测最长时间（秒），到达后不再发送新消息
+        turn_timeout: 单轮对话的超时时间（秒）
+        cache_busting: 是否避免命中回复缓存
+        ready_text: 欢迎消息的开头，收到后才开始发送消息
+        server_pid: 应用进程的 PID，用于统计内存增长
+
+    Returns:
+        Dict[str, Any]: 压测结果（不含元信息）
+    """
+    sampler = RSSSampler(server_pid) if server_pid else None
+    if sampler is not None:
+        sampler.start()
+
+    start = time.perf_counter()
+    stop_at = start + duration if duration else None
+    simulated = []
+    tasks = []
+    for i in range(sessions):
+        script = scripts[i % len(scripts)]
+        session = SimulatedSession(
+            index=i,
+            url=url,
+            chat_profile=script.get("chat_profile"),
+            ready_text=ready_text,
+            turn_timeout=turn_timeout,
+        )
+        simulated.append(session)
+        tasks.append(asyncio.create_task(session.run(
+            script["messages"],
+            think_time=script.get("think_time", think_time),
+            think_jitter=think_jitter,
+            loops=loops,
+            cache_busting=cache_busting,
+            stop_at=stop_at,
+        )))
+        if ramp_up > 0 and i < sessions - 1:
+            await asyncio.sleep(ramp_up / sessions)
+    await asyncio.gather(*tasks)
+    duration_s = time.perf_counter() - start
+
+    turns = [r.to_dict() for s in simulated for r in s.results]
+    summary = summarize(
+        turns,
+        connect_ms=[s.connect_ms for s in simulated if s.connect_ms is not None],
+        session_errors=[s.error for s in simulated if s.error and s.error.startswith("connect:")],
+        duration_s=duration_s,
+    )
+    return {
+        "summary": summary,
+        "server_memory": sampler.stop(sessions) if sampler is not None else None,
+        "turns": turns,
+    }
@@ -0,0 +1,214 @@
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+
+# 应用在这些作者名下发送的消息表示本轮失败（排队超时、生成超时、内部错误等）
+ERROR_AUTHORS = ("系统", "Error")
+
+
+class TurnResult:
+    """单轮对话的测量结果"""
+
+    __slots__ = ("session", "turn", "ttft_ms", "total_ms", "reply_chars", "audio", "error")
+
+    def __init__(self, session: int, turn: int):
+        self.session = session
+        self.turn = turn
+        self.ttft_ms: Optional[float] = None
+        self.total_ms: Optional[float] = None
+        self.reply_chars = 0
+        self.audio = False
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class SimulatedSession:
+    """通过 Chainlit 的 socket.io 接口模拟一个浏览器会话
+
+    按脚本依次发送消息，记录每轮的首个 token 时间、完成时间、回复长度和是否收到语音。
+    Chainlit 在每次消息处理结束时发送 task_end，以此作为一轮对话完成的标志。
+    """
+
+    def __init__(self,
+                 index: int,
+                 url: str,
+                 chat_profile: Optional[str] = None,
+                 ready_text: str = "你好！",
+                 socketio_path: str = "/ws/socket.io",
+                 turn_timeout: float = 300,
+                 connect_timeout: float = 60):
+        self.index = index
+        self.url = url.rstrip("/")
+        self.chat_profile = chat_profile
+        self.ready_text = ready_text
+        self.socketio_path = socketio_path
+        self.turn_timeout = turn_timeout
+        self.connect_timeout = connect_timeout
+
+        self.session_id = str(uuid.uuid4())
+        self.connect_ms: Optional[float] = None
+        self.results: List[TurnResult] = []
+        self.error: Optional[str] = None
+
+        self._ready = asyncio.Event()
+        self._turn_done = asyncio.Event()
+        self._current: Optional[TurnResult] = None
+        self._sent_at = 0.0
+
+    def _build_client(self):
+        import socketio
+
+        sio = socketio.AsyncClient(reconnection=False)
+
+        @sio.on("new_message")
+        async def on_new_message(step):
+            self._on_step(step)
+
+        @sio.on("update_message")
+        async def on_update_message(step):
+            self._on_step(step)
+
+        @sio.on("stream_token")
+        async def on_stream_token(data):
+            turn = self._current
+            token = (data or {}).get("token") or ""
+            if turn is None or not token or (data or {}).get("isInput"):
+                return
+            self._mark_first_token(turn)
+            turn.reply_chars += len(token)
+
+        @sio.on("element")
+        async def on_element(element):
+            if self._current is not None and (element or {}).get("type") == "audio":
+                self._current.audio = True
+
+        @sio.on("task_end")
+        async def on_task_end(*_):
+            if self._current is not None:
+                self._turn_done.set()
+
+        @sio.event
+        async def disconnect(*_):
+            if self._current is not None and self._current.error is None:
+                self._current.error = "disconnected"
+            self._turn_done.set()
+
+        return sio
+
+    def _on_step(self, step: Dict[str, Any]) -> None:
+        step = step or {}
+        output = step.get("output") or ""
+        if not self._ready.is_set():
+            if output.startswith(self.ready_text):
+                self._ready.set()
+            return
+        turn = self._current
+        if turn is None or step.get("type") != "assistant_message" or not output:
+            return
+        if step.get("isError") or step.get("name") in ERROR_AUTHORS:
+            # 排队提示会在开始生成前被移除，不算失败
+            if "排队" in output and "稍后" not in output:
+                return
+            turn.error = turn.error or output[:80]
+            return
+        # 命中回复缓存时回复不走流式，整条消息一次发送
+        self._mark_first_token(turn)
+        turn.reply_chars = max(turn.reply_chars, len(output))
+
+    def _mark_first_token(self, turn: TurnResult) -> None:
+        if turn.ttft_ms is None:
+            turn.ttft_ms = (time.perf_counter() - self._sent_at) * 1000
+
+    def _user_message(self, text: str) -> Dict[str, Any]:
+        return {
+            "message": {
+                "threadId": "",
+                "id": str(uuid.uuid4()),
+                "name": "User",
+                "type": "user_message",
+                "output": text,
+                "createdAt": datetime.now(timezone.utc).isoformat(),
+            },
+            "fileReferences": None,
+        }
+
+    async def run(self,
+                  messages: List[str],
+                  think_time: float = 2.0,
+                  think_jitter: float = 0.5,
+                  loops: int = 1,
+                  cache_busting: bool = True,
+                  stop_at: Optional[float] = None) -> None:
+        """连接应用并按脚本完成若干轮对话
+
+        Args:
+            messages: 本会话依次发送的消息
+            think_time: 两轮之间的平均思考时间（秒）
+            think_jitter: 思考时间的随机波动比例
+            loops: 脚本重复次数
+            cache_busting: 是否在消息末尾加上唯一标记，避免命中回复缓存
+            stop_at: 压测结束时间（time.perf_counter），到达后不再发送新消息
+        """
+        sio = self._build_client()
+        auth = {
+            "sessionId": self.session_id,
+            "clientType": "webapp",
+            "userEnv": "{}",
+            "threadId": None,
+        }
+        if self.chat_profile:
+            auth["chatProfile"] = quote(self.chat_profile)
+
+        start = time.perf_counter()
+        try:
+            await sio.connect(self.url, socketio_path=self.socketio_path, auth=auth,
+                              transports=["websocket"], wait_timeout=self.connect_timeout)
+            await sio.emit("connection_successful")
+            await asyncio.wait_for(self._ready.wait(), timeout=self.connect_timeout)
+            self.connect_ms = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            self.error = f"connect: {type(e).__name__}: {e}"
+            await sio.disconnect()
+            return
+
+        try:
+            turn_index = 0
+            for _ in range(max(1, loops)):
+                for text in messages:
+                    if stop_at is not None and time.perf_counter() >= stop_at:
+                        return
+                    if not sio.connected:
+                        self.error = "disconnected"
+                        return
+                    if cache_busting:
+                        text = f"{text} #{self.session_id[:8]}-{turn_index}"
+                    await self._run_turn(sio, turn_index, text)
+                    turn_index += 1
+                    await asyncio.sleep(max(0.0, think_time * (1 + random.uniform(-think_jitter, think_jitter))))
+        finally:
+            await sio.disconnect()
+
+    async def _run_turn(self, sio, turn_index: int, text: str) -> None:
+        turn = TurnResult(self.index, turn_index)
+        self.results.append(turn)
+        self._turn_done.clear()
+        self._current = turn
+        self._sent_at = time.perf_counter()
+        try:
+            await sio.emit("client_message", self._user_message(text))
+            await asyncio.wait_for(self._turn_done.wait(), timeout=self.turn_timeout)
+            turn.total_ms = (time.perf_counter() - self._sent_at) * 1000
+            if turn.error is None and turn.reply_chars == 0:
+                turn.error = "empty reply"
+        except asyncio.TimeoutError:
+            turn.error = "timeout"
+            # 超时后让应用停止本轮生成，避免影响后续请求
+            await sio.emit("stop")
+        finally:
+            self._current = None
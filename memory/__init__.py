@@ -1,4 +1,28 @@
-from .short_term import ShortTermMemory
-from .chat_memory import ChatMemory
+import importlib
 
-__all__ = ['ShortTermMemory', 'ChatMemory'] 
\ No newline at end of file
+# 按需导入子模块：ChatMemory 依赖 chromadb，只在真正用到时才加载
+_EXPORTS = {
+    'ShortTermMemory': '.short_term',
+    'ChatMemory': '.chat_memory',
+    'EmbeddingModelMismatch': '.chat_memory',
+    'ResponseCache': '.response_cache',
+    'EmbeddingProvider': '.embeddings',
+    'create_embedding_provider': '.embeddings',
+    'FactStore': '.fact_store',
+    'FactExtractor': '.fact_extractor',
+    'format_facts': '.fact_store',
+    'MemoryServiceClient': '.remote',
+    'RemoteChatMemory': '.remote',
+    'MemoryServiceError': '.remote',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
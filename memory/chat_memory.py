@@ -1,33 +1,382 @@
-import chromadb
-from chromadb.config import Settings
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, TYPE_CHECKING
 from datetime import datetime, timedelta
+import hashlib
+import logging
+import re
 import uuid
 import time # 确保 time 模块被导入以使用 time.sleep
 
+if TYPE_CHECKING:
+    from .embeddings import EmbeddingProvider
+
+logger = logging.getLogger(__name__)
+
+# 创建集合后无法再修改的 HNSW 参数，修改这些参数需要重建索引（见 memory_index.py rebuild）
+HNSW_REBUILD_KEYS = ("space", "max_neighbors", "ef_construction")
+
+# 集合元数据中记录向量模型的键；没有该键的旧集合由 Chroma 默认模型写入
+EMBEDDING_MODEL_KEY = "embedding_model"
+LEGACY_EMBEDDING_MODEL = "chroma-default:all-MiniLM-L6-v2"  # 与 ChromaDefaultEmbedding.model_id 一致
+
+# 重建过程中的临时集合和备份集合的名称后缀
+REBUILD_SUFFIX = "_rb"
+BACKUP_MARKER = "_bak"
+
+# 对话记录元数据中用于去重的字段：内容指纹、被合并的次数（含自身）和最近一次出现的时间
+CONTENT_HASH_KEY = "content_hash"
+HIT_COUNT_KEY = "hit_count"
+LAST_SEEN_KEY = "last_seen"
+
+
+class EmbeddingModelMismatch(RuntimeError):
+    """集合由其他向量模型写入，需要先离线重新向量化（memory_index.py rebuild --reembed）"""
+
+
+def partition_collection_name(collection_name: str, user_id: Optional[str]) -> str:
+    """计算用户分区对应的集合名称
+
+    每个用户使用独立的集合，检索只在该用户自己的向量索引上进行，
+    延迟只取决于该用户的数据量。未指定用户时沿用基础集合（兼容旧数据）。
+
+    Args:
+        collection_name: 角色的基础集合名称
+        user_id: 用户标识
+
+    Returns:
+        str: 集合名称（满足 Chroma 的命名规则）
+    """
+    if not user_id:
+        return collection_name
+    digest = hashlib.sha1(user_id.encode('utf-8')).hexdigest()[:16]
+    return f"{collection_name}_u{digest}"
+
+
+def content_hash(user_input: str, assistant_response: str) -> str:
+    """对话内容的指纹，忽略空白和大小写差异"""
+    normalized = re.sub(r"\s+", "", f"{user_input}\0{assistant_response}").lower()
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def distance_to_similarity(distance: float, space: str) -> float:
+    """把 Chroma 返回的距离换算为余弦相似度（向量已归一化）
+
+    cosine / ip 的距离为 1 - 相似度；l2 为欧氏距离的平方，归一化向量下等于 2 - 2 * 相似度。
+    """
+    if space == "l2":
+        return 1 - distance / 2
+    return 1 - distance
+
+
+def hnsw_settings(collection) -> Dict[str, Any]:
+    """读取集合当前的 HNSW 参数"""
+    return dict((collection.configuration_json or {}).get("hnsw") or {})
+
+
+def collection_names(client) -> List[str]:
+    # 不同版本的 chromadb 返回集合对象或集合名称
+    return sorted(c if isinstance(c, str) else c.name for c in client.list_collections())
+
+
+def rebuild_collection(client,
+                       name: str,
+                       hnsw: Optional[Dict[str, Any]] = None,
+                       embedding_provider: Optional["EmbeddingProvider"] = None,
+                       batch_size: int = 1000,
+                       drop_backup: bool = False) -> Optional[str]:
+    """重建一个集合：更换 HNSW 参数，或用新的向量模型重新向量化
+
+    先写入临时集合，校验记录数和 ID 一致后，原集合改名为备份，临时集合改为原名称。
+    不指定向量模型时直接复制原有向量。
+
+    Args:
+        client: Chroma 客户端
+        name: 集合名称
+        hnsw: 新的 HNSW 参数，为空时沿用原集合的参数
+        embedding_provider: 新的向量模型，为空时复制原有向量
+        batch_size: 每批读写的记录数
+        drop_backup: 成功后是否删除原集合
+
+    Returns:
+        Optional[str]: 备份集合的名称（drop_backup 时为 None）
+    """
+    source = client.get_collection(name, embedding_function=None)
+    expected = source.count()
+    temp_name = f"{name}{REBUILD_SUFFIX}"
+    if temp_name in collection_names(client):
+        logger.warning("删除上次未完成的临时集合 %s", temp_name)
+        client.delete_collection(temp_name)
+
+    if hnsw is None:
+        current = hnsw_settings(source)
+        hnsw = {k: current[k] for k in (*HNSW_REBUILD_KEYS, "ef_search") if k in current}
+    metadata = {k: v for k, v in (source.metadata or {}).items() if not k.startswith("hnsw:")}
+    if embedding_provider is not None:
+        metadata[EMBEDDING_MODEL_KEY] = embedding_provider.model_id
+    target = client.create_collection(
+        temp_name,
+        metadata=metadata or None,
+        configuration={"hnsw": dict(hnsw)} if hnsw else None,
+        embedding_function=None,
+    )
+
+    start = time.perf_counter()
+    include = ["documents", "metadatas"] if embedding_provider is not None else ["embeddings", "documents", "metadatas"]
+    copied = 0
+    try:
+        for offset in range(0, expected, batch_size):
+            batch = source.get(offset=offset, limit=batch_size, include=include)
+            if not batch["ids"]:
+                continue
+            if embedding_provider is not None:
+                embeddings = embedding_provider.embed(batch["documents"])
+            else:
+                embeddings = batch["embeddings"]
+            target.add(
+                ids=batch["ids"],
+                embeddings=embeddings,
+                documents=batch["documents"],
+                metadatas=batch["metadatas"],
+            )
+            copied += len(batch["ids"])
+            logger.info("%s: 已写入 %d/%d", name, copied, expected)
+
+        # 校验：记录数一致，且原集合在重建期间没有被写入
+        if target.count() != expected or source.count() != expected:
+            raise RuntimeError(
+                f"记录数不一致 (原集合 {expected} -> {source.count()}, 新集合 {target.count()})，"
+                f"重建期间可能有写入，请停止应用后重试"
+            )
+        for offset in range(0, expected, batch_size):
+            ids = source.get(offset=offset, limit=batch_size, include=[])["ids"]
+            if len(target.get(ids=ids, include=[])["ids"]) != len(ids):
+                raise RuntimeError("新集合缺少部分记录")
+    except BaseException:
+        client.delete_collection(temp_name)
+        raise
+
+    backup_name = f"{name}{BACKUP_MARKER}{int(time.time())}"
+    source.modify(name=backup_name)
+    try:
+        target.modify(name=name)
+    except Exception:
+        source.modify(name=name)
+        client.delete_collection(temp_name)
+        raise
+    logger.info("%s: 重建完成，%d 条记录，耗时 %.1f 秒", name, expected, time.perf_counter() - start)
+
+    if drop_backup:
+        client.delete_collection(backup_name)
+        return None
+    logger.info("%s: 原集合保留为 %s", name, backup_name)
+    return backup_name
+
+
+def dedup_collection(collection,
+                     similarity: float = 0.95,
+                     batch_size: int = 500,
+                     neighbors: int = 10,
+                     dry_run: bool = False) -> Dict[str, int]:
+    """对已有集合去重：内容指纹相同或向量相似度不低于阈值的记录合并到最新的一条
+
+    按写入顺序处理，重复记录中只保留最后写入的一条，之前各条的出现次数累加到该记录上，
+    然后删除其余记录。保留最新的记录使其在集合中的位置（分页和配额都按写入顺序）与最近一次出现一致。
+    同时为缺少内容指纹的旧记录补上指纹，之后写入时的精确去重对其生效。
+
+    Args:
+        collection: Chroma 集合
+        similarity: 相似度阈值，>= 1 时只合并内容完全相同的记录
+        batch_size: 每批读取的记录数
+        neighbors: 每条记录检查的近邻数
+        dry_run: 只统计，不修改集合
+
+    Returns:
+        Dict[str, int]: total（原记录数）、removed（删除数）、kept（保留数）、updated（更新元数据的记录数）
+    """
+    space = hnsw_settings(collection).get("space", "l2")
+    total = collection.count()
+    kept: Dict[str, Dict[str, Any]] = {}  # 保留记录的 ID -> 元数据
+    by_hash: Dict[str, str] = {}
+    merged_into: Dict[str, str] = {}  # 被合并记录的 ID -> 合并到的记录 ID
+    removed: List[str] = []
+    changed = set()
+
+    def resolve(record_id: str) -> str:
+        while record_id in merged_into:
+            record_id = merged_into[record_id]
+        return record_id
+
+    for offset in range(0, total, batch_size):
+        batch = collection.get(offset=offset, limit=batch_size, include=["embeddings", "metadatas"])
+        if not batch["ids"]:
+            continue
+        near = None
+        if similarity < 1:
+            near = collection.query(query_embeddings=batch["embeddings"],
+                                    n_results=min(neighbors, total), include=["distances"])
+        for i, (record_id, metadata) in enumerate(zip(batch["ids"], batch["metadatas"])):
+            metadata = dict(metadata or {})
+            digest = metadata.get(CONTENT_HASH_KEY) or content_hash(
+                metadata.get("user_input", ""), metadata.get("assistant_response", "")
+            )
+            keeper = resolve(by_hash[digest]) if digest in by_hash else None
+            if keeper is None and near is not None:
+                for neighbor_id, distance in zip(near["ids"][i], near["distances"][i]):
+                    neighbor_id = resolve(neighbor_id)
+                    if neighbor_id in kept and neighbor_id != record_id \
+                            and distance_to_similarity(distance, space) >= similarity:
+                        keeper = neighbor_id
+                        break
+
+            if metadata.get(CONTENT_HASH_KEY) != digest:
+                metadata[CONTENT_HASH_KEY] = digest
+                changed.add(record_id)
+            if keeper is not None:
+                # 之前保留的记录合并到当前（更新的）记录上
+                previous = kept.pop(keeper)
+                metadata[HIT_COUNT_KEY] = previous.get(HIT_COUNT_KEY, 1) + metadata.get(HIT_COUNT_KEY, 1)
+                metadata[LAST_SEEN_KEY] = max(
+                    previous.get(LAST_SEEN_KEY, previous.get("timestamp", 0)),
+                    metadata.get(LAST_SEEN_KEY, metadata.get("timestamp", 0)),
+                )
+                merged_into[keeper] = record_id
+                changed.discard(keeper)
+                changed.add(record_id)
+                removed.append(keeper)
+            kept[record_id] = metadata
+            by_hash[digest] = record_id
+        logger.info("%s: 已检查 %d/%d，待删除 %d 条", collection.name,
+                    min(offset + batch_size, total), total, len(removed))
+
+    if not dry_run:
+        updated_ids = [record_id for record_id in kept if record_id in changed]
+        for start in range(0, len(updated_ids), batch_size):
+            ids = updated_ids[start:start + batch_size]
+            collection.update(ids=ids, metadatas=[kept[record_id] for record_id in ids])
+        for start in range(0, len(removed), batch_size):
+            collection.delete(ids=removed[start:start + batch_size])
+    return {"total": total, "removed": len(removed), "kept": len(kept), "updated": len(changed & kept.keys())}
+
+
 class ChatMemory:
-    def __init__(self, persist_directory: str = "./memory/chat_memory"):
+    def __init__(self,
+                 persist_directory: str = "./memory/chat_memory",
+                 collection_name: str = "chat_history",
+                 user_id: Optional[str] = None,
+                 max_interactions: Optional[int] = None,
+                 hnsw: Optional[Dict[str, Any]] = None,
+                 embedding_provider: Optional["EmbeddingProvider"] = None,
+                 dedup_similarity: Optional[float] = None,
+                 cache_limit_mb: Optional[float] = None):
         """初始化聊天记忆存储
         
         Args:
             persist_directory: 存储目录路径
+            collection_name: 向量集合名称，不同角色使用各自的集合
+            user_id: 用户标识，指定后读写都限定在该用户的分区内
+            max_interactions: 该用户最多保留的对话条数，超出后删除最旧的记录
+            hnsw: 向量索引参数 (space/max_neighbors/ef_construction/ef_search)，为空时使用 Chroma 的默认值
+            embedding_provider: 向量模型，为空时使用 Chroma 的默认模型；与集合记录的模型不一致时
+                旧集合继续使用 Chroma 的默认模型，其他情况抛出 EmbeddingModelMismatch
+            dedup_similarity: 写入时的去重阈值，与已有记录内容相同或相似度不低于该值时合并到已有记录，
+                >= 1 时只合并内容完全相同的记录，为空时不去重
+            cache_limit_mb: Chroma 常驻内存的向量索引总上限（MB），超出后按 LRU 卸载最久未用的集合索引；
+                为空时已打开集合的索引一直留在内存中。同一进程中同一目录的所有实例必须使用相同的值
+        """
+        self.user_id = user_id
+        self.dedup_similarity = dedup_similarity
+        self.max_interactions = max_interactions
+        self.hnsw = hnsw
+        import chromadb  # 延迟导入，chromadb 的导入耗时较长
+        from .embeddings import default_embedding_provider
+
+        self.embedding = embedding_provider or default_embedding_provider()
+
+        if cache_limit_mb:
+            from chromadb.config import Settings
+
+            # 每个用户一个集合，打开过的索引默认常驻内存；LRU 段缓存限制其总量
+            settings = Settings(
+                chroma_segment_cache_policy="LRU",
+                chroma_memory_limit_bytes=int(cache_limit_mb * 1024 * 1024),
+            )
+            self.client = chromadb.PersistentClient(path=persist_directory, settings=settings)
+        else:
+            self.client = chromadb.PersistentClient(path=persist_directory)
+        self.persist_directory = persist_directory
+        self.collection = self._open_collection(partition_collection_name(collection_name, user_id))
+        if hnsw:
+            self._apply_hnsw(hnsw)
+        self.space = hnsw_settings(self.collection).get("space", "l2")
+
+    def _open_collection(self, name: str):
+        """打开集合，检查集合记录的向量模型与当前模型是否一致
+
+        向量由 self.embedding 计算后显式传给 Chroma，集合本身不绑定向量模型。
+        打开集合时从不重新向量化：重建耗时长、需要独占集合，只能停止应用后用
+        memory_index.py rebuild --reembed 离线完成（原集合保留为备份，可以回滚）。
         """
-        self.client = chromadb.PersistentClient(path=persist_directory)
-        self.collection = self.client.get_or_create_collection(
-            name="chat_history",
-            metadata={"description": "存储聊天历史及对应的向量嵌入"}
+        try:
+            collection = self.client.get_collection(name, embedding_function=None)
+        except Exception:
+            collection_metadata = {
+                "description": "存储聊天历史及对应的向量嵌入",
+                EMBEDDING_MODEL_KEY: self.embedding.model_id,
+            }
+            if self.user_id:
+                collection_metadata["user_id"] = self.user_id
+            return self.client.get_or_create_collection(
+                name=name,
+                metadata=collection_metadata,
+                configuration={"hnsw": dict(self.hnsw)} if self.hnsw else None,
+                embedding_function=None
+            )
+
+        stored_model = (collection.metadata or {}).get(EMBEDDING_MODEL_KEY, LEGACY_EMBEDDING_MODEL)
+        if stored_model == self.embedding.model_id:
+            return collection
+        if stored_model == LEGACY_EMBEDDING_MODEL:
+            # Chroma 默认模型写入的旧集合：继续用默认模型读写，直到离线重新向量化
+            from .embeddings import default_embedding_provider
+
+            logger.warning("集合 %s 由 %s 写入，继续使用该模型；运行 memory_index.py rebuild --reembed 后改用 %s",
+                           name, stored_model, self.embedding.model_id)
+            self.embedding = default_embedding_provider()  # 进程内共享，不为每个集合重复加载模型
+            return collection
+        raise EmbeddingModelMismatch(
+            f"集合 {name} 由向量模型 {stored_model} 写入，与当前配置的 {self.embedding.model_id} 不一致，"
+            f"请停止应用后运行 python memory_index.py rebuild --all --reembed"
         )
 
+    def _apply_hnsw(self, hnsw: Dict[str, Any]) -> None:
+        """已存在的集合：ef_search 可以直接修改，其余参数不一致时提示重建索引"""
+        current = hnsw_settings(self.collection)
+        ef_search = hnsw.get("ef_search")
+        if ef_search is not None and current.get("ef_search") != ef_search:
+            self.collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+        stale = [k for k in HNSW_REBUILD_KEYS if k in hnsw and k in current and current[k] != hnsw[k]]
+        if stale:
+            logger.warning(
+                "集合 %s 的索引参数 %s 与配置不一致，需要运行 memory_index.py rebuild 后才会生效",
+                self.collection.name, ", ".join(f"{k}={current[k]}->{hnsw[k]}" for k in stale)
+            )
+
     def add_interaction(self, 
                        user_input: str, 
                        assistant_response: str, 
-                       metadata: Dict[Any, Any] = None) -> None:
+                       metadata: Dict[Any, Any] = None) -> str:
         """添加一条新的对话记录
+
+        开启去重时，与已有记录重复（内容相同或向量相似度不低于阈值）的对话替换已有记录：
+        新记录保存本轮的内容并累加出现次数，写入到集合末尾，已有记录被删除，
+        因此按写入顺序的分页和配额淘汰都以最近一次出现为准。
         
         Args:
             user_input: 用户输入
             assistant_response: AI助手回复
             metadata: 额外的元数据
+
+        Returns:
+            str: 新增记录的 ID
         """
         if metadata is None:
             metadata = {}
@@ -44,16 +393,96 @@ class ChatMemory:
             "assistant_response": assistant_response,  # 存储原始AI回复
             **metadata
         }
+        if self.user_id:
+            full_metadata["user_id"] = self.user_id
         
         # 构建用于向量搜索的文本
         search_text = f"{user_input}\n{assistant_response}"
-        
+        embeddings = self.embedding.embed([search_text])
+        digest = content_hash(user_input, assistant_response)
+
+        hit_count = 1
+        duplicate_id = None
+        if self.dedup_similarity is not None:
+            duplicate_id = self._find_duplicate(digest, embeddings)
+            if duplicate_id is not None:
+                hit_count += self._hit_count(duplicate_id)
+
+        full_metadata.update({CONTENT_HASH_KEY: digest, HIT_COUNT_KEY: hit_count, LAST_SEEN_KEY: timestamp})
         # 将对话添加到集合中
         self.collection.add(
+            embeddings=embeddings,
             documents=[search_text],  # 用于向量搜索的组合文本
             metadatas=[full_metadata],
             ids=[unique_id]
         )
+        if duplicate_id is not None:
+            # 先写入新记录再删除旧记录，中途失败最多留下一条重复，不会丢失对话
+            self.collection.delete(ids=[duplicate_id])
+        self._enforce_quota()
+        return unique_id
+
+    def _find_duplicate(self, digest: str, embeddings) -> Optional[str]:
+        """查找与新对话重复的已有记录：先按内容指纹精确匹配，再查最近邻的相似度"""
+        exact = self.collection.get(where={CONTENT_HASH_KEY: digest}, limit=1, include=[])
+        if exact["ids"]:
+            return exact["ids"][0]
+        if self.dedup_similarity >= 1 or self.collection.count() == 0:
+            return None
+        nearest = self.collection.query(query_embeddings=embeddings, n_results=1, include=["distances"])
+        if nearest["ids"] and nearest["ids"][0] \
+                and distance_to_similarity(nearest["distances"][0][0], self.space) >= self.dedup_similarity:
+            return nearest["ids"][0][0]
+        return None
+
+    def _hit_count(self, record_id: str) -> int:
+        """已有记录的出现次数"""
+        existing = self.collection.get(ids=[record_id], include=["metadatas"])
+        if not existing["ids"]:
+            return 0
+        return (existing["metadatas"][0] or {}).get(HIT_COUNT_KEY, 1)
+
+    def _enforce_quota(self) -> int:
+        """超出配额时删除最旧的对话记录
+
+        Returns:
+            int: 删除的记录数量
+        """
+        if not self.max_interactions:
+            return 0
+        excess = self.collection.count() - self.max_interactions
+        if excess <= 0:
+            return 0
+        # 集合按写入顺序返回，最前面的就是最旧的记录
+        oldest = self.collection.get(limit=excess, include=[])
+        if oldest and oldest["ids"]:
+            self.collection.delete(ids=oldest["ids"])
+            return len(oldest["ids"])
+        return 0
+
+    def get_interactions_page(self, page: int = 0, page_size: int = 5) -> List[Dict]:
+        """分页获取对话记录，按时间戳倒序排列（最新的在前）。
+
+        只读取当前页的数据，而不是先取出全部记录再排序。
+
+        Args:
+            page: 页码，0 表示最新的一页
+            page_size: 每页记录数
+
+        Returns:
+            List[Dict]: 当前页的对话记录，格式同 get_all_interactions_sorted
+        """
+        total = self.collection.count()
+        end = total - page * page_size
+        if end <= 0:
+            return []
+        start = max(0, end - page_size)
+        page_results = self.collection.get(
+            offset=start,
+            limit=end - start,
+            include=["metadatas"]
+        )
+        return self._format_sorted_interactions(page_results)
     
     def get_all_interactions_sorted(self) -> List[Dict]:
         """获取所有对话记录，并按时间戳倒序排列（最新的在前）。
@@ -63,7 +492,10 @@ class ChatMemory:
         """
         # import pdb;pdb.set_trace()
         all_results = self.collection.get(include=["metadatas"]) # IDs 默认返回
+        return self._format_sorted_interactions(all_results)
 
+    def _format_sorted_interactions(self, all_results: Dict) -> List[Dict]:
+        """将 collection.get 的结果整理为按时间倒序排列的对话记录"""
         interactions = []
         if all_results and all_results["ids"]:
             temp_list_for_sorting = []
@@ -98,7 +530,7 @@ class ChatMemory:
                         "timestamp": item["timestamp"],
                         "display_timestamp": display_timestamp,
                         **{k: v for k, v in metadata.items() 
-                           if k not in ["timestamp", "type", "user_input", "assistant_response"]}
+                           if k not in ["timestamp", "type", "user_input", "assistant_response", CONTENT_HASH_KEY]}
                     }
                 }
                 interactions.append(interaction_data)
@@ -144,15 +576,33 @@ class ChatMemory:
     
     def search_similar_interactions(self, 
                                   query: str, 
-                                  n_results: int = 5) -> Dict:
-        """搜索相似的历史对话"""
+                                  n_results: int = 5,
+                                  min_similarity: Optional[float] = None) -> Dict:
+        """搜索相似的历史对话
+
+        Args:
+            query: 查询文本
+            n_results: 最多返回的条数
+            min_similarity: 相似度下限（余弦相似度），低于该值的结果不返回，为空时不过滤
+
+        Returns:
+            Dict: Chroma 的查询结果（ids / metadatas / documents / distances，按查询分组）
+        """
         results = self.collection.query(
-            query_texts=[query],
+            query_embeddings=self.embedding.embed_query([query]),
             n_results=n_results,
-            include=["metadatas", "documents"]
+            include=["metadatas", "documents", "distances"]
         )
-        
-        return results
+        if min_similarity is None:
+            return results
+        filtered = {key: [] for key in ("ids", "metadatas", "documents", "distances")}
+        for i, distances in enumerate(results.get("distances") or []):
+            keep = [j for j, distance in enumerate(distances)
+                    if distance_to_similarity(distance, self.space) >= min_similarity]
+            for key in filtered:
+                group = (results.get(key) or [])[i] if results.get(key) else []
+                filtered[key].append([group[j] for j in keep] if group else [])
+        return filtered
     
     def clear_old_interactions(self, days_to_keep: int = 30) -> int:
         """清理旧的对话记录"""
@@ -184,6 +634,10 @@ class ChatMemory:
             self.collection.delete(ids=all_ids)
             return count
         return 0 
+
+    def drop(self) -> None:
+        """删除整个集合（匿名会话结束时清理其临时分区），之后不能再使用该实例"""
+        self.client.delete_collection(self.collection.name)
     
 if __name__ == "__main__":
     chat_memory = ChatMemory()
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+from .fact_store import FactStore
+
+logger = logging.getLogger(__name__)
+
+_THINK_BLOCK = re.compile(r"<think>.*?(?:</think>|$)", re.S)
+
+
+def parse_facts(text: str) -> List[Dict[str, str]]:
+    """从模型输出中解析事实列表，忽略思考内容和 JSON 以外的文字
+
+    Args:
+        text: 模型输出
+
+    Returns:
+        List[Dict[str, str]]: {"entity", "attribute", "value"} 列表，无法解析时返回空列表
+    """
+    text = _THINK_BLOCK.sub("", text)
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        return []
+    try:
+        items = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return []
+    facts = []
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        fact = {key: str(item.get(key) or "").strip() for key in ("entity", "attribute", "value")}
+        if fact["attribute"] and fact["value"] and fact["value"] not in ("无", "未知", "null", "None"):
+            facts.append(fact)
+    return facts
+
+
+class FactExtractor:
+    """在后台从已完成的对话轮次中提取用户事实并写入 FactStore
+
+    提取请求进入有界队列，由单个后台任务依次处理，不阻塞对话；队列满时丢弃最旧的请求。
+    只有用户输入命中触发词（例如 "我叫"、"我住"）时才调用模型，闲聊不产生额外的生成请求。
+    配置了调度器时，提取请求以独立的调度标识参与公平排队，不会挤占用户的生成名额。
+    """
+
+    def __init__(self,
+                 store: FactStore,
+                 llm: Any,
+                 prompt_template: str,
+                 scheduler: Any = None,
+                 scheduler_key: str = "__facts__",
+                 triggers: Sequence[str] = (),
+                 prompt_suffix: str = "",
+                 max_queue: int = 100,
+                 max_input_chars: int = 500):
+        """初始化事实提取器
+
+        Args:
+            store: 事实库
+            llm: 提供 ainvoke(prompt) 的 LLM
+            prompt_template: 提取提示模板，包含 {input} 和 {reply}
+            scheduler: LLM 调度器（LLMScheduler），为空时直接调用模型
+            scheduler_key: 提取请求在调度器中的标识
+            triggers: 触发词，用户输入包含任一触发词时才提取，为空时每轮都提取
+            prompt_suffix: 追加在提示词末尾的内容（例如 Qwen3 的 /no_think）
+            max_queue: 等待提取的最大轮次数
+            max_input_chars: 用户输入和回复各自截取的最大长度
+        """
+        self.store = store
+        self.llm = llm
+        self.prompt_template = prompt_template
+        self.scheduler = scheduler
+        self.scheduler_key = scheduler_key
+        self.triggers = tuple(triggers)
+        self.prompt_suffix = prompt_suffix
+        self.max_queue = max_queue
+        self.max_input_chars = max_input_chars
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._current: Optional[str] = None  # 正在提取的分区
+        self._discarded: set = set()  # 提取过程中被丢弃的分区，结果不再写入
+        self.stats = {"submitted": 0, "skipped": 0, "dropped": 0, "extracted": 0, "failed": 0}
+
+    def should_extract(self, user_message: str) -> bool:
+        """用户输入是否可能包含事实"""
+        return not self.triggers or any(trigger in user_message for trigger in self.triggers)
+
+    def submit(self, scope: str, user_message: str, reply: str) -> bool:
+        """提交一轮已完成的对话，立即返回
+
+        Args:
+            scope: 事实库分区
+            user_message: 用户输入
+            reply: 助手回复
+
+        Returns:
+            bool: 是否进入了提取队列
+        """
+        if not self.should_extract(user_message):
+            self.stats["skipped"] += 1
+            return False
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        while self._queue.qsize() >= self.max_queue:
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self.stats["dropped"] += 1
+        self._queue.put_nowait((scope, user_message, reply))
+        self.stats["submitted"] += 1
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            scope, user_message, reply = await self._queue.get()
+            self._current = scope
+            try:
+                facts = await self.extract(user_message, reply)
+                if facts and scope not in self._discarded:
+                    written = await asyncio.to_thread(self.store.upsert, scope, facts, user_message)
+                    self.stats["extracted"] += written
+                    logger.info("从对话中提取了 %d 条事实 (%s)", written, scope)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.warning("提取事实失败: %s", str(e))
+            finally:
+                self._current = None
+                self._discarded.discard(scope)
+                self._queue.task_done()
+
+    def discard(self, scope: str) -> int:
+        """丢弃某个分区尚未完成的提取（例如匿名会话结束、其事实已删除），之后不会再写入该分区
+
+        Args:
+            scope: 事实库分区
+
+        Returns:
+            int: 从队列中移除的轮次数
+        """
+        if scope == self._current:
+            self._discarded.add(scope)
+        if self._queue is None:
+            return 0
+        kept, removed = [], 0
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            self._queue.task_done()
+            if item[0] == scope:
+                removed += 1
+            else:
+                kept.append(item)
+        for item in kept:
+            self._queue.put_nowait(item)
+        return removed
+
+    async def extract(self, user_message: str, reply: str) -> List[Dict[str, str]]:
+        """调用模型提取一轮对话中的事实"""
+        user_message = user_message[:self.max_input_chars]
+        reply = reply[:self.max_input_chars]
+        prompt = self.prompt_template.format(input=user_message, reply=reply)
+        if self.prompt_suffix:
+            prompt = f"{prompt} {self.prompt_suffix}"
+        if self.scheduler is None:
+            output = await self.llm.ainvoke(prompt)
+        else:
+            async with self.scheduler.slot(self.scheduler_key, len(user_message) + len(reply)):
+                output = await self.llm.ainvoke(prompt)
+        return parse_facts(output)
+
+    async def join(self) -> None:
+        """等待队列中的提取全部完成"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self) -> None:
+        """停止后台任务，未处理的请求被丢弃"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
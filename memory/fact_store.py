@@ -0,0 +1,206 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+USER_ENTITY = "用户"  # 代表当前用户本人的实体名
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS facts (
+    scope TEXT NOT NULL,
+    entity TEXT NOT NULL,
+    attribute TEXT NOT NULL,
+    value TEXT NOT NULL,
+    source TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    mentions INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (scope, entity, attribute)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_facts_value ON facts (scope, value);
+CREATE INDEX IF NOT EXISTS idx_facts_updated ON facts (scope, updated_at);
+"""
+
+
+def _clean(text: Any, max_chars: int) -> str:
+    return re.sub(r"\s+", " ", str(text or "")).strip()[:max_chars]
+
+
+class FactStore:
+    """结构化的用户事实库（实体-属性-值），存放在 SQLite 中
+
+    主键 (scope, entity, attribute) 即按实体的索引，查询某个实体的全部属性只需一次索引查找；
+    值同时建有索引，值本身是另一个实体时（例如 用户-宠物名-旺财、旺财-品种-柴犬）可以沿边查找，
+    构成一个简单的知识图谱。scope 与长期记忆的分区一致（角色 + 用户），不同用户的事实互相隔离。
+    同一实体的同一属性只保留最新的值。
+    """
+
+    def __init__(self,
+                 db_path: str = "./memory/facts.db",
+                 max_facts_per_scope: int = 200,
+                 max_value_chars: int = 100):
+        """初始化事实库
+
+        Args:
+            db_path: SQLite 数据库文件路径
+            max_facts_per_scope: 每个分区最多保留的事实数，超出后删除最久未更新的事实
+            max_value_chars: 属性值的最大长度
+        """
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.max_facts_per_scope = max_facts_per_scope
+        self.max_value_chars = max_value_chars
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._entities: Dict[str, List[str]] = {}  # 各分区的实体名缓存，用于在用户输入中匹配实体
+
+    def upsert(self, scope: str, facts: Iterable[Dict[str, Any]], source: str = "") -> int:
+        """写入事实，同一实体的同一属性覆盖为新值
+
+        Args:
+            scope: 分区标识
+            facts: {"entity", "attribute", "value"} 列表
+            source: 事实来源（例如提取时的用户原话）
+
+        Returns:
+            int: 写入的事实数
+        """
+        now = time.time()
+        rows = []
+        for fact in facts:
+            entity = _clean(fact.get("entity"), 32) or USER_ENTITY
+            attribute = _clean(fact.get("attribute"), 32)
+            value = _clean(fact.get("value"), self.max_value_chars)
+            if attribute and value:
+                rows.append((scope, entity, attribute, value, _clean(source, 200), now, now))
+        if not rows:
+            return 0
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                """
+                INSERT INTO facts (scope, entity, attribute, value, source, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (scope, entity, attribute) DO UPDATE SET
+                    mentions = CASE WHEN value = excluded.value THEN mentions + 1 ELSE 1 END,
+                    value = excluded.value,
+                    source = excluded.source,
+                    updated_at = excluded.updated_at
+                """,
+                rows,
+            )
+            self._enforce_quota(scope)
+            self._entities.pop(scope, None)
+        return len(rows)
+
+    def _enforce_quota(self, scope: str) -> None:
+        if not self.max_facts_per_scope:
+            return
+        self._conn.execute(
+            """
+            DELETE FROM facts WHERE scope = ? AND (entity, attribute) IN (
+                SELECT entity, attribute FROM facts WHERE scope = ?
+                ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (scope, scope, self.max_facts_per_scope),
+        )
+
+    def get_entity(self, scope: str, entity: str) -> List[Dict[str, Any]]:
+        """查询某个实体的全部事实"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT entity, attribute, value, updated_at, mentions FROM facts "
+                "WHERE scope = ? AND entity = ? ORDER BY mentions DESC, updated_at DESC",
+                (scope, entity),
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def entities(self, scope: str) -> List[str]:
+        """分区中的全部实体名（带缓存，写入时失效）"""
+        names = self._entities.get(scope)
+        if names is None:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT DISTINCT entity FROM facts WHERE scope = ?", (scope,)
+                ).fetchall()
+            names = [row[0] for row in rows]
+            self._entities[scope] = names
+        return names
+
+    def lookup(self, scope: str, text: str = "", limit: int = 20) -> List[Dict[str, Any]]:
+        """查找与本轮对话相关的事实
+
+        依次包括：用户本人的事实、用户输入中提到的实体的事实、以及用户事实的值所指向的实体
+        （例如宠物名对应的宠物实体）的事实。
+
+        Args:
+            scope: 分区标识
+            text: 本轮用户输入
+            limit: 最多返回的事实数
+
+        Returns:
+            List[Dict[str, Any]]: 事实列表
+        """
+        results: List[Dict[str, Any]] = []
+        seen = set()
+
+        def add(facts: List[Dict[str, Any]]) -> None:
+            for fact in facts:
+                key = (fact["entity"], fact["attribute"])
+                if key not in seen and len(results) < limit:
+                    seen.add(key)
+                    results.append(fact)
+
+        user_facts = self.get_entity(scope, USER_ENTITY)
+        add(user_facts)
+        entities = set(self.entities(scope))
+        mentioned = [name for name in entities if name != USER_ENTITY and name in text]
+        linked = [f["value"] for f in user_facts if f["value"] in entities and f["value"] != USER_ENTITY]
+        for name in dict.fromkeys(mentioned + linked):
+            if len(results) >= limit:
+                break
+            add(self.get_entity(scope, name))
+        return results
+
+    def delete(self, scope: str, entity: Optional[str] = None, attribute: Optional[str] = None) -> int:
+        """删除事实，不指定实体时删除整个分区"""
+        sql, params = "DELETE FROM facts WHERE scope = ?", [scope]
+        if entity is not None:
+            sql += " AND entity = ?"
+            params.append(entity)
+            if attribute is not None:
+                sql += " AND attribute = ?"
+                params.append(attribute)
+        with self._lock, self._conn:
+            deleted = self._conn.execute(sql, params).rowcount
+            self._entities.pop(scope, None)
+        return deleted
+
+    def count(self, scope: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM facts WHERE scope = ?", (scope,)).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _row(row) -> Dict[str, Any]:
+        entity, attribute, value, updated_at, mentions = row
+        return {"entity": entity, "attribute": attribute, "value": value,
+                "updated_at": updated_at, "mentions": mentions}
+
+
+def format_facts(facts: List[Dict[str, Any]]) -> str:
+    """把事实格式化为提示词中的一段文本，每条一行"""
+    return "\n".join(f"- {fact['entity']}的{fact['attribute']}：{fact['value']}" for fact in facts)
@@ -0,0 +1,202 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from .chat_memory import ChatMemory
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryServiceError(RuntimeError):
+    """记忆服务返回错误或无法访问"""
+
+
+class MemoryServiceClient:
+    """记忆服务的客户端，进程内共享
+
+    使用长连接访问服务。batch_wait_ms > 0 时，多个会话在该时间窗口内发出的请求
+    合并为一次 /batch 调用，减少往返次数，服务端还可以把同一批中的向量化合并处理。
+    """
+
+    def __init__(self,
+                 base_url: str,
+                 timeout: float = 30.0,
+                 batch_wait_ms: float = 2,
+                 max_batch_size: int = 32):
+        """初始化客户端
+
+        Args:
+            base_url: 记忆服务地址，例如 http://127.0.0.1:8765
+            timeout: 单次请求的超时时间（秒）
+            batch_wait_ms: 合并请求的等待时间（毫秒），0 表示每个请求单独发送
+            max_batch_size: 单批最多合并的请求数
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.batch_wait = batch_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._http = None
+        self._http_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+
+    @property
+    def http(self):
+        if self._http is None:
+            with self._http_lock:
+                if self._http is None:
+                    import httpx
+
+                    self._http = httpx.Client(base_url=self.base_url, timeout=self.timeout)
+        return self._http
+
+    def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            response = self.http.post(path, json=payload)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            raise MemoryServiceError(f"访问记忆服务失败 ({self.base_url}{path}): {e}") from e
+
+    @staticmethod
+    def _unwrap(reply: Dict[str, Any]) -> Any:
+        if not reply.get("ok"):
+            raise MemoryServiceError(f"{reply.get('type', 'Error')}: {reply.get('error')}")
+        return reply.get("result")
+
+    def call(self, request: Dict[str, Any]) -> Any:
+        """发送一个请求并等待结果（阻塞，在应用中应放到线程中调用）"""
+        if self.batch_wait <= 0:
+            return self._unwrap(self._post("/call", request))
+        self._ensure_thread()
+        future: Future = Future()
+        self._queue.put((request, future))
+        return future.result()
+
+    def batch(self, requests: List[Dict[str, Any]]) -> List[Any]:
+        """一次发送多个请求，按顺序返回结果，任一请求失败时抛出异常"""
+        if not requests:
+            return []
+        replies = self._post("/batch", {"requests": requests})["results"]
+        return [self._unwrap(reply) for reply in replies]
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name="memory-client", daemon=True)
+                    self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                if len(batch) == 1:
+                    replies = [self._post("/call", batch[0][0])]
+                else:
+                    replies = self._post("/batch", {"requests": [request for request, _ in batch]})["results"]
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), reply in zip(batch, replies):
+                try:
+                    future.set_result(self._unwrap(reply))
+                except MemoryServiceError as e:
+                    future.set_exception(e)
+
+    def health(self) -> Dict[str, Any]:
+        try:
+            return self.http.get("/health").raise_for_status().json()
+        except Exception as e:
+            raise MemoryServiceError(f"访问记忆服务失败 ({self.base_url}): {e}") from e
+
+    def close(self) -> None:
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+
+
+class RemoteChatMemory:
+    """通过记忆服务访问的长期记忆，接口与 ChatMemory 一致，可以直接替换使用
+
+    所有读写都由记忆服务在其进程中完成，多个应用进程可以共享同一个向量数据库。
+    """
+
+    def __init__(self,
+                 client: MemoryServiceClient,
+                 collection_name: str = "chat_history",
+                 user_id: Optional[str] = None,
+                 max_interactions: Optional[int] = None):
+        """打开远程的聊天记忆
+
+        Args:
+            client: 记忆服务客户端
+            collection_name: 角色的基础集合名称
+            user_id: 用户标识
+            max_interactions: 该用户最多保留的对话条数
+        """
+        self.client = client
+        self.collection_name = collection_name
+        self.user_id = user_id
+        self.max_interactions = max_interactions
+        # 让服务端提前打开集合（只读取元数据，很快返回），向量模型不一致等错误在打开时暴露
+        self._call("open")
+
+    def _request(self, op: str, **args: Any) -> Dict[str, Any]:
+        return {
+            "op": op,
+            "collection": self.collection_name,
+            "user_id": self.user_id,
+            "max_interactions": self.max_interactions,
+            "args": args,
+        }
+
+    def _call(self, op: str, **args: Any) -> Any:
+        return self.client.call(self._request(op, **args))
+
+    def count(self) -> int:
+        return self._call("count")
+
+    def add_interaction(self,
+                        user_input: str,
+                        assistant_response: str,
+                        metadata: Dict[Any, Any] = None) -> str:
+        return self._call("add_interaction", user_input=user_input,
+                          assistant_response=assistant_response, metadata=metadata)
+
+    def search_similar_interactions(self, query: str, n_results: int = 5,
+                                    min_similarity: Optional[float] = None) -> Dict:
+        return self._call("search_similar_interactions", query=query, n_results=n_results,
+                          min_similarity=min_similarity)
+
+    def get_interactions_page(self, page: int = 0, page_size: int = 5) -> List[Dict]:
+        return self._call("get_interactions_page", page=page, page_size=page_size)
+
+    def get_all_interactions_sorted(self) -> List[Dict]:
+        return self._call("get_all_interactions_sorted")
+
+    def clear_old_interactions(self, days_to_keep: int = 30) -> int:
+        return self._call("clear_old_interactions", days_to_keep=days_to_keep)
+
+    def clear_all(self) -> int:
+        return self._call("clear_all")
+
+    def drop(self) -> None:
+        self._call("drop")
+
+    # 纯格式化，不需要访问服务
+    format_interactions_for_display = ChatMemory.format_interactions_for_display
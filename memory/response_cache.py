@@ -0,0 +1,222 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 归一化时去掉的空白和标点（中英文）
+_STRIP_PATTERN = re.compile(r"[\s\u2010-\u206f\u3000-\u303f\uff00-\uffef!-/:-@\[-`{-~]+")
+
+CacheKey = Tuple[str, str, str]
+
+
+class CachedResponse:
+    """缓存的回复及其语音"""
+
+    __slots__ = ("reply", "audio_path", "created_at", "hits", "embedding")
+
+    def __init__(self, reply: str, audio_path: Optional[str], embedding=None):
+        self.reply = reply
+        self.audio_path = audio_path
+        self.created_at = time.time()
+        self.hits = 0
+        self.embedding = embedding
+
+
+class ResponseCache:
+    """回复缓存：相同角色版本下相同（或高度相似）的问题直接复用之前的回复和语音
+
+    缓存键为 (角色ID, 角色版本, 归一化后的输入)，角色配置变更后版本变化，旧缓存自然失效。
+    缓存在所有用户之间共享，因此只能写入不含个人信息的回复（提示词中没有用到该用户的长期记忆或事实）。
+    可选地使用向量相似度匹配，相似度高于阈值才视为命中。
+    """
+
+    def __init__(self,
+                 max_entries: int = 1000,
+                 ttl_seconds: float = 86400,
+                 audio_dir: Optional[str] = None,
+                 similarity_threshold: float = 0.95,
+                 embedding_function: Optional[Callable[[List[str]], List[List[float]]]] = None):
+        """初始化回复缓存
+
+        Args:
+            max_entries: 最多缓存的条数，超出后按 LRU 淘汰
+            ttl_seconds: 缓存有效期（秒）
+            audio_dir: 缓存语音文件的目录，为空时不缓存语音
+            similarity_threshold: 向量相似度匹配的阈值（余弦相似度）
+            embedding_function: 向量化函数，为空时只做精确匹配
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.audio_dir = audio_dir
+        self.similarity_threshold = similarity_threshold
+        self.embedding_function = embedding_function
+
+        self._entries: "OrderedDict[CacheKey, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        if audio_dir:
+            os.makedirs(audio_dir, exist_ok=True)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """归一化输入：全角转半角、转小写、去掉空白和标点"""
+        text = unicodedata.normalize("NFKC", text or "").lower()
+        return _STRIP_PATTERN.sub("", text)
+
+    def _embed(self, text: str):
+        import numpy as np
+
+        vector = np.asarray(self.embedding_function([text])[0], dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+    def _is_expired(self, entry: CachedResponse, now: float) -> bool:
+        return now - entry.created_at > self.ttl_seconds
+
+    def get(self, persona_id: str, persona_version: str, text: str) -> Optional[CachedResponse]:
+        """查找缓存的回复
+
+        Args:
+            persona_id: 角色ID
+            persona_version: 角色版本
+            text: 用户输入
+
+        Returns:
+            Optional[CachedResponse]: 命中时返回缓存的回复，否则返回 None
+        """
+        normalized = self.normalize(text)
+        if not normalized:
+            return None
+        key = (persona_id, persona_version, normalized)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._is_expired(entry, now):
+                    self._remove_locked(key)
+                else:
+                    return self._hit_locked(key, entry)
+
+        if self.embedding_function is None:
+            return None
+
+        # 精确匹配未命中时，在同一角色版本的缓存中找最相似的问题
+        import numpy as np
+
+        query = self._embed(normalized)
+        with self._lock:
+            candidates = [
+                (k, e) for k, e in self._entries.items()
+                if k[0] == persona_id and k[1] == persona_version
+                and e.embedding is not None and not self._is_expired(e, now)
+            ]
+            if not candidates:
+                return None
+            scores = np.stack([e.embedding for _, e in candidates]) @ query
+            best = int(np.argmax(scores))
+            if float(scores[best]) < self.similarity_threshold:
+                return None
+            best_key, best_entry = candidates[best]
+            if best_key not in self._entries:
+                return None
+            return self._hit_locked(best_key, best_entry)
+
+    def _hit_locked(self, key: CacheKey, entry: CachedResponse) -> CachedResponse:
+        self._entries.move_to_end(key)
+        entry.hits += 1
+        if entry.audio_path and not os.path.exists(entry.audio_path):
+            entry.audio_path = None
+        return entry
+
+    def put(self,
+            persona_id: str,
+            persona_version: str,
+            text: str,
+            reply: str,
+            audio_path: Optional[str] = None) -> None:
+        """写入一条回复缓存
+
+        Args:
+            persona_id: 角色ID
+            persona_version: 角色版本
+            text: 用户输入
+            reply: AI回复
+            audio_path: 回复对应的语音文件路径，会被复制到缓存目录
+        """
+        normalized = self.normalize(text)
+        if not normalized or not reply:
+            return
+        key = (persona_id, persona_version, normalized)
+        embedding = self._embed(normalized) if self.embedding_function is not None else None
+        cached_audio = self._store_audio(key, audio_path)
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None and previous.audio_path and previous.audio_path != cached_audio:
+                self._delete_audio(previous.audio_path)
+            self._entries[key] = CachedResponse(reply, cached_audio, embedding)
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove_locked(oldest_key)
+
+    def update_audio(self, persona_id: str, persona_version: str, text: str, audio_path: str) -> None:
+        """为已缓存的回复补充语音（缓存的语音文件丢失后重新合成时使用）"""
+        key = (persona_id, persona_version, self.normalize(text))
+        cached_audio = self._store_audio(key, audio_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.audio_path = cached_audio
+
+    def invalidate(self, persona_id: Optional[str] = None) -> int:
+        """清除某个角色（或全部）的缓存
+
+        Returns:
+            int: 清除的条数
+        """
+        with self._lock:
+            keys = [k for k in self._entries if persona_id is None or k[0] == persona_id]
+            for key in keys:
+                self._remove_locked(key)
+            return len(keys)
+
+    def _store_audio(self, key: CacheKey, audio_path: Optional[str]) -> Optional[str]:
+        if not audio_path or not self.audio_dir or not os.path.exists(audio_path):
+            return None
+        digest = hashlib.sha1("\0".join(key).encode("utf-8")).hexdigest()
+        ext = os.path.splitext(audio_path)[1] or ".wav"
+        target = os.path.join(self.audio_dir, f"{digest}{ext}")
+        try:
+            shutil.copyfile(audio_path, target)
+            return target
+        except OSError as e:
+            logger.warning("缓存语音文件失败 %s: %s", audio_path, str(e))
+            return None
+
+    def _remove_locked(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry.audio_path:
+            self._delete_audio(entry.audio_path)
+
+    @staticmethod
+    def _delete_audio(audio_path: str) -> None:
+        try:
+            os.remove(audio_path)
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        """缓存统计信息"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": sum(e.hits for e in self._entries.values()),
+            }
@@ -0,0 +1,263 @@
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from .chat_memory import ChatMemory
+
+logger = logging.getLogger(__name__)
+
+# 允许远程调用的 ChatMemory 方法，以及是否会修改集合（修改操作在同一集合上串行执行）
+OPERATIONS = {
+    "open": False,
+    "count": False,
+    "add_interaction": True,
+    "search_similar_interactions": False,
+    "get_interactions_page": False,
+    "get_all_interactions_sorted": False,
+    "clear_old_interactions": True,
+    "clear_all": True,
+    "drop": True,
+}
+
+
+def _jsonable(value: Any) -> Any:
+    """把 Chroma 的返回值转换为可以 JSON 序列化的结构（numpy 数组转为列表）"""
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+class MemoryService:
+    """长期记忆服务：在单个进程中持有向量数据库，供多个应用进程通过 HTTP 访问
+
+    Chroma 的嵌入式存储 (SQLite + HNSW) 不能被多个进程同时写入，因此由本服务独占存储，
+    按 (集合, 用户) 缓存打开的 ChatMemory。同一集合上的写操作串行执行，读操作可以并发；
+    批量请求中不同集合的操作并行执行，同一集合的操作保持提交顺序。
+    """
+
+    def __init__(self,
+                 persist_directory: str = "./memory/chat_memory",
+                 hnsw: Optional[Dict[str, Any]] = None,
+                 embedding_provider=None,
+                 dedup_similarity: Optional[float] = None,
+                 cache_limit_mb: Optional[float] = None,
+                 max_open: int = 256,
+                 workers: int = 8):
+        """初始化记忆服务
+
+        Args:
+            persist_directory: 向量数据库存储目录
+            hnsw: 向量索引参数
+            embedding_provider: 向量模型
+            dedup_similarity: 写入时的去重阈值
+            cache_limit_mb: Chroma 常驻内存的向量索引总上限（MB）
+            max_open: 最多同时缓存的 ChatMemory 数，超出后按 LRU 关闭
+            workers: 执行批量请求的线程数
+        """
+        self.persist_directory = persist_directory
+        self.hnsw = hnsw
+        self.embedding_provider = embedding_provider
+        self.dedup_similarity = dedup_similarity
+        self.cache_limit_mb = cache_limit_mb
+        self.max_open = max_open
+        self._memories: "OrderedDict[Tuple[str, Optional[str]], ChatMemory]" = OrderedDict()
+        # 与 _memories 一一对应，随集合一起淘汰
+        self._write_locks: Dict[Tuple[str, Optional[str]], threading.Lock] = {}
+        # 正在被请求使用的集合及使用数，在 _lock 内增减；使用中的集合不会被淘汰
+        self._pins: Dict[Tuple[str, Optional[str]], int] = {}
+        self._opening: Dict[Tuple[str, Optional[str]], Future] = {}  # 正在打开的集合，同一集合只打开一次
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="memory-service")
+        self.stats = {"calls": 0, "batches": 0, "errors": 0}
+
+    def _acquire(self, collection: str, user_id: Optional[str], max_interactions: Optional[int]
+                 ) -> Tuple[ChatMemory, threading.Lock]:
+        """取出（必要时打开）集合对应的 ChatMemory 及其写锁，并标记为使用中，用完后调用 _release
+
+        打开集合只读取元数据，不会重新向量化（见 ChatMemory._open_collection），
+        在锁外进行，同一集合的并发请求等待同一次打开，不阻塞其他集合。
+        使用标记与取出在同一次加锁中完成，取出后到请求结束前集合不会被淘汰。
+        """
+        key = (collection, user_id)
+        while True:
+            with self._lock:
+                memory = self._memories.get(key)
+                if memory is not None:
+                    self._memories.move_to_end(key)
+                    memory.max_interactions = max_interactions
+                    self._pins[key] = self._pins.get(key, 0) + 1
+                    return memory, self._write_locks[key]
+                future = self._opening.get(key)
+                owner = future is None
+                if owner:
+                    future = Future()
+                    self._opening[key] = future
+            if not owner:
+                future.result()
+                continue
+            try:
+                memory = ChatMemory(
+                    persist_directory=self.persist_directory,
+                    collection_name=collection,
+                    user_id=user_id,
+                    max_interactions=max_interactions,
+                    hnsw=self.hnsw,
+                    embedding_provider=self.embedding_provider,
+                    dedup_similarity=self.dedup_similarity,
+                    cache_limit_mb=self.cache_limit_mb,
+                )
+            except BaseException as e:
+                with self._lock:
+                    self._opening.pop(key, None)
+                future.set_exception(e)
+                raise
+            write_lock = threading.Lock()
+            with self._lock:
+                self._opening.pop(key, None)
+                self._memories[key] = memory
+                self._write_locks[key] = write_lock
+                self._pins[key] = self._pins.get(key, 0) + 1
+                self._evict_locked()
+            future.set_result(None)
+            return memory, write_lock
+
+    def _release(self, key: Tuple[str, Optional[str]]) -> None:
+        """请求结束，取消使用标记；之前因使用中而未能淘汰的集合在这里补上淘汰"""
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        """按 LRU 关闭超出数量的集合，使用中的集合跳过"""
+        for key in list(self._memories):
+            if len(self._memories) <= self.max_open:
+                break
+            if key in self._pins:
+                continue
+            del self._memories[key]
+            del self._write_locks[key]
+
+    def call(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """执行单个请求
+
+        Args:
+            request: {"op", "collection", "user_id", "max_interactions", "args"}
+
+        Returns:
+            Dict[str, Any]: {"ok": True, "result": ...} 或 {"ok": False, "error": ..., "type": ...}
+        """
+        self.stats["calls"] += 1
+        op = request.get("op")
+        try:
+            if op not in OPERATIONS:
+                raise ValueError(f"不支持的操作: {op}")
+            key = (request["collection"], request.get("user_id") or None)
+            memory, write_lock = self._acquire(*key, request.get("max_interactions"))
+            try:
+                args = request.get("args") or {}
+                if op == "open":
+                    result = None
+                elif op == "count":
+                    result = memory.collection.count()
+                elif OPERATIONS[op]:
+                    with write_lock:
+                        result = getattr(memory, op)(**args)
+                        if op == "drop":
+                            with self._lock:
+                                if self._memories.get(key) is memory:
+                                    del self._memories[key]
+                                    del self._write_locks[key]
+                else:
+                    result = getattr(memory, op)(**args)
+            finally:
+                self._release(key)
+            return {"ok": True, "result": _jsonable(result)}
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning("记忆服务请求 %s 失败: %s", op, str(e))
+            return {"ok": False, "error": str(e), "type": type(e).__name__}
+
+    def batch(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """执行一批请求，按集合分组并行，同一集合内按提交顺序执行
+
+        Returns:
+            List[Dict[str, Any]]: 与请求一一对应的结果
+        """
+        self.stats["batches"] += 1
+        groups: Dict[Tuple[Any, Any], List[int]] = defaultdict(list)
+        for index, request in enumerate(requests):
+            groups[(request.get("collection"), request.get("user_id") or None)].append(index)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+
+        def run(indexes: List[int]) -> None:
+            for index in indexes:
+                results[index] = self.call(requests[index])
+
+        futures = [self._executor.submit(run, indexes) for indexes in groups.values()]
+        for future in futures:
+            future.result()
+        return results
+
+    def status(self) -> Dict[str, Any]:
+        """服务状态：打开的集合数、使用中的集合数和请求统计"""
+        with self._lock:
+            return {
+                "open_collections": len(self._memories),
+                "pinned_collections": len(self._pins),
+                "opening_collections": len(self._opening),
+                **self.stats,
+            }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            self._memories.clear()
+            self._write_locks.clear()
+
+
+def create_app(service: MemoryService):
+    """创建记忆服务的 FastAPI 应用
+
+    接口:
+        POST /call   单个请求
+        POST /batch  {"requests": [...]}，返回 {"results": [...]}
+        GET  /health 服务状态
+    """
+    from fastapi import FastAPI
+
+    app = FastAPI(title="memory-service")
+
+    # 使用同步函数，由 FastAPI 的线程池执行，不阻塞事件循环
+    @app.post("/call")
+    def call(request: Dict[str, Any]):
+        return service.call(request)
+
+    @app.post("/batch")
+    def batch(body: Dict[str, Any]):
+        return {"results": service.batch(body.get("requests") or [])}
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok", **service.status()}
+
+    return app
+
+
+def serve(service: MemoryService, host: str = "127.0.0.1", port: int = 8765) -> None:
+    """启动记忆服务（阻塞）"""
+    import uvicorn
+
+    uvicorn.run(create_app(service), host=host, port=port, log_level="warning")
@@ -1,71 +1,99 @@
-from typing import List, Dict, Any
-from langchain.memory import ConversationBufferWindowMemory
-from langchain.schema import BaseChatMessageHistory
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple
+
+_ROLE_LABELS = {"user": "用户", "assistant": "AI"}
+
 
 class ShortTermMemory:
-    def __init__(self, k: int = 5):
+    """短期记忆：按轮数和字符数限制的滑动窗口
+
+    每条消息在写入时就格式化好，格式化后的历史随写入和淘汰增量维护，
+    读取历史时不再逐条重建。
+    """
+
+    __slots__ = ("k", "max_chars", "_messages", "_chars", "_formatted")
+
+    def __init__(self, k: int = 5, max_chars: Optional[int] = None):
         """初始化短期记忆
-        
+
         Args:
             k: 保留的对话轮数
+            max_chars: 格式化后历史的最大字符数，为空时不限制
         """
-        self.memory = ConversationBufferWindowMemory(
-            k=k,
-            return_messages=True,
-            memory_key="history",
-            input_key="input"
-        )
-        
+        self.k = k
+        self.max_chars = max_chars
+        # 每个元素为 (role, content, formatted_line)
+        self._messages: "deque[Tuple[str, str, str]]" = deque()
+        self._chars = 0  # 所有格式化行的总长度（含换行符）
+        self._formatted = ""
+
+    def _append(self, role: str, content: str) -> None:
+        line = f"{_ROLE_LABELS[role]}: {content}"
+        self._messages.append((role, content, line))
+        self._chars += len(line) + 1
+        self._formatted = f"{self._formatted}\n{line}" if len(self._messages) > 1 else line
+        self._evict()
+
+    def _evict(self) -> None:
+        """淘汰超出轮数或字符数限制的最旧消息（至少保留最新一条）"""
+        max_messages = self.k * 2
+        evicted = False
+        while len(self._messages) > 1 and (
+            len(self._messages) > max_messages
+            or (self.max_chars is not None and self._chars - 1 > self.max_chars)
+        ):
+            self._pop_oldest()
+            evicted = True
+        # 不保留失去对应用户消息的AI回复
+        if evicted and len(self._messages) > 1 and self._messages[0][0] == "assistant":
+            self._pop_oldest()
+
+    def _pop_oldest(self) -> None:
+        _, _, line = self._messages.popleft()
+        self._chars -= len(line) + 1
+        self._formatted = self._formatted[len(line) + 1:]
+
     def add_user_message(self, message: str) -> None:
         """添加用户消息
-        
+
         Args:
             message: 用户消息内容
         """
-        self.memory.chat_memory.add_user_message(message)
-        
+        self._append("user", message)
+
     def add_ai_message(self, message: str) -> None:
         """添加AI消息
-        
+
         Args:
             message: AI消息内容
         """
-        self.memory.chat_memory.add_ai_message(message)
-        
+        self._append("assistant", message)
+
     def get_messages(self) -> List[Dict[str, str]]:
         """获取所有消息历史
-        
+
         Returns:
             List[Dict[str, str]]: 消息历史列表
         """
-        messages = []
-        for msg in self.memory.chat_memory.messages:
-            messages.append({
-                "role": "user" if msg.type == "human" else "assistant",
-                "content": msg.content
-            })
-        return messages
-    
+        return [{"role": role, "content": content} for role, content, _ in self._messages]
+
     def get_formatted_history(self) -> str:
         """获取格式化的历史记录
-        
+
         Returns:
             str: 格式化的历史记录
         """
-        messages = self.get_messages()
-        formatted = []
-        for msg in messages:
-            role = "用户" if msg["role"] == "user" else "AI"
-            formatted.append(f"{role}: {msg['content']}")
-        return "\n".join(formatted)
-    
+        return self._formatted
+
     def clear(self) -> None:
         """清空记忆"""
-        self.memory.chat_memory.clear()
-        
+        self._messages.clear()
+        self._chars = 0
+        self._formatted = ""
+
     def load_memory(self, messages: List[Dict[str, str]]) -> None:
         """加载历史消息
-        
+
         Args:
             messages: 消息列表，每个消息包含 role 和 content
         """
@@ -75,18 +103,29 @@ class ShortTermMemory:
                 self.add_user_message(msg["content"])
             else:
                 self.add_ai_message(msg["content"])
-                
+
+    def load_interactions(self, interactions: List[Dict[str, Any]]) -> None:
+        """从长期记忆的对话记录恢复短期记忆（用于重连后续接上下文）
+
+        Args:
+            interactions: ChatMemory 返回的对话记录，按时间倒序排列（最新的在前）
+        """
+        self.clear()
+        for interaction in reversed(interactions[:self.k]):
+            self.add_user_message(interaction["user_input"])
+            self.add_ai_message(interaction["assistant_response"])
+
     def get_relevant_history(self, query: str, k: int = 3) -> List[Dict[str, str]]:
         """获取与查询相关的历史消息
-        
+
         Args:
             query: 查询内容
             k: 返回的消息数量
-            
+
         Returns:
             List[Dict[str, str]]: 相关消息列表
         """
         # 简单实现：返回最近的k条消息
         # 后续可以添加相关性计算
         messages = self.get_messages()
-        return messages[-k:] if len(messages) > k else messages 
\ No newline at end of file
+        return messages[-k:] if len(messages) > k else messages
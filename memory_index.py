@@ -0,0 +1,286 @@
+"""长期记忆向量索引 (HNSW) 的查看、重建与调参工具
+
+    show     列出向量数据库中的集合、记录数和当前的 HNSW 参数
+    rebuild  按 config.CHAT_MEMORY_HNSW 重建已有集合（复制向量到新集合，校验后替换，原集合保留为备份），
+             加 --reembed 时用 config 中配置的向量模型重新向量化
+    tune     在真实集合上对比不同 HNSW 参数的召回率 recall@k（以精确的暴力检索为准）和检索延迟
+
+用法:
+    python memory_index.py show
+    python memory_index.py rebuild --all                       # 重建前请先停止应用
+    python memory_index.py rebuild --collection chat_history --space cosine --m 32
+    python memory_index.py rebuild --all --reembed             # 更换向量模型后重新向量化（应用不会自动进行）
+    python memory_index.py tune --collection chat_history --k 3 --m 16,32 --ef-search 50,100,200 \\
+        --target-recall 0.95 --json tune.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import statistics
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from config import *  # 导入所有配置项
+from memory import create_embedding_provider
+from memory.chat_memory import (
+    BACKUP_MARKER, EMBEDDING_MODEL_KEY, HNSW_REBUILD_KEYS, LEGACY_EMBEDDING_MODEL, REBUILD_SUFFIX,
+    collection_names, hnsw_settings, rebuild_collection,
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def open_client(persist_directory: str):
+    import chromadb
+
+    return chromadb.PersistentClient(path=persist_directory)
+
+
+def iter_records(collection, batch_size: int, include: List[str]) -> Iterator[Dict[str, Any]]:
+    """按写入顺序分批读取集合中的记录"""
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        yield collection.get(offset=offset, limit=batch_size, include=include)
+
+
+def hnsw_from_args(args) -> Dict[str, Any]:
+    """以 config.CHAT_MEMORY_HNSW 为基础，用命令行参数覆盖"""
+    hnsw = dict(CHAT_MEMORY_HNSW)
+    for key, value in (("space", args.space), ("max_neighbors", args.m),
+                       ("ef_construction", args.ef_construction), ("ef_search", args.ef_search)):
+        if value is not None:
+            hnsw[key] = value
+    return hnsw
+
+
+def cmd_show(args) -> None:
+    client = open_client(args.persist_directory)
+    for name in collection_names(client):
+        collection = client.get_collection(name, embedding_function=None)
+        settings = hnsw_settings(collection)
+        params = " ".join(f"{k}={settings.get(k)}" for k in (*HNSW_REBUILD_KEYS, "ef_search"))
+        model = (collection.metadata or {}).get(EMBEDDING_MODEL_KEY, LEGACY_EMBEDDING_MODEL)
+        print(f"{name:<50} {collection.count():>10}  {params}  {model}")
+
+
+def cmd_rebuild(args) -> None:
+    client = open_client(args.persist_directory)
+    hnsw = hnsw_from_args(args)
+    if args.all:
+        names = [n for n in collection_names(client)
+                 if BACKUP_MARKER not in n and not n.endswith(REBUILD_SUFFIX)]
+    else:
+        names = args.collection or []
+    if not names:
+        logger.error("请用 --collection 指定集合，或用 --all 重建全部集合")
+        sys.exit(1)
+
+    provider = None
+    if args.reembed:
+        provider = create_embedding_provider(
+            backend=EMBEDDING_BACKEND,
+            model_dir=EMBEDDING_MODEL_DIR,
+            quantize=EMBEDDING_QUANTIZE,
+            threads=EMBEDDING_THREADS,
+            max_length=EMBEDDING_MAX_LENGTH,
+            pooling=EMBEDDING_POOLING,
+            query_prefix=EMBEDDING_QUERY_PREFIX,
+            document_prefix=EMBEDDING_DOCUMENT_PREFIX,
+            version=EMBEDDING_VERSION,
+            batch_size=EMBEDDING_BATCH_SIZE,
+            batch_wait_ms=0,
+        )
+
+    for name in names:
+        collection = client.get_collection(name, embedding_function=None)
+        current = hnsw_settings(collection)
+        same_model = provider is None or \
+            (collection.metadata or {}).get(EMBEDDING_MODEL_KEY, LEGACY_EMBEDDING_MODEL) == provider.model_id
+        if not args.force and same_model and all(current.get(k) == hnsw.get(k) for k in HNSW_REBUILD_KEYS):
+            if current.get("ef_search") != hnsw.get("ef_search"):
+                collection.modify(configuration={"hnsw": {"ef_search": hnsw["ef_search"]}})
+                logger.info("%s: 已更新 ef_search=%s", name, hnsw["ef_search"])
+            else:
+                logger.info("%s: 参数未变化，跳过", name)
+            continue
+        rebuild_collection(client, name, hnsw, embedding_provider=provider,
+                           batch_size=args.batch_size, drop_backup=args.drop_backup)
+
+
+def load_vectors(collection, limit: int, batch_size: int) -> Tuple[List[str], np.ndarray]:
+    ids: List[str] = []
+    vectors = []
+    for batch in iter_records(collection, batch_size, ["embeddings"]):
+        ids.extend(batch["ids"])
+        vectors.append(np.asarray(batch["embeddings"], dtype=np.float32))
+        if len(ids) >= limit:
+            break
+    if not vectors:
+        return [], np.zeros((0, 0), dtype=np.float32)
+    return ids[:limit], np.concatenate(vectors)[:limit]
+
+
+def exact_top_k(data: np.ndarray, queries: np.ndarray, k: int, space: str, block: int = 100000) -> np.ndarray:
+    """暴力检索每个查询的前 k 个近邻（返回按距离从近到远排列的下标），按块计算以控制内存"""
+    if space == "cosine":
+        data = data / np.maximum(np.linalg.norm(data, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_index = np.zeros((len(queries), 0), dtype=np.int64)
+    for offset in range(0, len(data), block):
+        chunk = data[offset:offset + block]
+        if space == "l2":
+            # 分数越大越近：-(|q|^2 - 2 q·d + |d|^2)，|q|^2 对排序无影响
+            scores = 2 * queries @ chunk.T - np.sum(chunk ** 2, axis=1)
+        else:
+            scores = queries @ chunk.T
+        scores = np.concatenate([best_scores, scores], axis=1)
+        index = np.concatenate([best_index, np.arange(offset, offset + len(chunk))[None, :].repeat(len(queries), 0)], axis=1)
+        keep = min(k, scores.shape[1])
+        top = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_index = np.take_along_axis(index, top, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_index, order, axis=1)
+
+
+def measure(collection, query_ids: List[str], queries: np.ndarray, truth: List[set], k: int) -> Dict[str, float]:
+    """逐条查询（与线上一致），统计 recall@k 和延迟；查询向量本身的记录不计入结果"""
+    latencies = []
+    recalls = []
+    for query_id, query, expected in zip(query_ids, queries, truth):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k + 1, include=["distances"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        found = [i for i in result["ids"][0] if i != query_id][:k]
+        recalls.append(len(expected.intersection(found)) / len(expected) if expected else 1.0)
+    latencies.sort()
+    return {
+        "recall": round(statistics.mean(recalls), 4),
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+        "mean_ms": round(statistics.mean(latencies), 3),
+    }
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def cmd_tune(args) -> None:
+    import chromadb
+
+    client = open_client(args.persist_directory)
+    collection = client.get_collection(args.collection, embedding_function=None)
+    current = hnsw_settings(collection)
+    space = args.space or current.get("space") or CHAT_MEMORY_HNSW["space"]
+
+    ids, data = load_vectors(collection, args.sample, args.batch_size)
+    if len(ids) <= args.k:
+        logger.error("集合 %s 只有 %d 条记录，无法评估", args.collection, len(ids))
+        sys.exit(1)
+    rng = np.random.default_rng(args.seed)
+    query_index = rng.choice(len(ids), size=min(args.queries, len(ids)), replace=False)
+    query_ids = [ids[i] for i in query_index]
+    queries = data[query_index]
+    logger.info("样本 %d 条向量（集合共 %d 条），%d 个查询，space=%s",
+                len(ids), collection.count(), len(query_ids), space)
+
+    exact = exact_top_k(data, queries, args.k + 1, space)
+    # 查询向量本身一定是最近邻，从标准答案中排除
+    truth = [set([ids[j] for j in row if ids[j] != qid][:args.k]) for qid, row in zip(query_ids, exact)]
+
+    rows = []
+    if len(ids) == collection.count():
+        # 样本即全量时，真实集合的结果可以直接与暴力检索对比
+        rows.append({"config": "current", **{k: current.get(k) for k in (*HNSW_REBUILD_KEYS, "ef_search")},
+                     **measure(collection, query_ids, queries, truth, args.k)})
+
+    scratch = chromadb.EphemeralClient()
+    for m, ef_construction, ef_search in itertools.product(args.m, args.ef_construction, args.ef_search):
+        hnsw = {"space": space, "max_neighbors": m, "ef_construction": ef_construction, "ef_search": ef_search}
+        name = f"tune_m{m}_c{ef_construction}_s{ef_search}"
+        candidate = scratch.create_collection(name, configuration={"hnsw": hnsw}, embedding_function=None)
+        start = time.perf_counter()
+        for offset in range(0, len(ids), args.batch_size):
+            candidate.add(ids=ids[offset:offset + args.batch_size],
+                          embeddings=data[offset:offset + args.batch_size])
+        build_s = time.perf_counter() - start
+        row = {"config": name, **hnsw, "build_s": round(build_s, 2),
+               **measure(candidate, query_ids, queries, truth, args.k)}
+        rows.append(row)
+        logger.info("%s: recall@%d=%.4f p95=%.2f ms 建索引 %.1f 秒",
+                    name, args.k, row["recall"], row["p95_ms"], build_s)
+        scratch.delete_collection(name)
+
+    print(f"\n{'配置':<28}{'space':>8}{'M':>5}{'ef_c':>6}{'ef_s':>6}{'recall':>9}{'p50ms':>9}{'p95ms':>9}")
+    for row in rows:
+        print(f"{row['config']:<28}{str(row.get('space')):>8}{str(row.get('max_neighbors')):>5}"
+              f"{str(row.get('ef_construction')):>6}{str(row.get('ef_search')):>6}"
+              f"{row['recall']:>9.4f}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}")
+
+    candidates = [r for r in rows if r["config"] != "current"]
+    qualified = [r for r in candidates if r["recall"] >= args.target_recall
+                 and (args.latency_budget_ms is None or r["p95_ms"] <= args.latency_budget_ms)]
+    best = min(qualified, key=lambda r: r["p95_ms"]) if qualified else max(candidates, key=lambda r: r["recall"])
+    if qualified:
+        print(f"\n满足 recall@{args.k} >= {args.target_recall} 的最快配置: {best['config']}")
+    else:
+        print(f"\n没有配置满足要求，召回率最高的配置: {best['config']}")
+    print("CHAT_MEMORY_HNSW = " + json.dumps({k: best[k] for k in (*HNSW_REBUILD_KEYS, "ef_search")}))
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({"collection": args.collection, "count": collection.count(), "sample": len(ids),
+                       "queries": len(query_ids), "k": args.k, "rows": rows, "recommended": best},
+                      f, ensure_ascii=False, indent=4)
+        logger.info("报告已保存到: %s", args.json_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="长期记忆向量索引 (HNSW) 工具")
+    parser.add_argument("--persist-directory", default=CHAT_MEMORY_DIR, help="向量数据库存储目录")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    show = subparsers.add_parser("show", help="列出集合及其索引参数")
+    show.set_defaults(func=cmd_show)
+
+    rebuild = subparsers.add_parser("rebuild", help="按新的参数重建集合（请先停止应用）")
+    rebuild.add_argument("--collection", action="append", help="要重建的集合，可重复指定")
+    rebuild.add_argument("--all", action="store_true", help="重建全部集合（包括各用户分区）")
+    rebuild.add_argument("--space", choices=["cosine", "l2", "ip"], default=None)
+    rebuild.add_argument("--m", type=int, default=None, help="max_neighbors")
+    rebuild.add_argument("--ef-construction", type=int, default=None)
+    rebuild.add_argument("--ef-search", type=int, default=None)
+    rebuild.add_argument("--batch-size", type=int, default=1000)
+    rebuild.add_argument("--reembed", action="store_true", help="用 config 中配置的向量模型重新向量化")
+    rebuild.add_argument("--force", action="store_true", help="参数未变化时也重建")
+    rebuild.add_argument("--drop-backup", action="store_true", help="重建成功后删除原集合")
+    rebuild.set_defaults(func=cmd_rebuild)
+
+    tune = subparsers.add_parser("tune", help="对比不同参数的召回率和检索延迟")
+    tune.add_argument("--collection", required=True)
+    tune.add_argument("--k", type=int, default=3, help="recall@k 的 k，与 RETRIEVAL_N_RESULTS 一致")
+    tune.add_argument("--queries", type=int, default=200, help="查询数")
+    tune.add_argument("--sample", type=int, default=100000, help="最多使用的向量数")
+    tune.add_argument("--space", choices=["cosine", "l2", "ip"], default=None, help="默认沿用集合当前的度量")
+    tune.add_argument("--m", type=_int_list, default=[16, 32], help="max_neighbors 候选，逗号分隔")
+    tune.add_argument("--ef-construction", type=_int_list, default=[100, 200], help="逗号分隔")
+    tune.add_argument("--ef-search", type=_int_list, default=[50, 100, 200], help="逗号分隔")
+    tune.add_argument("--target-recall", type=float, default=0.95)
+    tune.add_argument("--latency-budget-ms", type=float, default=None, help="p95 检索延迟预算（毫秒）")
+    tune.add_argument("--batch-size", type=int, default=1000)
+    tune.add_argument("--seed", type=int, default=0)
+    tune.add_argument("--json", dest="json_path", default=None, help="把结果写入 JSON 文件")
+    tune.set_defaults(func=cmd_tune)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
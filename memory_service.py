@@ -0,0 +1,59 @@
+"""长期记忆服务
+
+Chroma 的嵌入式向量数据库不能被多个进程同时写入。本服务独占向量数据库，
+通过 HTTP 提供 ChatMemory 的读写操作，多个应用进程（例如负载均衡后的多个 Chainlit 实例）
+设置 MEMORY_SERVICE_URL 后即可共享同一份长期记忆。
+
+用法:
+    python memory_service.py --port 8765
+    MEMORY_SERVICE_URL=http://127.0.0.1:8765 chainlit run app.py --port 8001
+    MEMORY_SERVICE_URL=http://127.0.0.1:8765 chainlit run app.py --port 8002
+"""
+import argparse
+import logging
+
+from config import *  # 导入所有配置项
+from memory import create_embedding_provider
+from memory.service import MemoryService, serve
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="长期记忆服务")
+    parser.add_argument("--host", default=MEMORY_SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=MEMORY_SERVICE_PORT)
+    parser.add_argument("--persist-directory", default=CHAT_MEMORY_DIR, help="向量数据库存储目录")
+    parser.add_argument("--max-open", type=int, default=256, help="最多同时打开的集合数")
+    parser.add_argument("--workers", type=int, default=8, help="执行批量请求的线程数")
+    args = parser.parse_args()
+
+    embedding_provider = create_embedding_provider(
+        backend=EMBEDDING_BACKEND,
+        model_dir=EMBEDDING_MODEL_DIR,
+        quantize=EMBEDDING_QUANTIZE,
+        threads=EMBEDDING_THREADS,
+        max_length=EMBEDDING_MAX_LENGTH,
+        pooling=EMBEDDING_POOLING,
+        query_prefix=EMBEDDING_QUERY_PREFIX,
+        document_prefix=EMBEDDING_DOCUMENT_PREFIX,
+        version=EMBEDDING_VERSION,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        batch_wait_ms=EMBEDDING_BATCH_WAIT_MS,
+    )
+    service = MemoryService(
+        persist_directory=args.persist_directory,
+        hnsw=CHAT_MEMORY_HNSW,
+        embedding_provider=embedding_provider,
+        dedup_similarity=MEMORY_DEDUP_SIMILARITY,
+        cache_limit_mb=CHAT_MEMORY_CACHE_LIMIT_MB,
+        max_open=args.max_open,
+        workers=args.workers,
+    )
+    logger.info("记忆服务已启动: http://%s:%d (存储目录 %s)", args.host, args.port, args.persist_directory)
+    serve(service, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+from .registry import Persona, PersonaRegistry
+
+__all__ = ['Persona', 'PersonaRegistry']
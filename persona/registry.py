@@ -0,0 +1,282 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional
+
+from memory import ChatMemory, RemoteChatMemory
+from memory.chat_memory import partition_collection_name
+from prompts.prompt_generator import generate_prompt
+
+logger = logging.getLogger(__name__)
+
+
+class Persona:
+    """单个数字分身：人设配置、编译后的提示词、按用户分区的向量集合和 TTS 参考音频"""
+
+    def __init__(self,
+                 persona_id: str,
+                 name: str,
+                 config_path: str,
+                 collection_name: str,
+                 tts_ref_wav_path: str,
+                 tts_ref_text: str,
+                 avatar_path: str = "",
+                 description: str = "",
+                 chat_memory_dir: str = "./memory/chat_memory",
+                 response_cache: bool = True,
+                 hnsw: Optional[Dict[str, Any]] = None,
+                 embedding_provider=None,
+                 dedup_similarity: Optional[float] = None,
+                 cache_limit_mb: Optional[float] = None,
+                 memory_client=None):
+        self.persona_id = persona_id
+        self.name = name
+        self.description = description
+        self.config_path = config_path
+        self.collection_name = collection_name
+        self.tts_ref_wav_path = tts_ref_wav_path
+        self.tts_ref_text = tts_ref_text
+        self.avatar_path = avatar_path
+        self.chat_memory_dir = chat_memory_dir
+        self.response_cache = response_cache  # 是否允许使用回复缓存
+        self.hnsw = hnsw  # 向量索引参数
+        self.embedding_provider = embedding_provider  # 所有角色共用的向量模型
+        self.dedup_similarity = dedup_similarity  # 长期记忆写入时的去重阈值
+        self.cache_limit_mb = cache_limit_mb  # Chroma 常驻内存的向量索引总上限
+        self.memory_client = memory_client  # 记忆服务客户端，设置后通过记忆服务访问长期记忆
+
+        self.prompt = ""
+        self.version = ""
+        self.avatar_bytes: Optional[bytes] = None
+
+    def load(self) -> None:
+        """加载人设配置、编译提示词并读取头像"""
+        with open(self.config_path, 'rb') as f:
+            config_bytes = f.read()
+        # 配置内容的哈希作为角色版本，配置变更后缓存等可据此失效
+        self.version = hashlib.sha1(config_bytes).hexdigest()[:12]
+        self.prompt = generate_prompt(self.config_path)
+
+        if self.avatar_path and os.path.exists(self.avatar_path):
+            try:
+                with open(self.avatar_path, 'rb') as f:
+                    self.avatar_bytes = f.read()
+            except OSError as e:
+                logger.warning("加载角色头像失败 %s: %s", self.avatar_path, str(e))
+
+        logger.info("已加载角色 %s (版本 %s)", self.persona_id, self.version)
+
+    def unload(self) -> None:
+        """释放提示词和头像，角色被淘汰时调用"""
+        self.prompt = ""
+        self.avatar_bytes = None
+
+    def open_memory(self, user_id: Optional[str], max_interactions: Optional[int] = None):
+        """打开某个用户在该角色下的长期记忆分区
+
+        Args:
+            user_id: 用户标识，为空时使用角色的基础集合
+            max_interactions: 该用户的记录配额，只对用户分区生效
+
+        Returns:
+            ChatMemory | RemoteChatMemory: 限定在该用户分区内的记忆存储
+        """
+        if not user_id:
+            # 基础集合由所有匿名会话共用，可能包含分区之前的全部历史数据，不按单个用户的配额删除
+            max_interactions = None
+        if self.memory_client is not None:
+            return RemoteChatMemory(
+                self.memory_client,
+                collection_name=self.collection_name,
+                user_id=user_id,
+                max_interactions=max_interactions,
+            )
+        return ChatMemory(
+            persist_directory=self.chat_memory_dir,
+            collection_name=self.collection_name,
+            user_id=user_id,
+            max_interactions=max_interactions,
+            hnsw=self.hnsw,
+            embedding_provider=self.embedding_provider,
+            dedup_similarity=self.dedup_similarity,
+            cache_limit_mb=self.cache_limit_mb,
+        )
+
+    def memory_scope(self, user_id: Optional[str]) -> str:
+        """用户在该角色下的记忆分区标识，与长期记忆的集合名称一致，事实库等按此隔离"""
+        return partition_collection_name(self.collection_name, user_id)
+
+
+class PersonaRegistry:
+    """角色注册表：按需加载角色，常驻角色数超出上限时按 LRU 淘汰空闲角色
+
+    角色只持有提示词和头像，淘汰时释放；长期记忆的向量集合不归角色持有，不由注册表管理，
+    其常驻内存由 Chroma 的 LRU 段缓存限制（cache_limit_mb）。
+    """
+
+    def __init__(self,
+                 personas: Dict[str, Dict[str, Any]],
+                 default_persona: str,
+                 max_loaded: int = 8,
+                 chat_memory_dir: str = "./memory/chat_memory",
+                 hnsw: Optional[Dict[str, Any]] = None,
+                 embedding_provider=None,
+                 dedup_similarity: Optional[float] = None,
+                 cache_limit_mb: Optional[float] = None,
+                 memory_client=None):
+        """初始化角色注册表
+
+        Args:
+            personas: 角色定义，键为角色ID
+            default_persona: 默认角色ID
+            max_loaded: 同时常驻的角色数上限
+            chat_memory_dir: 向量数据库存储目录
+            hnsw: 向量索引参数，所有角色共用
+            embedding_provider: 向量模型，所有角色共用，为空时使用 Chroma 的默认模型
+            dedup_similarity: 长期记忆写入时的去重阈值，为空时不去重
+            cache_limit_mb: Chroma 常驻内存的向量索引总上限（MB），为空时不限制
+            memory_client: 记忆服务客户端 (MemoryServiceClient)，设置后长期记忆通过记忆服务读写
+        """
+        if default_persona not in personas:
+            raise ValueError(f"默认角色不存在: {default_persona}")
+        self.personas = personas
+        self.default_persona = default_persona
+        self.max_loaded = max_loaded
+        self.chat_memory_dir = chat_memory_dir
+        self.hnsw = hnsw
+        self.embedding_provider = embedding_provider
+        self.dedup_similarity = dedup_similarity
+        self.cache_limit_mb = cache_limit_mb
+        self.memory_client = memory_client
+
+        self._loaded: "OrderedDict[str, Persona]" = OrderedDict()
+        self._refcounts: Dict[str, int] = {}
+        self._loading: Dict[str, Future] = {}  # 正在加载的角色，同一角色只加载一次
+        self._lock = threading.Lock()
+
+    def list_personas(self) -> List[Dict[str, str]]:
+        """列出所有可选角色（不触发加载）
+
+        Returns:
+            List[Dict[str, str]]: 包含 id、name、description 的角色列表
+        """
+        return [
+            {
+                "id": persona_id,
+                "name": spec.get("name", persona_id),
+                "description": spec.get("description", ""),
+            }
+            for persona_id, spec in self.personas.items()
+        ]
+
+    def resolve(self, profile_name: Optional[str]) -> str:
+        """将 chat profile 名称（或角色ID）解析为角色ID，未知时返回默认角色"""
+        if profile_name:
+            if profile_name in self.personas:
+                return profile_name
+            for persona_id, spec in self.personas.items():
+                if spec.get("name") == profile_name:
+                    return persona_id
+        return self.default_persona
+
+    def acquire(self, persona_id: str) -> Persona:
+        """获取角色并增加引用计数，使用中的角色不会被淘汰
+
+        首次使用时需要读取配置并生成提示词（阻塞），在异步代码中应放到线程中调用。
+        加载在锁外进行，同一角色的并发请求等待同一次加载，不影响其他角色。
+
+        Args:
+            persona_id: 角色ID
+
+        Returns:
+            Persona: 已加载的角色
+        """
+        return self._load(persona_id, acquire=True)
+
+    def release(self, persona_id: str) -> None:
+        """释放对角色的引用，并在超出预算时淘汰空闲角色"""
+        with self._lock:
+            count = self._refcounts.get(persona_id, 0) - 1
+            if count > 0:
+                self._refcounts[persona_id] = count
+            else:
+                self._refcounts.pop(persona_id, None)
+            self._evict_locked()
+
+    def get(self, persona_id: str) -> Persona:
+        """获取角色（不增加引用计数）"""
+        return self._load(persona_id, acquire=False)
+
+    def _load(self, persona_id: str, acquire: bool) -> Persona:
+        while True:
+            with self._lock:
+                persona = self._loaded.get(persona_id)
+                if persona is not None:
+                    self._loaded.move_to_end(persona_id)
+                    if acquire:
+                        self._refcounts[persona_id] = self._refcounts.get(persona_id, 0) + 1
+                    return persona
+                future = self._loading.get(persona_id)
+                owner = future is None
+                if owner:
+                    spec = self.personas.get(persona_id)
+                    if spec is None:
+                        raise KeyError(f"未知角色: {persona_id}")
+                    future = Future()
+                    self._loading[persona_id] = future
+
+            if not owner:
+                # 等待其他线程的加载完成后重新检查（加载完成后可能已被淘汰）
+                future.result()
+                continue
+
+            try:
+                persona = self._create(persona_id, spec)
+                persona.load()
+            except BaseException as e:
+                with self._lock:
+                    self._loading.pop(persona_id, None)
+                future.set_exception(e)
+                raise
+            with self._lock:
+                self._loading.pop(persona_id, None)
+                self._loaded[persona_id] = persona
+                if acquire:
+                    self._refcounts[persona_id] = self._refcounts.get(persona_id, 0) + 1
+                self._evict_locked()
+            future.set_result(persona)
+            return persona
+
+    def _create(self, persona_id: str, spec: Dict[str, Any]) -> Persona:
+        return Persona(
+            persona_id=persona_id,
+            name=spec.get("name", persona_id),
+            description=spec.get("description", ""),
+            config_path=spec["config_path"],
+            collection_name=spec["collection_name"],
+            tts_ref_wav_path=spec["tts_ref_wav_path"],
+            tts_ref_text=spec["tts_ref_text"],
+            avatar_path=spec.get("avatar_path", ""),
+            chat_memory_dir=self.chat_memory_dir,
+            response_cache=spec.get("response_cache", True),
+            hnsw=self.hnsw,
+            embedding_provider=self.embedding_provider,
+            dedup_similarity=self.dedup_similarity,
+            cache_limit_mb=self.cache_limit_mb,
+            memory_client=self.memory_client,
+        )
+
+    def _evict_locked(self) -> None:
+        """按 LRU 顺序淘汰未被引用的角色，直到不超过数量上限"""
+        # 最近访问的角色在末尾，始终保留，避免刚加载就被淘汰
+        for persona_id in list(self._loaded.keys())[:-1]:
+            if len(self._loaded) <= self.max_loaded:
+                break
+            if self._refcounts.get(persona_id, 0) > 0:
+                continue
+            # 只淘汰没有会话引用的角色，释放其提示词和头像，再次使用时重新加载
+            self._loaded.pop(persona_id).unload()
+            logger.info("已淘汰角色 %s", persona_id)
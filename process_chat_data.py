@@ -1,6 +1,7 @@
 import os
 import logging
 from prompts import ChatProcessor, ConfigGenerator
+from config import OLLAMA_MODEL_NAME, OLLAMA_BASE_URLS
 
 # 禁用所有代理
 os.environ['NO_PROXY'] = '*'
@@ -10,10 +11,6 @@ logging.basicConfig(level=logging.INFO,
                    format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Ollama配置
-OLLAMA_MODEL_NAME = "qwen3:14b"
-OLLAMA_BASE_URL = "http://localhost:11434"
-
 def main():
     try:
         logger.info("开始处理...")
@@ -22,7 +19,7 @@ def main():
         chat_processor = ChatProcessor("train_data/wechat")
         config_generator = ConfigGenerator(
             model_name=OLLAMA_MODEL_NAME,
-            base_url=OLLAMA_BASE_URL
+            base_url=OLLAMA_BASE_URLS
         )
         
         # 读取并清洗聊天记录
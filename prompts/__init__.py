@@ -1,11 +1,20 @@
-from prompts.data_cleaner import DataCleaner
-from prompts.chat_processor import ChatProcessor
-from prompts.prompt_generator import generate_prompt
-from prompts.config_generator import ConfigGenerator
-
-__all__ = [
-    'DataCleaner',
-    'ChatProcessor',
-    'ConfigGenerator',
-    'generate_prompt'
-] 
\ No newline at end of file
+import importlib
+
+# 按需导入子模块：ConfigGenerator 依赖 langchain，只在生成配置时才加载
+_EXPORTS = {
+    'DataCleaner': '.data_cleaner',
+    'ChatProcessor': '.chat_processor',
+    'ConfigGenerator': '.config_generator',
+    'generate_prompt': '.prompt_generator',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
@@ -1,21 +1,39 @@
 import json
 import logging
 import re
-from typing import Dict, Any, List, Tuple
-from langchain_community.llms import Ollama
+from typing import Dict, Any, List, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
 class ConfigGenerator:
     """配置生成器类，负责生成和保存用户配置"""
     
-    def __init__(self, model_name: str = "qwen3:14b", base_url: str = "http://localhost:11434"):
+    def __init__(self,
+                 model_name: str = "qwen3:14b",
+                 base_url: Union[str, List[str]] = "http://localhost:11434"):
+        """
+        Args:
+            model_name: 模型名称
+            base_url: Ollama 服务地址，可以是多个节点，前面的节点不可用时依次尝试后面的节点
+        """
         self.template_path = "prompts/template.json"
         self.output_path = "prompts/user_config.json"
-        self.llm = Ollama(
-            model=model_name,
-            base_url=base_url,
-        )
+        from langchain_community.llms import Ollama  # 延迟导入，只在生成配置时需要
+
+        base_urls = [base_url] if isinstance(base_url, str) else list(base_url)
+        self.llms = [Ollama(model=model_name, base_url=url) for url in base_urls]
+        self.llm = self.llms[0]
+
+    def _invoke(self, prompt: str) -> str:
+        """依次尝试各个节点，返回第一个成功的结果"""
+        last_error = None
+        for llm in self.llms:
+            try:
+                return llm.invoke(prompt)
+            except Exception as e:
+                last_error = e
+                logger.warning("Ollama 节点 %s 调用失败: %s", llm.base_url, str(e))
+        raise last_error
         
     @staticmethod
     def _clean_llm_response(response: str) -> str:
@@ -124,7 +142,7 @@ class ConfigGenerator:
         
         try:
             logger.info("开始生成配置...")
-            response = self.llm.invoke(prompt)
+            response = self._invoke(prompt)
             logger.debug("模型原始响应: %s", response)
             
             # 清理响应内容
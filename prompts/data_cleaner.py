@@ -15,6 +15,18 @@ class DataCleaner:
             'IP地址': r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}',
             '金额': r'(?:¥|\$)?\d+(?:\.\d{2})?(?:元|万元|块钱)?'
         }
+        # 脱敏替换时使用的模式，按顺序替换：先替换较长、较具体的内容，避免被数字类模式截断；
+        # 金额只替换带货币符号或单位的数字，聊天中单独出现的数字太常见，全部替换会破坏语义
+        self.redact_patterns = [(name, re.compile(pattern)) for name, pattern in [
+            ('邮箱', self.patterns['邮箱']),
+            ('IP地址', self.patterns['IP地址']),
+            ('身份证', r'(?<!\d)\d{17}[\dXx](?!\d)'),
+            ('银行卡', r'(?<!\d)\d{16,19}(?!\d)'),
+            ('身份证', r'(?<!\d)\d{15}(?!\d)'),
+            ('手机号', r'(?<!\d)1[3-9]\d{9}(?!\d)'),
+            ('地址', self.patterns['地址']),
+            ('金额', r'(?:¥|\$)\d+(?:\.\d{2})?(?:元|万元|块钱)?|\d+(?:\.\d{2})?(?:元|万元|块钱)'),
+        ]]
         
     def contains_sensitive_info(self, text: str) -> bool:
         """检查文本是否包含敏感信息
@@ -45,4 +57,19 @@ class DataCleaner:
         return [
             msg for msg in messages 
             if not self.contains_sensitive_info(msg.get('content', ''))
-        ] 
\ No newline at end of file
+        ]
+
+    def redact(self, text: str) -> str:
+        """把敏感信息替换为类别占位符（例如 "[手机号]"），保留其余内容
+
+        Args:
+            text: 待脱敏的文本
+
+        Returns:
+            str: 脱敏后的文本
+        """
+        if not text:
+            return text
+        for name, pattern in self.redact_patterns:
+            text = pattern.sub(f'[{name}]', text)
+        return text
@@ -1,10 +1,28 @@
 # 修改提示模板，加入个性化设定
 prompt_template_str = """{personality_config}
 
+已知的用户信息：
+{facts}
+
 历史对话：
 {history}
 
 用户问题：{input}
 
 请根据以上角色设定和对话历史来回答问题。回答时要自然流畅，不要提及或显式引用角色设定。
-回答："""
\ No newline at end of file
+回答："""
+
+# 从对话中提取用户事实的提示模板，输出 JSON 数组
+fact_extraction_template_str = """从下面这轮对话中提取关于用户本人及其身边的人、宠物、物品等的客观事实（例如姓名、职业、所在城市、生日、喜好、宠物名）。
+
+要求：
+1. 只提取用户自己明确说出的信息，不要提取助手说的内容，不要推测。
+2. 用户本人的实体名固定写 "用户"；其他实体使用其名字（例如宠物名、朋友的名字）。
+3. 属性名使用简短的中文名词（例如 "名字"、"职业"、"城市"、"宠物名"、"品种"）。
+4. 以 JSON 数组输出，每个元素为 {{"entity": "...", "attribute": "...", "value": "..."}}；没有可提取的事实时输出 []。
+5. 只输出 JSON，不要输出其他内容。
+
+用户：{input}
+助手：{reply}
+
+JSON："""
@@ -0,0 +1,20 @@
+import importlib
+
+# 按需导入子模块：语音识别依赖 whisper/torch，端点检测依赖 numpy
+_EXPORTS = {
+    'text_to_speech': '.tts',
+    'atext_to_speech': '.tts',
+    'EnergyVAD': '.vad',
+    'WhisperTranscriber': '.asr',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
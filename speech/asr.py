@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+WHISPER_SAMPLE_RATE = 16000
+
+# 工作进程内的 Whisper 模型，每个进程只加载一次
+_worker_model = None
+
+
+def _init_worker(model_name: str, device: str, num_threads: int) -> None:
+    global _worker_model
+    import torch
+    import whisper
+
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    _worker_model = whisper.load_model(model_name, device=device)
+
+
+def _warmup_worker() -> bool:
+    return _worker_model is not None
+
+
+def _transcribe_in_worker(pcm: bytes,
+                          sample_rate: int,
+                          language: Optional[str],
+                          initial_prompt: Optional[str]) -> str:
+    import numpy as np
+
+    audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+    if sample_rate != WHISPER_SAMPLE_RATE and audio.size:
+        # 线性插值重采样到 Whisper 需要的 16kHz
+        n_out = int(audio.size * WHISPER_SAMPLE_RATE / sample_rate)
+        positions = np.arange(n_out, dtype=np.float64) * (sample_rate / WHISPER_SAMPLE_RATE)
+        audio = np.interp(positions, np.arange(audio.size), audio).astype(np.float32)
+
+    result = _worker_model.transcribe(
+        audio,
+        language=language,
+        initial_prompt=initial_prompt,
+        temperature=0.0,
+        condition_on_previous_text=False,
+        without_timestamps=True,
+        fp16=False,
+    )
+    return result.get("text", "").strip()
+
+
+class WhisperTranscriber:
+    """本地 Whisper 语音识别
+
+    识别在独立的工作进程池中进行，每个工作进程在启动时加载一次模型，
+    不阻塞事件循环，也避免多个识别任务共用同一个模型实例。
+    """
+
+    def __init__(self,
+                 model_name: str = "base",
+                 language: Optional[str] = "zh",
+                 workers: int = 1,
+                 device: str = "cpu",
+                 threads_per_worker: int = 0,
+                 initial_prompt: Optional[str] = "以下是普通话的句子。"):
+        """初始化语音识别
+
+        Args:
+            model_name: Whisper 模型名称（tiny/base/small/...）
+            language: 识别语言，为空时自动检测
+            workers: 工作进程数
+            device: 推理设备
+            threads_per_worker: 每个工作进程的 torch 线程数，0 表示使用默认值
+            initial_prompt: 初始提示词（引导输出简体中文和标点）
+        """
+        self.model_name = model_name
+        self.language = language
+        self.workers = workers
+        self.device = device
+        self.threads_per_worker = threads_per_worker
+        self.initial_prompt = initial_prompt
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        initializer=_init_worker,
+                        initargs=(self.model_name, self.device, self.threads_per_worker),
+                    )
+        return self._executor
+
+    def warmup(self) -> None:
+        """提前启动工作进程并加载模型（不等待完成），用户开始说话时调用可隐藏模型加载时间"""
+        if self._executor is not None:
+            return
+        executor = self._get_executor()
+        for _ in range(self.workers):
+            future: Future = executor.submit(_warmup_worker)
+            future.add_done_callback(self._log_warmup_error)
+
+    @staticmethod
+    def _log_warmup_error(future: Future) -> None:
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error("Whisper 工作进程启动失败: %s", str(error))
+
+    async def transcribe(self, pcm: bytes, sample_rate: int) -> str:
+        """识别一段 16 位 PCM 音频
+
+        Args:
+            pcm: 16 位小端 PCM 音频
+            sample_rate: 音频采样率
+
+        Returns:
+            str: 识别出的文本
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(),
+            _transcribe_in_worker,
+            pcm,
+            sample_rate,
+            self.language,
+            self.initial_prompt,
+        )
+
+    def shutdown(self) -> None:
+        """关闭工作进程池"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import wave
+from typing import Dict
+from urllib.parse import parse_qs, urlparse
+
+_clients: Dict[str, object] = {}
+_clients_lock = threading.Lock()
+
+# "stub://?latency_ms=800&ms_per_char=20" 形式的地址使用本地模拟的 TTS，只等待相应时间并返回一段静音，
+# 用于压测时替代真实的 TTS 服务
+STUB_SCHEME = "stub://"
+_stub_wav_path = os.path.join(tempfile.gettempdir(), "cyberclone_tts_stub.wav")
+
+
+def _stub_delay(text: str, base_url: str) -> float:
+    """模拟 TTS 的耗时（秒）：固定延迟 + 每个字符的合成时间"""
+    params = parse_qs(urlparse(base_url).query)
+    latency_ms = float(params.get("latency_ms", ["500"])[0])
+    ms_per_char = float(params.get("ms_per_char", ["0"])[0])
+    return (latency_ms + ms_per_char * len(text)) / 1000
+
+
+def _stub_audio() -> str:
+    if not os.path.exists(_stub_wav_path):
+        with wave.open(_stub_wav_path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(16000)
+            f.writeframes(b"\0\0" * 16000)
+    return _stub_wav_path
+
+
+def get_tts_client(base_url: str):
+    """获取（并缓存）TTS 服务的 gradio 客户端
+
+    gradio_client 的导入和 Client 的创建（需要拉取服务端接口信息）都比较耗时，
+    每个服务地址只创建一次，之后复用。
+    """
+    client = _clients.get(base_url)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(base_url)
+            if client is None:
+                os.environ["HF_HUB_DISABLE_TELEMETRY"] = "1"
+                from gradio_client import Client
+
+                client = Client(base_url)
+                _clients[base_url] = client
+    return client
+
+
+def _tts_arguments(text: str, ref_wav_path: str, ref_text: str) -> Dict[str, object]:
+    from gradio_client import file
+
+    # 确保参考音频文件存在
+    if not os.path.exists(ref_wav_path):
+        raise FileNotFoundError(f"参考音频文件不存在: {ref_wav_path}")
+
+    return dict(
+        ref_wav_path=file(ref_wav_path),
+        prompt_text=ref_text,
+        prompt_language="中文",
+        text=text,
+        text_language="中文",
+        how_to_cut="凑四句一切",
+        top_k=15,
+        top_p=1,
+        temperature=1,
+        ref_free=False,
+        speed=1,
+        if_freeze=False,
+        inp_refs=None,
+        sample_steps=8,
+        if_sr=False,
+        pause_second=0.3,
+        api_name="/get_tts_wav"
+    )
+
+
+def text_to_speech(text: str,
+                   ref_wav_path: str,
+                   ref_text: str,
+                   base_url: str = "http://localhost:9872/") -> str:
+    """将文本转换为语音
+
+    Args:
+        text: 要转换的文本
+        ref_wav_path: 参考音频路径，不同角色使用各自的音色
+        ref_text: 参考音频对应的文本
+        base_url: TTS 服务地址
+
+    Returns:
+        str: 生成的音频文件路径
+    """
+    if base_url.startswith(STUB_SCHEME):
+        time.sleep(_stub_delay(text, base_url))
+        return _stub_audio()
+
+    try:
+        client = get_tts_client(base_url)
+        print(f"DEBUG: 开始TTS转换，文本长度: {len(text)}")
+        print(f"DEBUG: 参考音频文件: {ref_wav_path}")
+        
+        result = client.predict(**_tts_arguments(text, ref_wav_path, ref_text))
+        
+        print(f"DEBUG: TTS转换完成，结果: {result}")
+        return result
+        
+    except Exception as e:
+        print(f"ERROR: TTS转换失败 - {str(e)}")
+        raise
+
+
+async def atext_to_speech(text: str,
+                          ref_wav_path: str,
+                          ref_text: str,
+                          base_url: str = "http://localhost:9872/") -> str:
+    """异步将文本转换为语音，可以被取消
+
+    任务提交到 TTS 服务的队列后在线程中等待结果，不阻塞事件循环。
+    调用方取消时会同时取消 TTS 服务中尚未开始的任务。
+
+    Args:
+        text: 要转换的文本
+        ref_wav_path: 参考音频路径
+        ref_text: 参考音频对应的文本
+        base_url: TTS 服务地址
+
+    Returns:
+        str: 生成的音频文件路径
+    """
+    if base_url.startswith(STUB_SCHEME):
+        await asyncio.sleep(_stub_delay(text, base_url))
+        return _stub_audio()
+
+    client = await asyncio.to_thread(get_tts_client, base_url)
+    print(f"DEBUG: 开始TTS转换，文本长度: {len(text)}")
+    job = client.submit(**_tts_arguments(text, ref_wav_path, ref_text))
+    try:
+        result = await asyncio.to_thread(job.result)
+    except asyncio.CancelledError:
+        job.cancel()
+        print("DEBUG: TTS任务已取消")
+        raise
+    except Exception as e:
+        print(f"ERROR: TTS转换失败 - {str(e)}")
+        raise
+    print(f"DEBUG: TTS转换完成，结果: {result}")
+    return result
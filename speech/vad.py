@@ -0,0 +1,127 @@
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+
+class EnergyVAD:
+    """基于能量（RMS）的语音端点检测
+
+    逐块输入 16 位 PCM 音频，检测到说话后持续缓存，静音持续超过 silence_ms 时
+    认为一句话结束并返回整句音频。音频只追加到 bytearray 中，不会在每个音频块到来时复制整段数据。
+    """
+
+    __slots__ = (
+        "sample_rate", "energy_threshold", "silence_ms", "min_speech_ms", "max_utterance_ms",
+        "noise_ratio", "_noise_floor", "_buffer", "_preroll", "_preroll_ms", "_preroll_limit_ms",
+        "_is_speaking", "_speech_ms", "_silence_run_ms",
+    )
+
+    def __init__(self,
+                 sample_rate: int = 24000,
+                 energy_threshold: float = 3500,
+                 silence_ms: int = 600,
+                 min_speech_ms: int = 200,
+                 max_utterance_s: float = 30,
+                 preroll_ms: int = 300,
+                 noise_ratio: float = 3.0):
+        """初始化端点检测
+
+        Args:
+            sample_rate: 采样率
+            energy_threshold: 判定为说话的最低 RMS 能量
+            silence_ms: 说话后静音持续多久判定为一句话结束
+            min_speech_ms: 有效语音的最短时长，更短的视为噪声丢弃
+            max_utterance_s: 单句最长时长，超过后强制切分
+            preroll_ms: 保留说话开始前的音频时长，避免吞掉首字
+            noise_ratio: 能量需高于背景噪声的倍数才判定为说话
+        """
+        self.sample_rate = sample_rate
+        self.energy_threshold = energy_threshold
+        self.silence_ms = silence_ms
+        self.min_speech_ms = min_speech_ms
+        self.max_utterance_ms = max_utterance_s * 1000
+        self.noise_ratio = noise_ratio
+
+        self._noise_floor = 0.0
+        self._buffer = bytearray()
+        self._preroll: "deque[bytes]" = deque()
+        self._preroll_ms = 0.0
+        self._preroll_limit_ms = preroll_ms
+        self._is_speaking = False
+        self._speech_ms = 0.0
+        self._silence_run_ms = 0.0
+
+    @property
+    def is_speaking(self) -> bool:
+        """当前是否处于说话状态"""
+        return self._is_speaking
+
+    def _duration_ms(self, chunk: bytes) -> float:
+        return len(chunk) / 2 * 1000 / self.sample_rate
+
+    @staticmethod
+    def _rms(chunk: bytes) -> float:
+        samples = np.frombuffer(chunk, dtype=np.int16, count=len(chunk) // 2)
+        if samples.size == 0:
+            return 0.0
+        return float(np.sqrt(np.mean(samples.astype(np.float32) ** 2)))
+
+    def feed(self, chunk: bytes) -> Optional[bytes]:
+        """输入一个音频块
+
+        Args:
+            chunk: 16 位小端 PCM 音频数据
+
+        Returns:
+            Optional[bytes]: 检测到一句话结束时返回整句音频，否则返回 None
+        """
+        duration = self._duration_ms(chunk)
+        energy = self._rms(chunk)
+        threshold = max(self.energy_threshold, self._noise_floor * self.noise_ratio)
+        voiced = energy >= threshold
+
+        if not self._is_speaking:
+            if not voiced:
+                # 静音时缓慢跟踪背景噪声，并保留一小段前置音频
+                self._noise_floor = 0.95 * self._noise_floor + 0.05 * energy
+                self._preroll.append(chunk)
+                self._preroll_ms += duration
+                while self._preroll and self._preroll_ms > self._preroll_limit_ms:
+                    self._preroll_ms -= self._duration_ms(self._preroll.popleft())
+                return None
+            self._is_speaking = True
+            for pre in self._preroll:
+                self._buffer += pre
+            self._preroll.clear()
+            self._preroll_ms = 0.0
+
+        self._buffer += chunk
+        self._speech_ms += duration
+        self._silence_run_ms = 0.0 if voiced else self._silence_run_ms + duration
+
+        if self._silence_run_ms >= self.silence_ms or self._speech_ms >= self.max_utterance_ms:
+            return self._finish()
+        return None
+
+    def flush(self) -> Optional[bytes]:
+        """输入结束时返回尚未结束的语音"""
+        if not self._is_speaking:
+            self.reset()
+            return None
+        return self._finish()
+
+    def _finish(self) -> Optional[bytes]:
+        voiced_ms = self._speech_ms - self._silence_run_ms
+        utterance = bytes(self._buffer) if voiced_ms >= self.min_speech_ms else None
+        self.reset()
+        return utterance
+
+    def reset(self) -> None:
+        """清空状态（保留背景噪声估计）"""
+        self._buffer = bytearray()
+        self._preroll.clear()
+        self._preroll_ms = 0.0
+        self._is_speaking = False
+        self._speech_ms = 0.0
+        self._silence_run_ms = 0.0